@@ -0,0 +1,123 @@
+# -*- coding: utf-8-*-
+"""This script measures building of vertex data by :py:mod:`geometry` (no OpenGL needed): the outer grid, all slices of static blocks, the current block and its y-shadow, for each domain size of :py:data:`logic.difficulty2dim` and some bigger ones, with boards filled to several levels at random. It prints the times together with the numbers of vertices and bytes made, and compares them with a baseline saved before (a file with the **repr** of a dict), e.g.::
+
+    python2 bench_geometry.py --save
+    python2 bench_geometry.py --tolerance 0.2
+
+Minimum times are compared, as they're the least disturbed by other processes. The exit status is 1 if some time is over the baseline by more than the tolerance (and the slack), or some geometry changed size."""
+
+import sys, timeit, argparse
+import numpy
+import logic, geometry
+
+#: domain sizes measured besides :py:data:`logic.difficulty2dim`
+scaled_dims = ((10, 20, 10, 4), (16, 32, 16, 6))
+#: fractions of board cells filled
+fills = (0.25, 0.5, 0.9)
+#: colors used for the blocks, the same number as in the game
+colors = [[1,0,0],[0,1,0],[1,1,0],[0,0,1],[1,0,1],[0,1,1]]
+w_spacing = 2 #: space between w-slices, see :py:data:`game.w_spacing`
+
+def random_board(dim, fill, seed=0):
+    """Return a board view (see :py:meth:`logic.logic.BoardView`) of the domain *dim* (tuple of width, height, depth, w_depth) with the fraction *fill* of cells filled with random colors."""
+    width, height, depth, w_depth = dim
+    rnd = numpy.random.RandomState(seed)
+    shape = (height, w_depth, depth, width)
+    board = rnd.randint(1, len(colors)+1, size=shape).astype(numpy.uint8)
+    board[rnd.random_sample(shape) >= fill] = 0
+    return board
+
+def measure(func, repeat):
+    """Call *func* (function taking no arguments) *repeat* times, return a tuple *(median time (msec), minimum time (msec), last result)*."""
+    times = []
+    for i in xrange(repeat):
+        t = timeit.default_timer()
+        out = func()
+        times.append((timeit.default_timer()-t)*1000.0)
+    times.sort()
+    return times[len(times)/2], times[0], out
+
+def size_of(out):
+    """Return a tuple *(vertices, bytes)* for the result *out* of a geometry function (an array or a list of arrays, the first holding the vertices)."""
+    if isinstance(out, list):
+        return len(out[0]), sum([i.nbytes for i in out])
+    return len(out), out.nbytes
+
+def cases():
+    """Return the list of measured cases, tuples *(name, domain size, fill)*."""
+    out = []
+    for n, dim in enumerate(logic.difficulty2dim):
+        out.extend([("difficulty %d" % n, dim, f) for f in fills])
+    for dim in scaled_dims:
+        out.extend([("%dx%dx%dx%d" % dim, dim, f) for f in fills])
+    return out
+
+def run_case(dim, fill, w_step, repeat):
+    """Measure the geometry functions for the domain *dim* with the board filled to *fill*; *w_step* means the same as in :py:func:`geometry.cells_vertices`. Returns a list of tuples *(function name, median time, minimum time, vertices, bytes)*."""
+    width, height, depth, w_depth = dim
+    board = random_board(dim, fill)
+    log = logic.logic(width, height, depth, w_depth, num_colors=len(colors))
+    log.MarkChanged()
+    tests = [
+        ("outer grid", lambda: geometry.outer_grid(width, height, depth, w_depth, w_spacing)),
+        ("board slices", lambda: [geometry.board_slice_vertices(board, w, colors, w_step) for w in xrange(w_depth)]),
+        ("current block", lambda: geometry.view_vertices(log.CurrentBlockView(), colors, log.cur_block_offset, w_step)),
+        ("shadow", lambda: geometry.shadow_vertices(log.cur_block, colors, w_step)),
+    ]
+    out = []
+    for name, func in tests:
+        median, best, result = measure(func, repeat)
+        if name == "board slices":
+            verts, nbytes = sum([len(i) for i in result]), sum([i.nbytes for i in result])
+        else:
+            verts, nbytes = size_of(result)
+        out.append((name, median, best, verts, nbytes))
+    return out
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Measure 4D Blocks geometry building.")
+    p.add_argument("--repeat", type=int, default=20, help="number of calls of each function per case")
+    p.add_argument("--baked-w", action="store_true", help="add the slice offsets to x, as without shaders")
+    p.add_argument("--baseline", default="bench_geometry_baseline.txt", help="baseline file")
+    p.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (fraction)")
+    p.add_argument("--slack", type=float, default=0.05, help="allowed slowdown against the baseline (msec), added to the tolerance")
+    args = p.parse_args(argv)
+    baseline = None
+    if not args.save:
+        try:
+            baseline = eval(open(args.baseline).read())
+        except IOError:
+            print "No baseline in %s, run with --save to make one." % args.baseline
+    results = {}
+    failed = 0
+    print "%-14s %5s %-14s %10s %10s %9s %10s %8s" % ("case", "fill", "function", "median", "min", "vertices", "bytes", "baseline")
+    for name, dim, fill in cases():
+        w_step = dim[0]+w_spacing if args.baked_w else 0
+        for func, median, best, verts, nbytes in run_case(dim, fill, w_step, args.repeat):
+            key = "%s/%.2f/%s" % (name, fill, func)
+            results[key] = (best, verts, nbytes)
+            cmp = ""
+            if baseline is not None and key in baseline:
+                b = baseline[key]
+                cmp = "%+7.1f%%" % ((best/b[0]-1.0)*100.0) if b[0] > 0 else "-"
+                if b[1:] != (verts, nbytes):
+                    cmp += " size!"
+                    failed += 1
+                elif best > b[0]*(1.0+args.tolerance)+args.slack:
+                    cmp += " slow!"
+                    failed += 1
+            print "%-14s %5.2f %-14s %8.3fms %8.3fms %9d %10d %8s" % (name, fill, func, median, best, verts, nbytes, cmp)
+    if args.save:
+        f = open(args.baseline, "w")
+        f.write(repr(results)+"\n")
+        f.close()
+        print "Baseline saved to %s." % args.baseline
+    elif failed:
+        print "%d results worse than the baseline." % failed
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
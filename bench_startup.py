@@ -0,0 +1,84 @@
+# -*- coding: utf-8-*-
+"""This script measures the startup time of the game: importing modules, creating the OpenGL context, initializing the game (see :py:func:`game.init`) and drawing the first frame. Each run is made in a new process, so imports aren't cached. The *import game* phase includes OpenGL and numpy, which :py:mod:`game` imports at the top: they aren't deferred, :py:mod:`main` only imports the game once the window is open, so it shows up sooner. E.g.::
+
+    python2 bench_startup.py --runs 5
+    python2 bench_startup.py --window"""
+
+import os, sys, time, subprocess, argparse
+
+#: measured phases, in order
+phases = ("import pygame", "context", "import game", "init", "first frame", "total")
+
+def child(args):
+    """Start the game once and print the phase timings (sec) as a dict."""
+    t0 = time.time()
+    out = {}
+    if not args.window:
+        import headless
+        headless.use_platform(args.platform)
+        # no window, but the event queue has to work
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    pygame.init()
+    t = time.time()
+    out["import pygame"] = t-t0
+    w, h = 640, 480
+    if args.window:
+        pygame.display.set_mode((w, h), pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
+    else:
+        context = headless.contexts[args.platform](w, h)
+    out["context"] = time.time()-t
+    t = time.time()
+    import game, settings, input_rec
+    out["import game"] = time.time()-t
+    t = time.time()
+    conf = settings.Settings(dict(settings.default_settings))
+    source = input_rec.LiveSource()
+    if not args.window:
+        source.window_size = lambda: (w, h)
+        source.set_mode = lambda w, h: None
+        source.flip = lambda: None
+    game.init(conf, args.difficulty, source)
+    out["init"] = time.time()-t
+    t = time.time()
+    game.reshape(w, h)
+    game.display()
+    from OpenGL.GL import glFinish
+    glFinish()
+    out["first frame"] = time.time()-t
+    out["total"] = time.time()-t0
+    sys.stdout.write("RESULT %r\n" % out)
+    sys.stdout.flush()
+    os._exit(0)
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Measure 4D Blocks startup time.")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--difficulty", type=int, default=2)
+    p.add_argument("--window", action="store_true", help="open a window instead of using an offscreen context")
+    p.add_argument("--platform", default="egl", help="offscreen platform, see headless.py")
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    if args.child:
+        child(args)
+    results = []
+    cmd = [sys.executable, os.path.abspath(__file__), "--child"] + argv
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    for i in xrange(args.runs):
+        out = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=env).communicate()[0]
+        for line in out.splitlines():
+            if line.startswith("RESULT "):
+                results.append(eval(line[7:]))
+    if not results:
+        print "No successful runs."
+        return 1
+    print "%-14s %10s %10s %10s" % ("phase", "first", "median", "min")
+    for i in phases:
+        v = [r[i]*1000.0 for r in results]
+        s = sorted(v)
+        print "%-14s %8.1fms %8.1fms %8.1fms" % (i, v[0], s[len(s)/2], s[0])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
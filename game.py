@@ -2,12 +2,11 @@
 """This module contains the main function of the game."""
 
 import OpenGL, sys, random, numpy, time, pygame, key_num
-import logic, input_dev
+import logic, input_dev, input_rec, gl_pool, geometry
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from OpenGL.GL.ARB.vertex_buffer_object import *
 from ctypes import *
-import FTGL, settings
+import settings
 from menu import Menu, _menu, _menu_entry, bool2yn
 
 rotx                    =   0.0             #: rotation around x
@@ -15,15 +14,20 @@ roty                    =   0.0             #: rotation around y
 panx                    =   0.0             #: panning along x
 pany                    =   0.0             #: panning along x
 shy_vbo                 =   None            #: vbo for y-shadow
-sb_vbo                  =   None            #: vbo for static blocks
+sb_chunks               =   []              #: static blocks objects, one for each w-slice, lists [vbo, number of points]
+sb_built                =   (None, 0)       #: logic instance and its number of dropped blocks the static blocks objects were built for
+sb_workers              =   None            #: thread pool building static blocks chunks
+sb_threads              =   4               #: maximum number of threads building static blocks chunks
+sb_culled               =   0               #: number of static blocks chunks skipped by the last draw as outside of the view
 og_vbo                  =   None            #: vbo for outer grid
 boxes_vbo               =   None            #: vbo for boxes
 curr_b_vbo              =   None            #: vbo for current block
 next_b_vbo              =   None            #: vbo for next block
+next_b_center           =   (0.0, 0.0, 0.0, 0.0)    #: center of next block cells (x, y, z, w), moved to the origin when drawing
 boxes_nump              =   0               #: number of points in boxes vbo
 og_nump                 =   0               #: number of points in outer grid vbo
+og_walls                =   []              #: walls in outer grid vbo, tuples (first point, number of points, point on the wall, outward normal, w-slice)
 shy_nump                =   0               #: number of points in y-shadow vbo
-sb_nump                 =   0               #: number of points in static box vbo
 curr_b_nump             =   0               #: number of points in current block
 next_b_nump             =   0               #: number of points in next block
 null                    =   c_void_p(0)     #: null pointer
@@ -40,6 +44,9 @@ zoom                    =   -20             #: zoom
 log                     =   None            #: logic instance (:py:class:`logic.logic`)
 font                    =   None            #: font object for score
 menu_font               =   None            #: font object for menu
+font_cache              =   None            #: text cache for :py:data:`font` (:py:class:`text_cache.TextCache`)
+menu_font_cache         =   None            #: text cache for :py:data:`menu_font`
+hud_width_text          =   "Layers cleared: 1000"  #: text as wide as the widest line of score info
 win_width               =   640             #: window width
 win_height              =   480             #: window height
 fps_limit               =   60              #: fps limit
@@ -49,39 +56,90 @@ xmenu                   =   None            #: in-game menu instance
 conf                    =   None            #: settings instance
 running                 =   True            #: is game running
 turbo                   =   False           #: is turno mode active
+fall_dt                 =   2000            #: time between fall steps (msec)
+fall_acc                =   0               #: time accumulated towards the next fall step (msec)
+fall_last               =   0               #: time of the last fall scheduler update (msec)
+fall_free               =   False           #: can the current block fall one more step
+fall_free_key           =   None            #: state for which :py:data:`fall_free` was checked
+interp_fall             =   True            #: interpolate the drawn position of the falling block between fall steps
+interp_steps            =   40              #: number of frames drawn per fall step to interpolate it, at most one per frame of :py:data:`fps_limit`
+interp_last             =   0               #: time of the last frame drawn (msec)
 menu_mode               =   False           #: are we in menu
 bind_mode               =   False           #: are we binding 
 game_over_mode          =   False           #: are we showing the game over screen
 rot_next_b              =   0.0             #: rotation of next block
+next_b_spin             =   60.0            #: rotation speed of next block (degrees per second)
+next_b_anim_dt          =   33              #: time between next block animation frames (msec)
+next_b_anim_on          =   False           #: is the next block animation timer running
+next_b_anim_last        =   0               #: time of the last next block animation frame (msec)
+redraw                  =   True            #: does the screen need redrawing
+evsrc                   =   input_rec.LiveSource()  #: source of events and time for the main loop (see :py:mod:`input_rec`)
+repeat_sched            =   None            #: auto-repeat scheduler of held functions (instance of :py:class:`input_dev.RepeatScheduler`)
 sh_stipple              =   (c_uint*32)()   #: polygon stipple pattern for shadows
+use_edge_shader         =   True            #: draw block faces and outlines in a single pass if shaders are available
+edge_prog               =   None            #: shader program for single-pass fill and outline
+edge_locs               =   {}              #: locations of uniforms in edge_prog, name -> location
+slice_step              =   None            #: 3D translation between neighbouring w-slices, None means along x by width+w_spacing
+w_view                  =   None            #: 4D view rotation (4x4 array) applied around the center of the domain, None means identity
+w_persp                 =   0.0             #: strength of perspective along w: a slice further by *dw* is scaled by 1/(1+w_persp*dw)
+pool                    =   gl_pool.ResourcePool()  #: OpenGL buffers, shader programs and fonts, kept between games
+stream_mode             =   None            #: upload mode of often changing geometry (shadow), see :py:class:`gl_pool.StreamBuffer`; None picks the best supported
+curr_b_off              =   0               #: byte offset of the current block mesh in curr_b_vbo
+curr_b_slots            =   64              #: number of current block meshes (block shape and orientation, color) kept in curr_b_vbo
+curr_b_meshes           =   {}              #: current block meshes in curr_b_vbo, cells relative to the block offset -> slot
+curr_b_order            =   []              #: keys of curr_b_meshes, least recently used first
+curr_b_stats            =   [0, 0]          #: numbers of current block meshes built and reused
+shy_stream              =   None            #: stream buffer for y-shadow
+shy_off                 =   0               #: byte offset of y-shadow data in shy_stream
+hint_worker             =   None            #: worker process searching placement hints (instance of :py:class:`hint.HintWorker`), None if hints are off
+hint_vbo                =   None            #: vbo for the placement hint
+hint_nump               =   0               #: number of points in hint vbo, 0 if there's no hint to show
+hint_poll_dt            =   20              #: time between checks for the result of the hint search (msec)
+spectator               =   None            #: server streaming the game to spectators (instance of :py:class:`spectator.SpectatorServer`), None if there's none
+spectator_poll_dt       =   20              #: time between services of the spectator server when the game is idle (msec)
+print_stats             =   False           #: print statistics (input, GL resources, current block meshes) when the game is unloaded
+keep_resources          =   True            #: keep the resources in :py:data:`pool` when the game is unloaded, so the next one starts faster
 
-#: data for one cube (24 points, values mean, in order: x, y, z, r, g, b, a, padding
-cube_xyzrgba_data       = numpy.array([[ 0.,  0.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  1.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  1.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  0.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  1.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  0.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  1.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  0.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  0.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  0.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  1.,  0.,  0.,  0.,  0.,  0.,  0.],
-       [ 1.,  1.,  1.,  0.,  0.,  0.,  0.,  0.],
-       [ 0.,  1.,  1.,  0.,  0.,  0.,  0.,  0.]], dtype=numpy.float32)                # data for single cube
+vertex_dtype            =   geometry.vertex_dtype #: layout of a vertex of block geometry, see :py:mod:`geometry`; without shaders x has the slice offset added on the CPU
 
 colors                  =   [[1,0,0],[0,1,0],[1,1,0],[0,0,1],[1,0,1],[0,1,1]] #: colors for blocks: red green yellow blue magenta cyan
+shadow_eps              =   1e-3            #: height of y-shadow above the floor or the blocks it's cast on
+#: vertex shader for single-pass fill and outline, maps 4D cell coordinates to 3D (see :py:func:`project4`, which does the same on the CPU) and the corner index to coordinates within the face
+edge_vert_src = """
+#version 120
+uniform vec3 slice_step;
+uniform mat4 view4;
+uniform vec4 center4;
+uniform float w_persp;
+uniform vec4 offset4;
+varying vec2 uv;
+void main()
+{
+    float c = mod(gl_Vertex.w, 4.0);
+    vec4 p = vec4(gl_Vertex.xyz, floor(gl_Vertex.w*0.25))+offset4;
+    p = view4*(p-center4)+center4;
+    vec3 q = (p.xyz-center4.xyz)/(1.0+w_persp*(p.w-center4.w))+center4.xyz+p.w*slice_step;
+    uv = vec2(step(1.5, c), step(0.5, c)*step(c, 2.5));
+    gl_FrontColor = gl_Color;
+    gl_Position = gl_ModelViewProjectionMatrix*vec4(q, 1.0);
+}
+"""
+#: fragment shader for single-pass fill and outline, paints fragments closer than half of *line_width* pixels to the face's edge white (none if it's negative)
+edge_frag_src = """
+#version 120
+uniform float line_width;
+varying vec2 uv;
+void main()
+{
+    if (line_width < 0.0) {
+        gl_FragColor = gl_Color;
+        return;
+    }
+    vec2 d = min(uv, 1.0-uv)/fwidth(uv);
+    float fill = clamp(min(d.x, d.y)-0.5*line_width+0.5, 0.0, 1.0);
+    gl_FragColor = mix(vec4(1.0), gl_Color, fill);
+}
+"""
 #: maping of GL standard function names to ARB extension ones
 gl_func_map_            =   [
     ["glBindBuffer", "glBindBufferARB"],
@@ -99,31 +157,28 @@ func2rot = [
                 (logic.YW, logic.CW), (logic.YW, logic.CCW),
                 (logic.ZW, logic.CW), (logic.ZW, logic.CCW)
 ]
-#: mapping of difficulty level to domain size
-difficulty2dim = (
-                    (4,14,4,2),
-                    (5,10,5,2),
-                    (5,10,5,3)
-)
-
 def reset_settings():
     """Reset some global variables each this is loaded."""
     global rotx, roty, panx, pany, mouserot, mousepan, xmenu, running
-    global shy_vbo, sb_vbo, og_vbo, boxes_vbo, cur_b_vbo, next_b_vbo
-    global shy_nump, sb_nump, og_nump, boxes_nump, cur_b_nump, next_b_nump
+    global shy_vbo, sb_chunks, sb_built, og_vbo, boxes_vbo, cur_b_vbo, next_b_vbo
+    global shy_nump, og_nump, boxes_nump, cur_b_nump, next_b_nump
     global mouse_last_x, mouse_last_y, zoom, log, menu_font, fps, clock, turbo
-    global menu_mode, bind_mode, game_over_mode, rot_next_b
+    global fall_acc, fall_last, fall_free_key, interp_last
+    global menu_mode, bind_mode, game_over_mode, rot_next_b, next_b_anim_on, redraw, repeat_sched
     rotx, roty, panx, pany = 0.0, 0.0, 0.0, 0.0
-    shy_vbo, sb_vbo, og_vbo = None, None, None
+    shy_vbo, og_vbo = None, None
+    sb_chunks, sb_built = [], (None, 0)
     boxes_vbo, cur_b_vbo, next_b_vbo = None, None, None
-    shy_nump, sb_nump, og_nump = 0, 0, 0
+    shy_nump, og_nump = 0, 0
     boxes_nump, cur_b_nump, next_b_nump = 0, 0, 0
     mouserot, mousepan, mouse_last_x, mouse_last_y = False, False, 0, 0
     zoom, log, font, menu_font, fps = -20, None, None, None, 0
     clock = pygame.time.Clock()
     xmenu, running, turbo = None, True, False
+    fall_acc, fall_last, fall_free_key, interp_last = 0, evsrc.get_ticks(), None, 0
     menu_mode, bind_mode, game_over_mode = False, False, False
-    rot_next_b = 0.0
+    rot_next_b, next_b_anim_on, redraw = 0.0, False, True
+    repeat_sched = input_dev.RepeatScheduler(norepeat=[key_num.KEY_MENU], clock=evsrc.get_ticks)
 
 def gen_stipple():
     """Generate stipple pattern for shadows."""
@@ -135,240 +190,504 @@ def gen_stipple():
 
 def gl_func_map():
     """Check if some OpenGL functions are present and if not assign their names to names of functions from ARB extension. This is probably needed on some hardware."""
-    global gl_func_map_
+    global gl_func_map_, stream_mode
     for i in gl_func_map_:
         if not bool(eval(i[0])):
             print "Warning: OpenGL function %s not present, using %s instead." % (i[0], i[1])
-            exec("global "+i[0]+"\nglobal "+i[1]+"\n"+i[0]+"="+i[1])
+            # an old context, don't try streaming uploads either
+            stream_mode = "static"
+            from OpenGL.GL.ARB import vertex_buffer_object
+            exec("global "+i[0]+"\n"+i[0]+"=vertex_buffer_object."+i[1])
+            setattr(gl_pool, i[0], getattr(vertex_buffer_object, i[1]))
 
 def init_shy():
     """Initialize y-shadow object."""
-    global null, width, depth, w_depth, shy_vbo
-    shy_vbo = glGenBuffers(1)
-    glBindBuffer(GL_ARRAY_BUFFER, shy_vbo)
-    glBufferData(GL_ARRAY_BUFFER, width*depth*w_depth*128, null, GL_STATIC_DRAW) 
+    global null, width, depth, w_depth, shy_vbo, shy_stream
+    shy_stream = pool.stream("shadow", width*depth*w_depth*4*vertex_dtype.itemsize, mode=stream_mode)
+    shy_vbo = shy_stream.vbo
     
 def update_shy():
     """Update y-shadow object."""
-    global shy_vbo, shy_nump, colors, width, w_spacing, log
-    coor = []
-    eps = 1e-3
-    for i in log.ShadowY():
-        col = [j*0.75 for j in colors[i.col]]
-        coor.append([i.x+i.w*(width+w_spacing),i.y+eps,i.z,col[0],col[1],col[2],1,0])
-        coor.append([i.x+i.w*(width+w_spacing),i.y+eps,i.z+1,col[0],col[1],col[2],1,0])
-        coor.append([i.x+i.w*(width+w_spacing)+1,i.y+eps,i.z+1,col[0],col[1],col[2],1,0])
-        coor.append([i.x+i.w*(width+w_spacing)+1,i.y+eps,i.z,col[0],col[1],col[2],1,0])
-    coords = numpy.array(coor, dtype=numpy.float32)
-    glBindBuffer(GL_ARRAY_BUFFER, shy_vbo)
+    global shy_vbo, shy_nump, shy_off, colors, log
+    coords = geometry.shadow_vertices(log.ShadowY(), colors, w_step())
     shy_nump = len(coords)
-    glBufferSubData(GL_ARRAY_BUFFER, 0, coords.nbytes, coords)
+    shy_off = shy_stream.upload(coords)
 
 def draw_shy():
     """Draw y-shadow object."""
-    global shy_vbo, shy_nump
+    global shy_vbo, shy_nump, shy_off
     glBindBuffer(GL_ARRAY_BUFFER, shy_vbo)
-    glVertexPointer(3, GL_FLOAT, 32, null)
-    glColorPointer(4, GL_FLOAT, 32, c_void_p(12))
-    glDrawArrays(GL_QUADS, 0, shy_nump)
+    set_block_pointers(shy_off)
+    if edge_prog:
+        glUseProgram(edge_prog)
+        set_projection()
+        glUniform1f(edge_locs["line_width"], -1.0)
+        glUniform4f(edge_locs["offset4"], 0, shadow_eps, 0, 0)
+        glDrawArrays(GL_QUADS, 0, shy_nump)
+        glUseProgram(0)
+    else:
+        glPushMatrix()
+        glTranslatef(0, shadow_eps, 0)
+        glDrawArrays(GL_QUADS, 0, shy_nump)
+        glPopMatrix()
     
 def delete_shy():
     """Destroy y-shadow object."""
-    glDeleteBuffers(1,  [shy_vbo])
+    pool.release_stream("shadow")
+
+def init_hint():
+    """Initialize placement hint object, and start or stop :py:data:`hint_worker` as set by the **show_hint** setting."""
+    global hint_vbo, hint_nump, hint_worker, log
+    maxp = max(map(len, log.blocks))
+    hint_vbo = pool.buffer("hint", maxp*24*vertex_dtype.itemsize)[0]
+    hint_nump = 0
+    delete_hint_worker()
+    if conf.get("show_hint"):
+        import hint
+        hint_worker = hint.HintWorker(width, height, depth, w_depth)
+
+def request_hint():
+    """Hide the placement hint and ask :py:data:`hint_worker` for one for the current block; the result is checked for on timer events (see :py:func:`poll_hint`)."""
+    global hint_nump
+    hint_nump = 0
+    if hint_worker is None or not log.cur_block:
+        return
+    hint_worker.request(log)
+    evsrc.set_timer(pygame.USEREVENT+4, hint_poll_dt)
+
+def poll_hint():
+    """Update placement hint object if the result of the last search is ready. Results of stale searches are never shown."""
+    global hint_nump
+    cells = hint_worker.poll() if hint_worker else None
+    if cells is False:
+        return
+    evsrc.set_timer(pygame.USEREVENT+4, 0)
+    if not cells:
+        return
+    c = numpy.array(cells)
+    coords = geometry.cells_vertices(c[:, 0], c[:, 1], c[:, 2], c[:, 3], [log.cur_col]*len(c), colors, w_step())
+    glBindBuffer(GL_ARRAY_BUFFER, hint_vbo)
+    glBufferSubData(GL_ARRAY_BUFFER, 0, coords.nbytes, coords)
+    hint_nump = len(coords)
+    request_redraw()
+
+def draw_hint():
+    """Draw placement hint object as outlines of cubes."""
+    if not hint_nump:
+        return
+    glBindBuffer(GL_ARRAY_BUFFER, hint_vbo)
+    set_block_pointers(0)
+    glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+    if edge_prog:
+        glUseProgram(edge_prog)
+        set_projection()
+        glUniform1f(edge_locs["line_width"], -1.0)
+        glDrawArrays(GL_QUADS, 0, hint_nump)
+        glUseProgram(0)
+    else:
+        glDrawArrays(GL_QUADS, 0, hint_nump)
+    glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+
+def delete_hint_worker():
+    """Stop :py:data:`hint_worker`, if it's running."""
+    global hint_worker
+    if hint_worker is not None:
+        evsrc.set_timer(pygame.USEREVENT+4, 0)
+        hint_worker.close()
+        hint_worker = None
+
+def delete_hint():
+    """Destroy placement hint object."""
+    pool.release_buffer("hint")
 
 def init_next_b():
     """Initialize next block object."""
     global null, next_b_vbo, log
-    next_b_vbo = glGenBuffers(1)
-    glBindBuffer(GL_ARRAY_BUFFER, next_b_vbo)
     maxp = max(map(len, log.blocks))
-    glBufferData(GL_ARRAY_BUFFER, maxp*768, null, GL_STATIC_DRAW)
+    next_b_vbo = pool.buffer("next_block", maxp*24*vertex_dtype.itemsize)[0]
 
 def update_next_b():
     """Update next block object."""
-    global next_b_vbo, next_b_nump, cube_xyzrgba_data, colors, width, w_spacing, log
-    coords = []
-    for i in log.GetNextBlock():
-        col = colors[i.col]
-        coords.append(cube_xyzrgba_data + numpy.array([i.x+i.w*(width+w_spacing),i.y,i.z,col[0],col[1],col[2],1,0], dtype=numpy.float32))
-    coords = numpy.array(coords, dtype=numpy.float32)
-    delta = numpy.array([numpy.average(coords[...,0]), numpy.average(coords[...,1]), numpy.average(coords[...,2]), 0, 0, 0, 0, 0], dtype=numpy.float32) 
-    coords -= delta
+    global next_b_vbo, next_b_nump, next_b_center, log
+    cells = log.NextBlockView()
+    coords = geometry.view_vertices(cells, colors, w_step=w_step())
+    # centers of cubes are 0.5 from their cells
+    next_b_center = tuple(numpy.average(cells[:, :4], axis=0)+(0.5, 0.5, 0.5, 0))
     glBindBuffer(GL_ARRAY_BUFFER, next_b_vbo)
-    next_b_nump = len(coords)*24
+    next_b_nump = len(coords)
     glBufferSubData(GL_ARRAY_BUFFER, 0, coords.nbytes, coords)
     
 def draw_next_b():
     """Draw next block object."""
     global next_b_vbo, next_b_nump
     glBindBuffer(GL_ARRAY_BUFFER, next_b_vbo)
-    glVertexPointer(3, GL_FLOAT, 32, null)
-    glColorPointer(4, GL_FLOAT, 32, c_void_p(12))
+    set_block_pointers(0)
     glDrawArrays(GL_QUADS, 0, next_b_nump)
     
 def delete_next_b():
     """Destroy next block object."""
-    glDeleteBuffers(1,  [next_b_vbo])
+    pool.release_buffer("next_block")
 
 def init_curr_b():
-    """Initialize current block object."""
-    global null, curr_b_vbo, log
-    curr_b_vbo = glGenBuffers(1)
-    glBindBuffer(GL_ARRAY_BUFFER, curr_b_vbo)
+    """Initialize current block object: a buffer with :py:data:`curr_b_slots` slots for meshes of the current block."""
+    global null, curr_b_vbo, curr_b_meshes, curr_b_order, curr_b_stats, log
     maxp = max(map(len, log.blocks))
-    glBufferData(GL_ARRAY_BUFFER, maxp*768, null, GL_STATIC_DRAW)
+    curr_b_vbo = pool.buffer("current_block", curr_b_slots*maxp*24*vertex_dtype.itemsize)[0]
+    curr_b_meshes, curr_b_order, curr_b_stats = {}, [], [0, 0]
 
 def update_curr_b():
-    """Update current block object."""
-    global curr_b_vbo, curr_b_nump, cube_xyzrgba_data, colors, width, w_spacing, log
-    coords = []
-    for i in log.GetCurrentBlock():
-        col = colors[i.col]
-        coords.append(cube_xyzrgba_data + numpy.array([i.x+i.w*(width+w_spacing),i.y,i.z,col[0],col[1],col[2],1,0], dtype=numpy.float32))
-    coords = numpy.array(coords, dtype=numpy.float32)
-    glBindBuffer(GL_ARRAY_BUFFER, curr_b_vbo)
-    curr_b_nump = len(coords)*24
-    glBufferSubData(GL_ARRAY_BUFFER, 0, coords.nbytes, coords)
+    """Update current block object: select the mesh of the block's shape in its orientation, building it in the least recently used slot if it isn't there. The block's position isn't part of the mesh, it's applied when drawing."""
+    global curr_b_vbo, curr_b_nump, curr_b_off, log
+    cells = log.CurrentBlockView()
+    off = log.cur_block_offset
+    key = tuple(sorted([(i[0]-off[0], i[1]-off[1], i[2]-off[2], i[3]-off[3], i[4]) for i in cells.tolist()]))
+    size = max(map(len, log.blocks))*24*vertex_dtype.itemsize
+    slot = curr_b_meshes.get(key)
+    if slot is None:
+        if len(curr_b_order) < curr_b_slots:
+            slot = len(curr_b_order)
+        else:
+            slot = curr_b_meshes.pop(curr_b_order.pop(0))
+        coords = geometry.view_vertices(cells, colors, off, w_step())
+        if len(coords):
+            glBindBuffer(GL_ARRAY_BUFFER, curr_b_vbo)
+            glBufferSubData(GL_ARRAY_BUFFER, slot*size, coords.nbytes, coords)
+        curr_b_meshes[key] = slot
+        curr_b_stats[0] += 1
+    else:
+        curr_b_order.remove(key)
+        curr_b_stats[1] += 1
+    curr_b_order.append(key)
+    curr_b_nump = len(key)*24
+    curr_b_off = slot*size
     
 def draw_curr_b():
     """Draw current block object."""
-    global curr_b_vbo, curr_b_nump
+    global curr_b_vbo, curr_b_nump, curr_b_off
     glBindBuffer(GL_ARRAY_BUFFER, curr_b_vbo)
-    glVertexPointer(3, GL_FLOAT, 32, null)
-    glColorPointer(4, GL_FLOAT, 32, c_void_p(12))
+    set_block_pointers(curr_b_off)
     glDrawArrays(GL_QUADS, 0, curr_b_nump)
     
 def delete_curr_b():
     """Destroy current block object."""
-    glDeleteBuffers(1,  [curr_b_vbo])
+    global curr_b_meshes, curr_b_order
+    pool.release_buffer("current_block")
+    curr_b_meshes, curr_b_order = {}, []
 
 def init_sblocks():
-    """Initialize static blocks object."""
-    global null, sb_vbo, width, height, depth, w_depth
-    sb_vbo = glGenBuffers(1)
-    glBindBuffer(GL_ARRAY_BUFFER, sb_vbo)
-    glBufferData(GL_ARRAY_BUFFER, width*depth*height*w_depth*768, null, GL_STATIC_DRAW) # 6 faces x 4 verts x (xyzrgba_ = 8) floats x 4 bytes
+    """Initialize static blocks object: a chunk for each w-slice. Chunks kept in :py:data:`pool` for slices beyond :py:data:`w_depth` (from a game with a bigger domain) are released."""
+    global null, sb_chunks, sb_built, width, height, depth, w_depth
+    sb_chunks = []
+    for w in xrange(w_depth):
+        vbo = pool.buffer("static_blocks_%d" % w, width*depth*height*24*vertex_dtype.itemsize)[0] # 6 faces x 4 verts
+        sb_chunks.append([vbo, 0])
+    w = w_depth
+    while "static_blocks_%d" % w in pool.buffers:
+        pool.release_buffer("static_blocks_%d" % w)
+        w += 1
+    sb_built = (None, 0)
+
+def slice_vertices(w):
+    """Return vertex data of cubes of the static cells with w-coordinate *w*, read from the board view of :py:data:`log`."""
+    return geometry.board_slice_vertices(log.BoardView(), w, colors, w_step())
+
+def w_step():
+    """Return the x offset of each w-slice added to block geometry on the CPU: none if :py:data:`edge_prog` maps w to 3D, the default slice layout otherwise."""
+    if edge_prog:
+        return 0
+    return width+w_spacing
+
+def set_block_pointers(offset):
+    """Set vertex and color pointers for block geometry (see :py:data:`vertex_dtype`) starting at byte *offset* of the bound buffer. The fourth vertex component (w and the corner index) is read only with :py:data:`edge_prog`."""
+    stride = vertex_dtype.itemsize
+    glVertexPointer(4 if edge_prog else 3, GL_SHORT, stride, c_void_p(offset))
+    glColorPointer(4, GL_UNSIGNED_BYTE, stride, c_void_p(offset+8))
+
+def w_projection():
+    """Return the mapping of the fourth dimension to 3D: a tuple *(slice step, view rotation, center)* of arrays, see :py:data:`slice_step`, :py:data:`w_view` and :py:data:`w_persp`. Without :py:data:`edge_prog` it's always the default layout baked into the geometry."""
+    step = numpy.array([width+w_spacing, 0, 0], dtype=numpy.float64)
+    view = numpy.identity(4)
+    if edge_prog:
+        if slice_step is not None:
+            step = numpy.array(slice_step, dtype=numpy.float64)
+        if w_view is not None:
+            view = numpy.array(w_view, dtype=numpy.float64)
+    center = numpy.array([0.5*width, 0.5*height, 0.5*depth, 0.5*(w_depth-1)])
+    return step, view, center
+
+def project4(p):
+    """Map points *p* (array of shape (n, 4)) of the 4D space to 3D (array of shape (n, 3)) the way :py:data:`edge_vert_src` does."""
+    step, view, center = w_projection()
+    persp = w_persp if edge_prog else 0.0
+    p = numpy.dot(numpy.asarray(p, dtype=numpy.float64)-center, view.T)+center
+    return (p[:, :3]-center[:3])/(1.0+persp*(p[:, 3:4]-center[3]))+center[:3]+p[:, 3:4]*step
+
+def set_projection():
+    """Set the uniforms of :py:data:`edge_prog` (which has to be in use) mapping the fourth dimension to 3D, and reset the offset of drawn cells. Called each frame, so the mapping can be animated without touching the geometry."""
+    step, view, center = w_projection()
+    glUniform3f(edge_locs["slice_step"], *step)
+    glUniformMatrix4fv(edge_locs["view4"], 1, GL_TRUE, numpy.array(view, dtype=numpy.float32))
+    glUniform4f(edge_locs["center4"], *center)
+    glUniform1f(edge_locs["w_persp"], w_persp)
+    glUniform4f(edge_locs["offset4"], 0, 0, 0, 0)
+
+def slice_box(w):
+    """Return the bounding box (tuple of min and max corner) of the w-slice *w* as drawn."""
+    corners = project4([[width*(i&1), height*(i>>1&1), depth*(i>>2&1), w] for i in xrange(8)])
+    return corners.min(axis=0), corners.max(axis=0)
 
 def update_sblocks():
-    """Update static blocks object."""
-    global sb_vbo, sb_nump, cube_xyzrgba_data, colors, width, w_spacing, log
-    coords = []
-    for i in log.GetSpace():
-    #for i in log.GetSpaceWithBlock():
-        col = colors[i.col]
-        coords.append(cube_xyzrgba_data + numpy.array([i.x+i.w*(width+w_spacing),i.y,i.z,col[0],col[1],col[2],1,0],dtype=numpy.float32))
-    coords = numpy.array(coords, dtype=numpy.float32)
-    glBindBuffer(GL_ARRAY_BUFFER, sb_vbo)
-    sb_nump = len(coords)*24
-    glBufferSubData(GL_ARRAY_BUFFER, 0, coords.nbytes, coords)
-    
+    """Update static blocks object. Only the chunks of the slices touched by the last dropped block are rebuilt, unless layers were cleared or the game state changed otherwise; chunks are built from the board view in :py:data:`sb_workers` threads and uploaded here."""
+    global sb_built, sb_workers, log
+    if sb_built == (log, log.blocks_dropped-1) and not log.last_cleared:
+        dirty = sorted(set([i.w for i in log.last_dropped]))
+    else:
+        dirty = range(len(sb_chunks))
+    sb_built = (log, log.blocks_dropped)
+    if not dirty:
+        return
+    if len(dirty) > 1 and sb_threads > 1:
+        if sb_workers is None:
+            from multiprocessing.pool import ThreadPool
+            sb_workers = ThreadPool(sb_threads)
+        built = sb_workers.map(slice_vertices, dirty)
+    else:
+        built = [slice_vertices(w) for w in dirty]
+    for w, coords in zip(dirty, built):
+        chunk = sb_chunks[w]
+        glBindBuffer(GL_ARRAY_BUFFER, chunk[0])
+        chunk[1] = len(coords)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, coords.nbytes, coords)
+
+def box_visible(box, mvp):
+    """Return False if the box *box* (tuple of min and max corner) is certainly outside the view frustum, for the combined modelview and projection matrix *mvp* (4x4 array, multiplying row vectors from the right)."""
+    lo, hi = box
+    corners = numpy.array([[(lo, hi)[i>>j&1][j] for j in xrange(3)]+[1.0] for i in xrange(8)])
+    clip = numpy.dot(corners, mvp)
+    w = clip[:, 3:4]
+    # all corners outside the same clipping plane
+    return not ((clip[:, :3] < -w).all(axis=0).any() or (clip[:, :3] > w).all(axis=0).any())
+
 def draw_sblocks():
-    """Draw static blocks object."""
-    global sb_vbo, sb_nump
-    glBindBuffer(GL_ARRAY_BUFFER, sb_vbo)
-    glVertexPointer(3, GL_FLOAT, 32, null)
-    glColorPointer(4, GL_FLOAT, 32, c_void_p(12))
-    glDrawArrays(GL_QUADS, 0, sb_nump)
+    """Draw static blocks object, skipping chunks outside of the view."""
+    global sb_culled
+    mvp = numpy.dot(numpy.array(glGetFloatv(GL_MODELVIEW_MATRIX), dtype=numpy.float64).reshape(4, 4), numpy.array(glGetFloatv(GL_PROJECTION_MATRIX), dtype=numpy.float64).reshape(4, 4))
+    sb_culled = 0
+    for w in xrange(len(sb_chunks)):
+        vbo, nump = sb_chunks[w]
+        if not nump:
+            continue
+        if not box_visible(slice_box(w), mvp):
+            sb_culled += 1
+            continue
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        set_block_pointers(0)
+        glDrawArrays(GL_QUADS, 0, nump)
 
 def delete_sblocks():
     """Destroy static blocks object."""
-    glDeleteBuffers(1,  [sb_vbo])
+    global sb_chunks
+    for i in xrange(len(sb_chunks)):
+        pool.release_buffer("static_blocks_%d" % i)
+    sb_chunks = []
 
 def init_outer_grid():
     """Initialize outer grid object."""
-    global null, og_vbo, width, height, depth, w_depth, w_spacing, og_nump
-    # build coords
-    coor = []
-    for w in xrange(w_depth):
-        x_ = w*(width+w_spacing)
-        xx = x_+width
-        for x in xrange(x_, xx):
-            for y in xrange(0, height):
-                coor.append([x,y+1,0])
-                coor.append([x+1,y+1,0])
-                coor.append([x+1,y,0])
-                coor.append([x,y,0])
-                coor.append([x,y,depth])
-                coor.append([x+1,y,depth])
-                coor.append([x+1,y+1,depth])
-                coor.append([x,y+1,depth])
-        for z in xrange(0, depth):
-            for y in xrange(0, height):
-                coor.append([x_,y,z])
-                coor.append([x_,y,z+1])
-                coor.append([x_,y+1,z+1])
-                coor.append([x_,y+1,z])
-                coor.append([xx,y+1,z])
-                coor.append([xx,y+1,z+1])
-                coor.append([xx,y,z+1])
-                coor.append([xx,y,z])
-        for z in xrange(0, depth):
-            for x in xrange(x_, xx):
-                coor.append([x,0,z])
-                coor.append([x+1,0,z])
-                coor.append([x+1,0,z+1])
-                coor.append([x,0,z+1])
-                coor.append([x,height,z+1])
-                coor.append([x+1,height,z+1])
-                coor.append([x+1,height,z])
-                coor.append([x,height,z])
-
-    coords = numpy.array(coor, dtype=numpy.float32)
+    global og_vbo, og_nump, og_walls
+    coords, table = geometry.outer_grid(width, height, depth, w_depth, w_spacing)
+    og_walls = [(int(table[i][0]), int(table[i][1]), numpy.array(table[i][2:5]), numpy.array(table[i][5:8]), i/6) for i in xrange(len(table))]
     og_nump = len(coords)
-    og_vbo = glGenBuffers(1)
-    glBindBuffer(GL_ARRAY_BUFFER, og_vbo)
-    glBufferData(GL_ARRAY_BUFFER, og_nump*12, coords, GL_STATIC_DRAW)
+    og_vbo, valid = pool.buffer("outer_grid", og_nump*12, key=(width, height, depth, w_depth, w_spacing))
+    if not valid:
+        glBufferSubData(GL_ARRAY_BUFFER, 0, og_nump*12, coords)
+
+def eye_position():
+    """Return the position of the camera in the coordinates set by the current modelview matrix."""
+    m = numpy.array(glGetFloatv(GL_MODELVIEW_MATRIX), dtype=numpy.float64).reshape(4, 4)
+    return numpy.linalg.inv(m)[3, :3]
+
+def grid_slice_shift(w):
+    """Return the translation (array of 3 floats) of the grid of the w-slice *w* from its built position to the one of the current mapping of the fourth dimension."""
+    center = [[0.5*width, 0.5*height, 0.5*depth, w]]
+    return project4(center)[0]-(center[0][0]+w*(width+w_spacing), center[0][1], center[0][2])
+
+def draw_grid_wall(wall):
+    """Draw the grid wall *wall* (tuple from :py:data:`og_walls` with the translation of its slice in place of the slice index)."""
+    if wall[4].any():
+        glPushMatrix()
+        glTranslatef(*wall[4])
+        glDrawArrays(GL_LINES, wall[0], wall[1])
+        glPopMatrix()
+    else:
+        glDrawArrays(GL_LINES, wall[0], wall[1])
 
 def draw_outer_grid():
-    """Draw outer grid object."""
-    global og_vbo, og_nump
+    """Draw outer grid object. Walls seen from the inside of their slice (the far ones) are drawn opaque, walls seen from the outside are drawn faint. Slices are moved to where :py:func:`project4` puts their centers."""
+    global og_vbo, og_walls
+    eye = eye_position()
+    far, near = [], []
+    shifts = [grid_slice_shift(w) for w in xrange(w_depth)]
+    for i in og_walls:
+        i = i[:4]+(shifts[i[4]],)
+        if numpy.dot(eye-i[2]-i[4], i[3]) < 0:
+            far.append(i)
+        else:
+            near.append(i)
     glBindBuffer(GL_ARRAY_BUFFER, og_vbo)
     glVertexPointer(3, GL_FLOAT, 12, null)
     glDisableClientState(GL_COLOR_ARRAY)
-    glDrawArrays(GL_QUADS, 0, og_nump)
+    glColor4f(1.0, 1.0, 1.0, 1.0)
+    for i in far:
+        draw_grid_wall(i)
+    glColor4f(1.0, 1.0, 1.0, 0.2)
+    for i in near:
+        draw_grid_wall(i)
     glEnableClientState(GL_COLOR_ARRAY)
 
 def delete_outer_grid():
     """Destroy outer grid object."""
-    glDeleteBuffers(1,  [og_vbo])
+    pool.release_buffer("outer_grid")
+
+def init_edge_shader():
+    """Compile the shader program drawing block faces together with their outlines. If it can't be done (e.g. there's no shader support), :py:data:`edge_prog` is left as None and blocks are drawn in two passes."""
+    global edge_prog, edge_locs
+    edge_prog = None
+    if not use_edge_shader:
+        return
+    try:
+        edge_prog = pool.program("edge", lambda: gl_pool.compile_program(edge_vert_src, edge_frag_src))
+        edge_locs = dict([(i, glGetUniformLocation(edge_prog, i)) for i in ("line_width", "slice_step", "view4", "center4", "w_persp", "offset4")])
+    except Exception, e:
+        print "Warning: can't use outline shader (%s), drawing outlines in a separate pass." % e
+        edge_prog = None
+
+def delete_edge_shader():
+    """Destroy the single-pass fill and outline shader program."""
+    global edge_prog
+    pool.release_program("edge")
+    edge_prog = None
 
 def set_fonts_sizes():
-    """Set sizes of font objects according to current window size."""
-    global font, menu_font, win_width, win_height
-    font.FaceSize(int(win_height*0.04))
-    menu_font.FaceSize(int(win_height*0.04))
+    """Set sizes of font objects according to current window size. Text cached with the old sizes is dropped."""
+    global font_cache, menu_font_cache, win_width, win_height
+    font_cache.set_face_size(int(win_height*0.04))
+    menu_font_cache.set_face_size(int(win_height*0.04))
 
 def init_font():
     """Initialize fiot objects."""
-    global font, menu_font
-    font = FTGL.PixmapFont(conf.get("font_filename"))
-    menu_font = FTGL.PixmapFont(conf.get("menu_font_filename"))
+    global font, menu_font, font_cache, menu_font_cache
+    font_cache = pool.text_cache("font", conf.get("font_filename"))
+    menu_font_cache = pool.text_cache("menu_font", conf.get("menu_font_filename"))
+    font, menu_font = font_cache.font, menu_font_cache.font
     set_fonts_sizes()
 
+def delete_font():
+    """Destroy font objects and textures of cached text."""
+    pool.release_text_cache("font")
+    pool.release_text_cache("menu_font")
+
 def set_speed():
     """Set time between block fall steps according to the **speed** setting and **turbo mode**."""
-    global conf, turbo
-    dt = settings.speed2dt(conf.get("speed"))
+    global conf, turbo, fall_dt
+    fall_dt = settings.speed2dt(conf.get("speed"))
     if turbo:
-        dt/=4
-    pygame.time.set_timer(pygame.USEREVENT, dt)
-    
+        fall_dt /= 4
+
+def sim_paused():
+    """Return True if the fall of blocks is stopped (in the menu and on the game over screen)."""
+    return menu_mode or game_over_mode
+
+def advance_fall():
+    """Make the fall steps due since the last call. Steps are made every :py:data:`fall_dt` msec of accumulated time, independently of how often the screen is redrawn."""
+    global fall_acc, fall_last
+    t = evsrc.get_ticks()
+    if not sim_paused():
+        fall_acc += t-fall_last
+        while fall_acc >= fall_dt and not game_over_mode:
+            fall_acc -= fall_dt
+            log.AdvanceFall()
+            request_redraw()
+        if interp_fall and can_fall() and t-interp_last >= interp_dt():
+            # the block is moving smoothly, draw its next position
+            request_redraw()
+    fall_last = t
+
+def interp_dt():
+    """Return the time between frames drawn only to move the falling block smoothly (msec), see :py:data:`interp_steps`."""
+    return max(1000/fps_limit, fall_dt/interp_steps)
+
+def set_repeat():
+    """Set auto-repeat timing of held functions according to the **repeat_delay** and **repeat_interval** settings."""
+    repeat_sched.set_timing(conf.get("repeat_delay"), conf.get("repeat_interval"))
+
+def advance_repeat():
+    """Execute repeats of held functions which are due."""
+    if sim_paused():
+        return
+    for i in repeat_sched.due(evsrc.get_ticks()):
+        execute_triggered([i])
+
+def arm_wakeup_timer():
+    """Set the timer waking up the main loop when the next fall step, auto-repeat or frame of the interpolated fall is due."""
+    if sim_paused():
+        evsrc.set_timer(pygame.USEREVENT, 0)
+        return
+    dt = fall_dt-fall_acc
+    t = repeat_sched.next_due()
+    if t is not None:
+        dt = min(dt, t-evsrc.get_ticks())
+    if interp_fall and can_fall():
+        dt = min(dt, interp_last+interp_dt()-evsrc.get_ticks())
+    evsrc.set_timer(pygame.USEREVENT, max(1, dt))
+
+def can_fall():
+    """Return True if the current block can make one more fall step. The result is cached until the block or the space change."""
+    global fall_free, fall_free_key
+    key = [(i.x, i.y, i.z, i.w) for i in log.cur_block]
+    key.append(log.blocks_dropped)
+    if key != fall_free_key:
+        fall_free_key = key
+        fall_free = log.CanFall()
+    return fall_free
+
+def fall_offset():
+    """Return how far (in cells, between 0 and 1) below its logical position the falling block should be drawn."""
+    if interp_fall and fall_dt and can_fall():
+        return min(fall_acc*1.0/fall_dt, 1.0)
+    return 0.0
+
+def hud_lines():
+    """Return a list of lines of text with score and other info."""
+    out = []
+    if conf.get("show_fps"):
+        out.append("FPS: %.0f" % fps)
+    out.append("Score: %d" % log.score)
+    out.append("Layers cleared: %d" % log.layers_cleared)
+    out.append("Next: ")
+    return out
+
+def game_over_lines():
+    """Return a list of lines of text for the game over screen, empty strings mean blank lines."""
+    return ["GAME OVER", "", "Score: %d" % log.score, "Layers cleared: %d" % log.layers_cleared, "Press Esc to continue"]
+
+def prepare_text():
+    """Rasterize text which will be drawn this frame and isn't cached yet. Has to be called before the color buffer is cleared."""
+    if menu_mode:
+        menu_font_cache.prepare([j for i in xmenu.get_options_list() for j in i])
+    elif game_over_mode:
+        menu_font_cache.prepare(game_over_lines())
+    else:
+        font_cache.prepare([j for i in hud_lines() for j in font_cache.split(i)])
+
 def draw_font():
     """Draw text with score and other info."""
-    global font, win_width, win_height, log, null, fps, conf
+    global font, font_cache, win_width, win_height
     line_w = font.line_height*0.5+5
-    tmp = font.BBox("Layers cleared: 1000")
-    max_w = tmp[3]-tmp[0]
-    glColor4f(0.6, 0.6, 1.0, 1.0)
-    glWindowPos2f(win_width-max_w, win_height-line_w-10)
-    if conf.get("show_fps"):
-        font.Render("FPS: %.0f" % fps)
-        glBitmap(0, 0, 0, 0, 0, -line_w, null)
-    font.Render("Score: %d" % log.score)
-    glBitmap(0, 0, 0, 0, 0, -line_w, null)
-    font.Render("Layers cleared: %d" % log.layers_cleared)
-    glBitmap(0, 0, 0, 0, 0, -line_w, null)
-    font.Render("Next: ")
+    x = win_width-font_cache.width(hud_width_text)
+    y = win_height-line_w-10
+    col = (0.6, 0.6, 1.0, 1.0)
+    # numbers are drawn digit by digit, so the changing score and frame rate are never rasterized again
+    font_cache.draw(font_cache.compose([(l, x, y-i*line_w, col) for i, l in enumerate(hud_lines())]))
 
 def gl_init():
     """Save OpenGL state (to later restore it) and initialize OpenGL state for this game."""
@@ -393,13 +712,15 @@ def gl_init():
     init_next_b()
     init_curr_b()
     init_shy()
+    init_hint()
     init_font()
+    init_edge_shader()
     gen_stipple()
     glPolygonStipple(sh_stipple)
 
 def draw_game_over():
     """Draw game over screen."""
-    global menu_font, win_width, win_height, log
+    global menu_font, menu_font_cache, win_width, win_height, log
     glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
     glPushMatrix()
     glLoadIdentity()
@@ -416,25 +737,16 @@ def draw_game_over():
     glPopMatrix()
     glMatrixMode(GL_MODELVIEW)
     glPopMatrix()
-    glColor4f(1.0, 1.0, 1.0, 1.0)
     line_w = menu_font.line_height*0.5+5
     x, y = win_width*0.05, win_height*0.5+line_w*2.5
-    glWindowPos2f(x, y)
-    menu_font.Render("GAME OVER")
-    glWindowPos2f(x, y-2*line_w)
-    menu_font.Render("Score: %d" % log.score)
-    glWindowPos2f(x, y-3*line_w)
-    menu_font.Render("Layers cleared: %d" % log.layers_cleared)
-    glWindowPos2f(x, y-4*line_w)
-    menu_font.Render("Press Esc to continue")
+    col = (1.0, 1.0, 1.0, 1.0)
+    menu_font_cache.draw([(l, x, y-i*line_w, col) for i, l in enumerate(game_over_lines()) if l])
 
 def draw_menu():
     """Draw in-game menu."""
-    global menu_font, win_width, win_height, xmenu
+    global menu_font, menu_font_cache, win_width, win_height, xmenu
     highlighted = xmenu.selected
     text = xmenu.get_options_list()
-    text_w = [(menu_font.BBox(i[0]), menu_font.BBox(i[1])) for i in text]
-    text_w = [(i[0][3]-i[0][0], i[1][3]-i[1][0]) for i in text_w]
     glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
     glPushMatrix()
     glLoadIdentity()
@@ -454,23 +766,28 @@ def draw_menu():
     line_w = menu_font.line_height*0.5+5
     x = win_width*0.05
     y = win_height*0.5+line_w*(len(text))*0.5
+    items = []
     for i in xrange(len(text)):
-        delta = win_width*0.7-text_w[i][1]
+        delta = win_width*0.7-menu_font_cache.width(text[i][1])
         if i == highlighted:
-            glColor4f(1.0, 1.0, 1.0, 1.0)
+            col = (1.0, 1.0, 1.0, 1.0)
         else:
-            glColor4f(1.0, 1.0, 0.5, 1.0)
-        glWindowPos2f(x, y-line_w*i)
-        menu_font.Render(text[i][0])
-        glWindowPos2f(delta, y-line_w*i)
-        menu_font.Render(text[i][1])
+            col = (1.0, 1.0, 0.5, 1.0)
+        items.append((text[i][0], x, y-line_w*i, col))
+        items.append((text[i][1], delta, y-line_w*i, col))
+    menu_font_cache.draw(items)
 
 def draw_curr_b_():
     """Draw current block at the right position."""
     global log, width, w_spacing
-    glPushMatrix()
     off = log.cur_block_offset
-    glTranslatef(off[0]+off[3]*(width+w_spacing), off[1], off[2])
+    if edge_prog:
+        glUniform4f(edge_locs["offset4"], off[0], off[1]-fall_offset(), off[2], off[3])
+        draw_curr_b()
+        glUniform4f(edge_locs["offset4"], 0, 0, 0, 0)
+        return
+    glPushMatrix()
+    glTranslatef(off[0]+off[3]*(width+w_spacing), off[1]-fall_offset(), off[2])
     draw_curr_b()
     glPopMatrix()
 
@@ -485,22 +802,20 @@ def draw_next_b_():
     glTranslatef(10*aspect, 6, zoom)
     glRotatef(rot_next_b, 0.0, 1.0, 0.0)
     glScalef(scale, scale, scale)
+    c = next_b_center
+    if edge_prog:
+        # the next block is mapped to 3D like the rest, then centered at the origin
+        glTranslatef(*(-project4([c])[0]))
+        glUniform4f(edge_locs["offset4"], 0, 0, 0, 0)
+    else:
+        glTranslatef(-c[0]-c[3]*(width+w_spacing), -c[1], -c[2])
     draw_next_b()
     glPopMatrix()
     
-def display():
-    """Main display call, draws everything needed."""
-    global rotz, roty, panx, pany, zoom, log, menu_mode, rot_next_b
-    update_shy()
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    glLoadIdentity()
-    glTranslatef(0, 0, zoom)
-    glRotatef(rotx, 1.0, 0.0, 0.0)
-    glRotatef(roty, 0.0, 1.0, 0.0)
-    glTranslatef(panx, pany, 0)
-    glTranslatef(-0.5*(w_depth*width+(w_depth-1)*w_spacing), height*(-0.5), depth*(-0.5))
-    glCullFace(GL_BACK)
-    glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+def draw_blocks_two_pass():
+    """Draw static, current and next blocks filled, then draw them again as white outlines."""
+    # blocks are opaque
+    glDisable(GL_BLEND)
     draw_sblocks()
     draw_curr_b_()
     if not (menu_mode or game_over_mode):
@@ -517,16 +832,61 @@ def display():
     glEnableClientState(GL_COLOR_ARRAY)
     glLineWidth(1.0)
     glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+    glEnable(GL_BLEND)
+
+def draw_blocks_single_pass():
+    """Draw static, current and next blocks filled and outlined at once, using :py:data:`edge_prog`."""
+    glUseProgram(edge_prog)
+    set_projection()
+    # blocks are opaque
+    glDisable(GL_BLEND)
+    glUniform1f(edge_locs["line_width"], 3.0)
+    draw_sblocks()
+    draw_curr_b_()
+    if not (menu_mode or game_over_mode):
+        glUniform1f(edge_locs["line_width"], 1.5)
+        draw_next_b_()
+    glEnable(GL_BLEND)
+    glUseProgram(0)
+
+def update_objects():
+    """Update the objects affected by the changes of the game state since the last call (see :py:meth:`logic.logic.TakeChanges`), each at most once however many changes there were."""
+    changes = log.TakeChanges()
+    if changes & logic.CHANGE_SHAPE:
+        update_curr_b()
+    if changes & logic.CHANGE_NEXT:
+        update_next_b()
+    if changes & (logic.CHANGE_CELLS | logic.CHANGE_LAYERS):
+        update_sblocks()
+    if changes & (logic.CHANGE_POSE | logic.CHANGE_SHAPE | logic.CHANGE_CELLS | logic.CHANGE_LAYERS):
+        update_shy()
+    # the hint covers all poses of the block, so it's searched again only for a new block or board
+    if changes & (logic.CHANGE_CELLS | logic.CHANGE_NEXT):
+        request_hint()
+
+def render():
+    """Draw everything needed to the back buffer."""
+    global rotz, roty, panx, pany, zoom, log, menu_mode
+    update_objects()
+    prepare_text()
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    glLoadIdentity()
+    glTranslatef(0, 0, zoom)
+    glRotatef(rotx, 1.0, 0.0, 0.0)
+    glRotatef(roty, 0.0, 1.0, 0.0)
+    glTranslatef(panx, pany, 0)
+    glTranslatef(-0.5*(w_depth*width+(w_depth-1)*w_spacing), height*(-0.5), depth*(-0.5))
+    glCullFace(GL_BACK)
+    glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+    if edge_prog:
+        draw_blocks_single_pass()
+    else:
+        draw_blocks_two_pass()
     glEnable(GL_POLYGON_STIPPLE)
     draw_shy()
     glDisable(GL_POLYGON_STIPPLE)
-    glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-    glCullFace(GL_FRONT)
-    glColor4f(1.0, 1.0, 1.0, 1.0)
+    draw_hint()
     draw_outer_grid()
-    glCullFace(GL_BACK)
-    glColor4f(1.0, 1.0, 1.0, 0.2)
-    draw_outer_grid()    
     if menu_mode: 
         draw_menu()
     else:
@@ -534,8 +894,41 @@ def display():
             draw_game_over()
         else:
             draw_font()
-            rot_next_b += 1
-    pygame.display.flip()
+
+def display():
+    """Main display call, draws everything needed and shows it."""
+    global redraw, interp_last
+    render()
+    evsrc.flip()
+    redraw = False
+    interp_last = evsrc.get_ticks()
+
+def request_redraw():
+    """Mark the screen as needing a redraw, it will be redrawn once the pending events are processed."""
+    global redraw
+    redraw = True
+
+def display_if_needed():
+    """Call :py:func:`display` if a redraw was requested."""
+    if redraw:
+        display()
+
+def update_next_b_anim():
+    """Start the next block animation timer if the next block is shown, stop it otherwise."""
+    global next_b_anim_on, next_b_anim_last
+    on = not (menu_mode or game_over_mode)
+    if on != next_b_anim_on:
+        next_b_anim_on = on
+        next_b_anim_last = evsrc.get_ticks()
+        evsrc.set_timer(pygame.USEREVENT+3, next_b_anim_dt if on else 0)
+
+def advance_next_b_anim():
+    """Advance the next block animation according to the time passed since its last frame."""
+    global rot_next_b, next_b_anim_last
+    t = evsrc.get_ticks()
+    rot_next_b = (rot_next_b + next_b_spin*(t-next_b_anim_last)*0.001) % 360.0
+    next_b_anim_last = t
+    request_redraw()
 
 def reshape (w, h):
     """React to window geometry change, *w* is new width, *h* is new height."""
@@ -554,20 +947,19 @@ def gameover():
     #pygame.event.post(pygame.event.Event(pygame.QUIT))
     print "game over"
     game_over_mode = True
+    request_redraw()
 
 def block_dropped():
-    """Callback executed by :py:data:`log` when block was dropped, updates objects: current block, next block and static blocks."""
-    update_curr_b()
-    update_next_b()
-    update_sblocks()
+    """Callback executed by :py:data:`log` when block was dropped, requests a redraw (objects are updated by :py:func:`update_objects`)."""
+    request_redraw()
 
 def block_rotated():
-    """Callback executed by :py:data:`log` when block is rotated in 4D, updates current block object."""
-    update_curr_b()
+    """Callback executed by :py:data:`log` when block is rotated in 4D, requests a redraw (objects are updated by :py:func:`update_objects`)."""
+    request_redraw()
 
 def set_mode(w, h):
     """Set display mode with window width *w* and height *h*"""
-    pygame.display.set_mode((w, h), pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
+    evsrc.set_mode(w, h)
 
 def exit_2_os():
     """Exit to OS."""
@@ -578,9 +970,10 @@ def menu_cbck_resume(index, conf):
     """Menu callback executed when menu option **resume** is selected; *index* is index of the current position in current submenu, *conf* is the settings object (instance of :py:class:`settings.Settings`); *conf_* from :py:func:`main` will be given here."""
     global menu_mode
     menu_mode = False
+    repeat_sched.reset()
 def menu_cbck_exit2os(index, conf):
     """Menu callback executed when menu option **exit to os** is selected. Arguments mean the same as in :py:func:`menu_cbck_resume`."""
-    pygame.event.post(pygame.event.Event(pygame.QUIT))
+    evsrc.post(pygame.event.Event(pygame.QUIT))
 def menu_cbck_exit2menu(index, conf):
     """Menu callback executed when menu option **exit to menu** is selected. Arguments mean the same as in :py:func:`menu_cbck_resume`."""
     global running
@@ -591,12 +984,20 @@ def menu_cbck_misc_reset(index, conf):
         return bool2yn(conf.get("show_fps"))
     elif index == 1:
         return str(conf.get("speed"))
+    elif index == 2:
+        return "%d ms" % conf.get("repeat_delay")
+    elif index == 3:
+        return "%d ms" % conf.get("repeat_interval")
+    elif index == 4:
+        return bool2yn(conf.get("show_hint"))
 def menu_cbck_misc_enter(index, conf):
     """Submenu **misc** enter/selection callback. Arguments mean the same as in :py:func:`menu_cbck_resume`."""
     if index == 0:
         tmp = not conf.get("show_fps")
         conf.set("show_fps", tmp)
         return bool2yn(tmp)
+    elif index == 4:
+        return toggle_hint(conf)
 def menu_cbck_misc_inc(index, conf):
     """Submenu **misc** incrementation callback. Arguments mean the same as in :py:func:`menu_cbck_resume`."""
     if index == 0:
@@ -610,6 +1011,18 @@ def menu_cbck_misc_inc(index, conf):
         conf.set("speed", tmp)
         set_speed()
         return str(tmp)
+    elif index == 2:
+        tmp = min(conf.get("repeat_delay")+10, 1000)
+        conf.set("repeat_delay", tmp)
+        set_repeat()
+        return "%d ms" % tmp
+    elif index == 3:
+        tmp = min(conf.get("repeat_interval")+10, 1000)
+        conf.set("repeat_interval", tmp)
+        set_repeat()
+        return "%d ms" % tmp
+    elif index == 4:
+        return toggle_hint(conf)
 def menu_cbck_misc_dec(index, conf):
     """Submenu **misc** decrementation callback. Arguments mean the same as in :py:func:`menu_cbck_resume`."""
     if index == 0:
@@ -623,6 +1036,25 @@ def menu_cbck_misc_dec(index, conf):
         conf.set("speed", tmp)
         set_speed()
         return str(tmp)
+    elif index == 2:
+        tmp = max(conf.get("repeat_delay")-10, 0)
+        conf.set("repeat_delay", tmp)
+        set_repeat()
+        return "%d ms" % tmp
+    elif index == 3:
+        tmp = max(conf.get("repeat_interval")-10, 10)
+        conf.set("repeat_interval", tmp)
+        set_repeat()
+        return "%d ms" % tmp
+    elif index == 4:
+        return toggle_hint(conf)
+def toggle_hint(conf):
+    """Switch the **show_hint** setting of *conf* and start or stop the hint worker. Returns the new value as a menu string."""
+    tmp = not conf.get("show_hint")
+    conf.set("show_hint", tmp)
+    init_hint()
+    request_hint()
+    return bool2yn(tmp)
 def menu_cbck_controls_reset(index, conf):
     """Submenu **controls** reset callback. Arguments mean the same as in :py:func:`menu_cbck_resume`."""
     return conf.get("key_bindings").f_to_str(index)
@@ -631,7 +1063,8 @@ def menu_cbck_controls_enter(index, conf):
     global xmenu
     xmenu.current[index].val = "<press key combo to bind to>"
     bind_mode = True
-    conf.get("key_bindings").wait_and_bind(index, timer_evt_id=2, dt=10, timeout=100, loop_callback=display, quit_callback=exit_2_os, neutral_key=pygame.K_ESCAPE)
+    request_redraw()
+    conf.get("key_bindings").wait_and_bind(index, timer_evt_id=2, dt=10, timeout=100, loop_callback=display_if_needed, quit_callback=exit_2_os, neutral_key=pygame.K_ESCAPE)
     return conf.get("key_bindings").f_to_str(index)
 def menu_cbck_save(index, conf):
     """Menu callback executed when menu option **save** is selected. Arguments mean the same as in :py:func:`menu_cbck_resume`."""
@@ -643,10 +1076,14 @@ def menu_cbck_reset(index, conf):
     conf.reset()
     xmenu.update_values()
     conf.get("key_bindings").input_state.setup_joys()
+    evsrc.set_pads(conf.get("key_bindings").input_state)
 
 def execute_triggered(triggered):
     """Execute function numbers from the list *triggered*."""
     global log, menu_mode
+    if triggered:
+        request_redraw()
+        evsrc.probe.state_changed()
     if   key_num.KEY_MENU in triggered: menu_mode = not menu_mode
     elif key_num.KEY_MOV_UP in triggered: log.Translate([0,-1,0])
     elif key_num.KEY_MOV_DOWN in triggered: log.Translate([0,1,0])
@@ -661,17 +1098,17 @@ def execute_triggered(triggered):
         if i>=key_num.KEY_ROT_XY_CW and i<=key_num.KEY_ROT_ZW_CCW:
             log.Rotate(*func2rot[i-key_num.KEY_ROT_XY_CW])
 
-def remove_list(l1, l2):
-    """Remove from list *l1* elements which are in list *l2*."""
-    return list(set(l1)-set(l2))
-
 def unload():
     """Uninitialize all objects and restore OpenGL state saved in :py:func:`gl_init`."""
-    delete_curr_b()
-    delete_next_b()
-    delete_outer_grid()
-    delete_sblocks()
-    delete_shy()
+    evsrc.set_timer(pygame.USEREVENT+3, 0)
+    evsrc.set_timer(pygame.USEREVENT+5, 0)
+    delete_hint_worker()
+    if not keep_resources:
+        release_resources()
+    if print_stats:
+        print "Auto-repeat lateness:", repeat_sched.latency_report()
+        print "GL resources:", pool.report()
+        print "Current block meshes: %d built, %d reused" % tuple(curr_b_stats)
     glPopAttrib(GL_ALL_ATTRIB_BITS)
     glPopClientAttrib(GL_CLIENT_ALL_ATTRIB_BITS)
     glMatrixMode(GL_PROJECTION)
@@ -680,32 +1117,58 @@ def unload():
     glPopMatrix()
     print "UNLOADED"
 
-def main(conf_, difficulty):
-    """Main function. This should be called to start the game. Arguments: *conf_* is settings, instance of :py:class:`settings.Settings`; *difficulty* - int between 0 and 2 (inclusive) - difficulty level (0 easy, 1 normal, 2 hard)."""
-    global win_width, win_height, width, height, depth, w_depth, fps, fps_limit, log, conf, panx, pany, turbo, running
-    global mouserot, mousepan, mouse_last_x, mouse_last_y, rotx, roty, zoom, menu_mode, xmenu, colors
+def release_resources():
+    """Destroy all objects kept in :py:data:`pool`. Has to be called while the OpenGL context still exists."""
+    delete_curr_b()
+    delete_next_b()
+    delete_outer_grid()
+    delete_sblocks()
+    delete_shy()
+    delete_hint()
+    delete_edge_shader()
+    delete_font()
+    pool.release()
+
+def set_logic(log_):
+    """Make *log_* (instance of :py:class:`logic.logic`) the game state shown and update all objects for it."""
+    global log
+    log = log_
+    log.SetGameOverCallback(gameover)
+    log.SetBlockDroppedCallback(block_dropped)
+    log.SetBlockRotatedCallback(block_rotated)
+    log.MarkChanged()
+    request_redraw()
+
+def start_game(difficulty):
+    """Set domain size for *difficulty* (see :py:func:`main`), initialize OpenGL state and objects and start a new game."""
+    global width, height, depth, w_depth, log
+    width, height, depth, w_depth = logic.difficulty2dim[difficulty]
+    log = logic.logic(width, height, depth, w_depth, num_colors=len(colors))
+    gl_init()
+    set_logic(log)
+
+def init(conf_, difficulty, source=None):
+    """Initialize the game without running it, arguments mean the same as in :py:func:`main`. The window (or another OpenGL context) has to exist already."""
+    global win_width, win_height, conf, xmenu, evsrc
     conf = conf_
+    evsrc = source or input_rec.LiveSource()
     reset_settings()
     # reset input state
     conf.get("key_bindings").input_state.reset()
-    width, height, depth, w_depth = difficulty2dim[difficulty]
     gl_func_map()
     #pygame.init()
     pygame.joystick.init()
     conf.get("key_bindings").input_state.setup_joys()
+    evsrc.set_pads(conf.get("key_bindings").input_state)
     #set_mode(win_width, win_height)
     #pygame.display.set_caption("Blockout4D test")
-    surf = pygame.display.get_surface()
-    win_width, win_height = surf.get_size()
-    pygame.event.post(pygame.event.Event(pygame.VIDEORESIZE, size=(win_width, win_height), w=win_width, h=win_height))
-    log = logic.logic(width, height, depth, w_depth, num_colors=len(colors))
-    log.SetGameOverCallback(gameover)
-    log.SetBlockDroppedCallback(block_dropped)
-    log.SetBlockRotatedCallback(block_rotated)
-    gl_init()
-    block_dropped()
+    win_width, win_height = evsrc.window_size()
+    evsrc.post(pygame.event.Event(pygame.VIDEORESIZE, size=(win_width, win_height), w=win_width, h=win_height))
+    start_game(difficulty)
     set_speed()
-    pygame.time.set_timer(pygame.USEREVENT+1, 200)
+    set_repeat()
+    if spectator:
+        evsrc.set_timer(pygame.USEREVENT+5, spectator_poll_dt)
     menu_layout = _menu("*", [
         _menu_entry("resume", None, menu_cbck_resume, None, None),
         _menu_entry("exit to os", None, menu_cbck_exit2os, None, None),
@@ -714,6 +1177,9 @@ def main(conf_, difficulty):
             _menu("misc", [
                 _menu_entry("show fps", menu_cbck_misc_reset, menu_cbck_misc_enter, menu_cbck_misc_inc, menu_cbck_misc_dec),
                 _menu_entry("speed", menu_cbck_misc_reset, None, menu_cbck_misc_inc, menu_cbck_misc_dec),
+                _menu_entry("repeat delay", menu_cbck_misc_reset, None, menu_cbck_misc_inc, menu_cbck_misc_dec),
+                _menu_entry("repeat interval", menu_cbck_misc_reset, None, menu_cbck_misc_inc, menu_cbck_misc_dec),
+                _menu_entry("show hint", menu_cbck_misc_reset, menu_cbck_misc_enter, menu_cbck_misc_inc, menu_cbck_misc_dec),
             ]),
             _menu("controls", [_menu_entry(i, menu_cbck_controls_reset, menu_cbck_controls_enter, None, None) for i in key_num.labels]),
             _menu_entry("save", None, menu_cbck_save, None, None),
@@ -721,13 +1187,20 @@ def main(conf_, difficulty):
         ])
     ])
     xmenu = Menu(menu_layout, conf)
-    triggered_hold = []
-    triggered_once = []
-    triggered_timestamp = {}
-    triggered_backoff = 300
-    triggered_norepeat = [20]
+
+def run():
+    """Run the main loop of the game initialized by :py:func:`init` until it's exited, then uninitialize it."""
+    global win_width, win_height, fps, turbo, running, panx, pany
+    global mouserot, mousepan, mouse_last_x, mouse_last_y, rotx, roty, zoom, menu_mode, fall_acc
     while running:
-        for ev in pygame.event.get():
+        update_next_b_anim()
+        if not redraw:
+            # nothing to redraw, sleep until something happens or the next fall step or auto-repeat is due
+            arm_wakeup_timer()
+        events = evsrc.get(wait=not redraw)
+        # pygame events carry no timestamps, the time they were dequeued is the best estimate
+        batch_time = evsrc.get_ticks()
+        for ev in events:
             if ev.type == pygame.QUIT: 
                 exit_2_os()
             elif ev.type == pygame.VIDEORESIZE:
@@ -736,6 +1209,18 @@ def main(conf_, difficulty):
                 set_mode(win_width, win_height)                
                 reshape(win_width, win_height)
                 set_fonts_sizes()
+                request_redraw()
+            elif ev.type in (pygame.VIDEOEXPOSE, pygame.ACTIVEEVENT):
+                request_redraw()
+            elif ev.type == pygame.USEREVENT+3:
+                if next_b_anim_on: advance_next_b_anim()
+            elif ev.type == pygame.USEREVENT+4:
+                poll_hint()
+            elif ev.type == pygame.USEREVENT+5:
+                pass # just wakes the loop up, so the spectator server is serviced below
+            elif ev.type in input_dev.hotplug_events:
+                # the event source records the new registry, or installs the recorded one on playback
+                evsrc.hotplug(conf.get("key_bindings").input_state, ev)
             else:
                 if game_over_mode:
                     if ev.type == pygame.KEYDOWN:
@@ -744,12 +1229,14 @@ def main(conf_, difficulty):
                 else:
                     if menu_mode: # we're in menu
                         if ev.type == pygame.KEYDOWN:
+                            request_redraw()
                             if ev.key == pygame.K_ESCAPE:
                                 if xmenu.path:  
                                     xmenu.escape()
                                 else:
                                     menu_mode = False 
                                     conf.get("key_bindings").input_state.reset()                  
+                                    repeat_sched.reset()
                             elif ev.key == pygame.K_UP:
                                 xmenu.up()
                             elif ev.key == pygame.K_DOWN:
@@ -761,22 +1248,18 @@ def main(conf_, difficulty):
                             elif ev.key == pygame.K_RETURN:
                                 xmenu.enter()
                     else: # we're not in menu
-                        conf.get("key_bindings").input_state.process_event(ev)
-                        triggered = conf.get("key_bindings").get_triggered()
-                        tmp = turbo
-                        turbo = (key_num.KEY_TURBO in triggered)
-                        if turbo!=tmp: 
-                            set_speed()
-                            log.AdvanceFall()
-                        triggered_new = remove_list(triggered, triggered_once)
-                        for i in triggered_new: triggered_timestamp[i] = pygame.time.get_ticks()
-                        execute_triggered(triggered_new)
-                        if ev.type == pygame.USEREVENT+1:
-                            t=pygame.time.get_ticks()
-                            execute_triggered(filter(lambda x: (t-triggered_timestamp[x])>triggered_backoff, triggered_once))
-                        triggered_once = remove_list(triggered, triggered_norepeat)
-                        if ev.type == pygame.USEREVENT:
-                            log.AdvanceFall()
+                        # bindings are resolved only when the input state changed (e.g. not for axis moves below the threshold)
+                        evsrc.probe.input(ev)
+                        if conf.get("key_bindings").input_state.process_event(ev):
+                            triggered = conf.get("key_bindings").get_triggered()
+                            tmp = turbo
+                            turbo = (key_num.KEY_TURBO in triggered)
+                            if turbo!=tmp: 
+                                set_speed()
+                                log.AdvanceFall()
+                                fall_acc = 0
+                                request_redraw()
+                            execute_triggered(repeat_sched.update(triggered, getattr(ev, "timestamp", batch_time)))
                         """
                         elif ev.type == pygame.KEYDOWN:
                             print "Key press: ", ev
@@ -794,8 +1277,10 @@ def main(conf_, difficulty):
                                 mouse_last_y = ev.pos[1]
                             elif ev.button == 4: # scroll up
                                 zoom += 0.5
+                                request_redraw()
                             elif ev.button == 5: # scroll down
                                 zoom -= 0.5 
+                                request_redraw()
                         elif ev.type == pygame.MOUSEBUTTONUP:
                             if ev.button == 1:
                                 mouserot = False
@@ -808,13 +1293,27 @@ def main(conf_, difficulty):
                                     rotx += (y-mouse_last_y)*0.3
                                     mouse_last_x = x
                                     mouse_last_y = y
+                                    request_redraw()
                                 elif mousepan:
                                     panx -= (x-mouse_last_x)*0.005*zoom
                                     pany += (y-mouse_last_y)*0.005*zoom
                                     mouse_last_x = x
                                     mouse_last_y = y
-        display()
-        clock.tick(fps_limit)
-        fps = clock.get_fps()
+                                    request_redraw()
+        evsrc.probe.input(None)
+        advance_repeat()
+        advance_fall()
+        if spectator:
+            spectator.publish(log)
+            spectator.poll()
+        if redraw:
+            display()
+            evsrc.tick(clock, fps_limit)
+            fps = clock.get_fps()
     unload()
     return
+
+def main(conf_, difficulty, source=None):
+    """Main function. This should be called to start the game. Arguments: *conf_* is settings, instance of :py:class:`settings.Settings`; *difficulty* - int between 0 and 2 (inclusive) - difficulty level (0 easy, 1 normal, 2 hard); *source* - optional - source of events, e.g. a recording played back (see :py:mod:`input_rec`), live pygame events by default."""
+    init(conf_, difficulty, source)
+    run()
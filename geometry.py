@@ -0,0 +1,114 @@
+# -*- coding: utf-8-*-
+"""This module builds vertex data of the game's geometry from cells and domain sizes. It's pure: the functions only make numpy arrays, nothing is uploaded and OpenGL isn't imported, so they can be used (and measured, see :py:mod:`bench_geometry`) without a context.
+
+Block geometry is made of cubes, 24 vertices (6 quads) each, in the layout of :py:data:`vertex_dtype`. The w coordinate of cells is kept in the vertices; for drawing without shaders, *w_step* (the x offset of each w-slice) is added to x as well."""
+
+import numpy
+
+#: layout of a vertex of block geometry (12 bytes): position x, y, z and w*4 + the corner index within the face as int16, color r, g, b, a as normalized uint8
+vertex_dtype            =   numpy.dtype([("pos", numpy.int16, 4), ("col", numpy.uint8, 4)])
+#: data for one cube (24 points, values mean, in order: x, y, z, corner index within the face)
+cube_xyzc_data          =   numpy.array([[0, 0, 1, 0],
+                                         [0, 1, 1, 1],
+                                         [1, 1, 1, 2],
+                                         [1, 0, 1, 3],
+                                         [1, 1, 1, 0],
+                                         [1, 1, 0, 1],
+                                         [1, 0, 0, 2],
+                                         [1, 0, 1, 3],
+                                         [0, 1, 0, 0],
+                                         [0, 1, 1, 1],
+                                         [0, 0, 1, 2],
+                                         [0, 0, 0, 3],
+                                         [1, 1, 0, 0],
+                                         [0, 1, 0, 1],
+                                         [0, 0, 0, 2],
+                                         [1, 0, 0, 3],
+                                         [0, 0, 1, 0],
+                                         [1, 0, 1, 1],
+                                         [1, 0, 0, 2],
+                                         [0, 0, 0, 3],
+                                         [0, 1, 0, 0],
+                                         [1, 1, 0, 1],
+                                         [1, 1, 1, 2],
+                                         [0, 1, 1, 3]], dtype=numpy.int16)
+shadow_shade            =   0.75            #: brightness of y-shadow relative to the block's color
+
+def palette(colors, shade=1.0):
+    """Return the colors *colors* (list of [r, g, b], floats from 0 to 1) multiplied by *shade* as an array of shape (n, 4) of uint8 rgba values."""
+    rgba = numpy.empty((len(colors), 4), dtype=numpy.uint8)
+    rgba[:, :3] = numpy.array(colors, dtype=numpy.float64)*shade*255+0.5
+    rgba[:, 3] = 255
+    return rgba
+
+def cells_vertices(x, y, z, w, col, colors, w_step=0):
+    """Return vertex data (array of :py:data:`vertex_dtype`, 24 vertices per cell) of cubes of cells given as arrays of coordinates *x*, *y*, *z*, *w* and color indexes *col* (into *colors*, see :py:func:`palette`). *w_step* is added to x for each unit of w."""
+    pos = numpy.zeros((len(x), 4), dtype=numpy.int16)
+    pos[:, 0] = x+w*w_step
+    pos[:, 1] = y
+    pos[:, 2] = z
+    pos[:, 3] = w*4
+    out = numpy.zeros((len(x), 24), dtype=vertex_dtype)
+    out["pos"] = cube_xyzc_data[None, :, :] + pos[:, None, :]
+    out["col"] = palette(colors)[col][:, None, :]
+    return out.reshape(-1)
+
+def view_vertices(cells, colors, offset=(0, 0, 0, 0), w_step=0):
+    """Return vertex data of cubes of cells from a view *cells* (see :py:meth:`logic.logic.CellsView`), moved by -*offset*. Other arguments mean the same as in :py:func:`cells_vertices`."""
+    return cells_vertices(cells[:, 0]-offset[0], cells[:, 1]-offset[1], cells[:, 2]-offset[2], cells[:, 3]-offset[3], cells[:, 4], colors, w_step)
+
+def board_slice_vertices(board, w, colors, w_step=0):
+    """Return vertex data of cubes of the filled cells with w-coordinate *w* of *board* (see :py:meth:`logic.logic.BoardView`). Other arguments mean the same as in :py:func:`cells_vertices`."""
+    cells = board[:, w]
+    y, z, x = numpy.nonzero(cells)
+    return cells_vertices(x, y, z, w, cells[y, z, x]-1, colors, w_step)
+
+def shadow_vertices(cells, colors, w_step=0):
+    """Return vertex data (array of :py:data:`vertex_dtype`, 4 vertices per cell) of y-shadow quads, lying at the bottoms of the list of p4ds *cells*, in their colors made darker by :py:data:`shadow_shade`. Other arguments mean the same as in :py:func:`cells_vertices`."""
+    c = numpy.array([(i.x, i.y, i.z, i.w, i.col) for i in cells], dtype=numpy.int16).reshape(-1, 5)
+    pos = numpy.zeros((len(c), 4), dtype=numpy.int16)
+    pos[:, 0] = c[:, 0]+c[:, 3]*w_step
+    pos[:, 1] = c[:, 1]
+    pos[:, 2] = c[:, 2]
+    pos[:, 3] = c[:, 3]*4
+    quad = numpy.array([[0, 0, 0, 0], [0, 0, 1, 0], [1, 0, 1, 0], [1, 0, 0, 0]], dtype=numpy.int16)
+    out = numpy.zeros((len(c), 4), dtype=vertex_dtype)
+    out["pos"] = quad[None, :, :] + pos[:, None, :]
+    out["col"] = palette(colors, shadow_shade)[c[:, 4]][:, None, :]
+    return out.reshape(-1)
+
+def grid_wall_lines(axis, pos, a_axis, a_len, b_axis, b_len):
+    """Return GL_LINES vertices (array of shape (n, 3)) of a grid on the wall perpendicular to the axis *axis* at coordinate *pos*. The wall has *a_len* x *b_len* cells along the axes *a_axis* and *b_axis*, each grid line is emitted once."""
+    n_a, n_b = a_len+1, b_len+1
+    coords = numpy.zeros((n_a+n_b, 2, 3), dtype=numpy.float32)
+    coords[:, :, axis] = pos
+    coords[:n_a, :, a_axis] = numpy.arange(n_a)[:, None]
+    coords[:n_a, 1, b_axis] = b_len
+    coords[n_a:, :, b_axis] = numpy.arange(n_b)[:, None]
+    coords[n_a:, 1, a_axis] = a_len
+    return coords.reshape(-1, 3)
+
+def outer_grid(width, height, depth, w_depth, w_spacing):
+    """Build outer grid geometry of a domain of *width* x *height* x *depth* x *w_depth* cells with slices *w_spacing* apart: returns a list of GL_LINES vertices (array of shape (n, 3)) and a table of walls (array of shape (walls, 8), each row is: first point, number of points, point on the wall, outward normal)."""
+    size = (width, height, depth)
+    # grid of the six walls of a single slice
+    walls = []
+    for axis in xrange(3):
+        a_axis, b_axis = [i for i in xrange(3) if i != axis]
+        for side in (0, 1):
+            walls.append((axis, side, grid_wall_lines(axis, side*size[axis], a_axis, size[a_axis], b_axis, size[b_axis])))
+    # copy it to all slices
+    coor = []
+    table = []
+    nump = 0
+    for w in xrange(w_depth):
+        x_ = w*(width+w_spacing)
+        for axis, side, lines in walls:
+            coor.append(lines + numpy.array([x_, 0, 0], dtype=numpy.float32))
+            point = numpy.array([x_, 0, 0], dtype=numpy.float64)
+            point[axis] += side*size[axis]
+            normal = numpy.zeros(3)
+            normal[axis] = side*2-1
+            table.append(numpy.concatenate(([nump, len(lines)], point, normal)))
+            nump += len(lines)
+    return [numpy.concatenate(coor), numpy.array(table)]
@@ -0,0 +1,197 @@
+# -*- coding: utf-8-*-
+"""This module contains a pool of OpenGL resources (buffers, shader programs) and fonts, which keeps them alive between games, so starting a new game doesn't create them again. Resources are looked up by name; a buffer is reallocated only when the size it's asked for changes (i.e. when the domain size changes)."""
+
+import ctypes, numpy
+from OpenGL.GL import *
+from text_cache import TextCache
+
+def load_font(filename):
+    """Return an FTGL pixmap font loaded from the file *filename*."""
+    import FTGL
+    return FTGL.PixmapFont(filename)
+
+def compile_shader(source, shader_type):
+    """Compile GLSL *source* as a shader of *shader_type* (e.g. **GL_VERTEX_SHADER**), return the shader id. Raises an Exception with the info log on failure."""
+    shader = glCreateShader(shader_type)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+        log = glGetShaderInfoLog(shader)
+        glDeleteShader(shader)
+        raise Exception("Shader compile failure: %s" % log)
+    return shader
+
+def compile_program(vert_src, frag_src):
+    """Compile and link a shader program from GLSL sources of the vertex shader *vert_src* and the fragment shader *frag_src*, return the program id. Raises an Exception with the info log on failure."""
+    shaders = [compile_shader(vert_src, GL_VERTEX_SHADER), compile_shader(frag_src, GL_FRAGMENT_SHADER)]
+    prog = glCreateProgram()
+    for i in shaders:
+        glAttachShader(prog, i)
+    glLinkProgram(prog)
+    for i in shaders:
+        glDeleteShader(i)
+    if not glGetProgramiv(prog, GL_LINK_STATUS):
+        log = glGetProgramInfoLog(prog)
+        glDeleteProgram(prog)
+        raise Exception("Shader link failure: %s" % log)
+    return prog
+
+class StreamBuffer:
+    """This class is a buffer for geometry changing often (e.g. every few frames), uploaded without waiting for the GPU to finish drawing the previous contents. Upload modes:
+
+    * **ring** - the buffer holds several segments, each upload goes to the next one, written through an unsynchronized **glMapBufferRange** mapping; a fence guards against overwriting a segment which may still be drawn;
+    * **orphan** - the storage is reallocated (orphaned) before each upload, so the driver can give a fresh one while the GPU reads the old;
+    * **static** - plain **glBufferSubData** to a **GL_STATIC_DRAW** buffer, for old contexts."""
+    def __init__(self, size, segments=3, mode=None):
+        """*size* - int - maximum size of uploaded data (bytes); *segments* - int - number of segments in **ring** mode; *mode* - string - upload mode, by default **ring** if buffer mapping is supported, **orphan** otherwise."""
+        if mode is None:
+            mode = "ring" if bool(glMapBufferRange) else "orphan"
+        self.size, self.segments, self.mode = size, segments, mode
+        self.fenced = mode == "ring" and bool(glFenceSync)
+        self.fences = [None]*segments #: fences set after the last use of each segment (ring mode)
+        self.seg = 0 #: current segment
+        self.offset = 0 #: byte offset of the current data in the buffer
+        self.uploads = 0 #: number of uploads made
+        self.stalls = 0 #: number of uploads which had to wait for the GPU
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if mode == "ring":
+            glBufferData(GL_ARRAY_BUFFER, size*segments, None, GL_STREAM_DRAW)
+        else:
+            glBufferData(GL_ARRAY_BUFFER, size, None, GL_STATIC_DRAW if mode == "static" else GL_STREAM_DRAW)
+    def upload(self, data):
+        """Upload numpy array *data* (at most :py:attr:`size` bytes), leaving the buffer bound to **GL_ARRAY_BUFFER**. Returns the byte offset of the data in the buffer, to be added to the offsets of the vertex attributes."""
+        data = numpy.ascontiguousarray(data)
+        n = data.nbytes
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        self.uploads += 1
+        if self.mode == "ring":
+            # everything drawn from the current segment has been issued, fence it and move on
+            if self.fenced:
+                self.fences[self.seg] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            self.seg = (self.seg+1) % self.segments
+            fence = self.fences[self.seg]
+            if fence is not None:
+                if glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0) == GL_TIMEOUT_EXPIRED:
+                    self.stalls += 1
+                    glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000)
+                glDeleteSync(fence)
+                self.fences[self.seg] = None
+            self.offset = self.seg*self.size
+            if n:
+                ptr = glMapBufferRange(GL_ARRAY_BUFFER, self.offset, n, GL_MAP_WRITE_BIT | GL_MAP_UNSYNCHRONIZED_BIT | GL_MAP_INVALIDATE_RANGE_BIT)
+                ctypes.memmove(ptr, data.ctypes.data, n)
+                glUnmapBuffer(GL_ARRAY_BUFFER)
+        elif self.mode == "orphan":
+            glBufferData(GL_ARRAY_BUFFER, self.size, None, GL_STREAM_DRAW)
+            glBufferSubData(GL_ARRAY_BUFFER, 0, n, data)
+        else:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, n, data)
+        return self.offset
+    def delete(self):
+        """Destroy the buffer."""
+        for i in self.fences:
+            if i is not None:
+                glDeleteSync(i)
+        self.fences = [None]*self.segments
+        glDeleteBuffers(1, [self.vbo])
+
+class ResourcePool:
+    """This class holds named OpenGL buffers, shader programs and text caches (with their fonts), and counts allocations."""
+    def __init__(self):
+        self.buffers = {} #: buffer name -> [buffer id, size (bytes), usage, key]
+        self.streams = {} #: stream buffer name -> :py:class:`StreamBuffer`
+        self.programs = {} #: program name -> program id
+        self.text_caches = {} #: text cache name -> (font file name, :py:class:`text_cache.TextCache`)
+        self.stats = {} #: counters, see :py:meth:`report`
+        for i in ("buffers created", "buffers allocated", "buffers reused", "programs created", "programs reused", "fonts created", "fonts reused"):
+            self.stats[i] = 0
+    def count(self, name):
+        """Increment counter *name*."""
+        self.stats[name] += 1
+    def buffer(self, name, size, usage=GL_STATIC_DRAW, key=None):
+        """Return a tuple *(buffer id, valid)* for the buffer named *name* of *size* bytes, bound to **GL_ARRAY_BUFFER**. It's created or reallocated (with *usage*) if needed. *valid* is True if the buffer wasn't reallocated and was last requested with the same *key* (any comparable value describing its contents), so its contents can be used as they are."""
+        b = self.buffers.get(name)
+        if b is None:
+            b = [glGenBuffers(1), None, None, None]
+            self.buffers[name] = b
+            self.count("buffers created")
+        glBindBuffer(GL_ARRAY_BUFFER, b[0])
+        if b[1] != size or b[2] != usage:
+            glBufferData(GL_ARRAY_BUFFER, size, None, usage)
+            b[1], b[2], b[3] = size, usage, None
+            self.count("buffers allocated")
+        else:
+            self.count("buffers reused")
+        valid = key is not None and b[3] == key
+        b[3] = key
+        return b[0], valid
+    def release_buffer(self, name):
+        """Delete the buffer named *name*, if there is one."""
+        b = self.buffers.pop(name, None)
+        if b is not None:
+            glDeleteBuffers(1, [b[0]])
+    def stream(self, name, size, segments=3, mode=None):
+        """Return the stream buffer (:py:class:`StreamBuffer`) named *name*, created again if *size*, *segments* or *mode* changed. Arguments mean the same as in :py:meth:`StreamBuffer.__init__`."""
+        b = self.streams.get(name)
+        if b is not None and (b.size, b.segments) == (size, segments) and mode in (None, b.mode):
+            self.count("buffers reused")
+            return b
+        self.release_stream(name)
+        b = StreamBuffer(size, segments, mode)
+        self.streams[name] = b
+        self.count("buffers created")
+        self.count("buffers allocated")
+        return b
+    def release_stream(self, name):
+        """Delete the stream buffer named *name*, if there is one."""
+        b = self.streams.pop(name, None)
+        if b is not None:
+            b.delete()
+    def program(self, name, build):
+        """Return the shader program named *name*, built by calling *build* (function taking no arguments, returning the program id) if it doesn't exist yet. Exceptions raised by *build* are passed on."""
+        if name in self.programs:
+            self.count("programs reused")
+            return self.programs[name]
+        prog = build()
+        self.programs[name] = prog
+        self.count("programs created")
+        return prog
+    def release_program(self, name):
+        """Delete the shader program named *name*, if there is one."""
+        prog = self.programs.pop(name, None)
+        if prog:
+            glDeleteProgram(prog)
+    def text_cache(self, name, filename):
+        """Return the text cache named *name* (:py:class:`text_cache.TextCache`) for an FTGL pixmap font loaded from the file *filename* (by :py:func:`load_font`). The font is loaded again only if the file name changed."""
+        c = self.text_caches.get(name)
+        if c is not None and c[0] == filename:
+            self.count("fonts reused")
+            return c[1]
+        self.release_text_cache(name)
+        cache = TextCache(load_font(filename))
+        self.text_caches[name] = (filename, cache)
+        self.count("fonts created")
+        return cache
+    def release_text_cache(self, name):
+        """Destroy the text cache named *name* (its textures), if there is one."""
+        c = self.text_caches.pop(name, None)
+        if c is not None:
+            c[1].invalidate()
+    def release(self):
+        """Destroy all resources in the pool."""
+        for i in self.buffers.keys():
+            self.release_buffer(i)
+        for i in self.streams.keys():
+            self.release_stream(i)
+        for i in self.programs.keys():
+            self.release_program(i)
+        for i in self.text_caches.keys():
+            self.release_text_cache(i)
+    def report(self):
+        """Return a human readable summary of the counters."""
+        out = ["%s: %d" % (i, self.stats[i]) for i in sorted(self.stats.keys())]
+        for i in sorted(self.streams.keys()):
+            b = self.streams[i]
+            out.append("%s: %s, %d uploads, %d stalls" % (i, b.mode, b.uploads, b.stalls))
+        return ", ".join(out)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8-*-
+"""This module counts OpenGL calls made by the game: calls, draw calls, vertices submitted, bytes uploaded, state changes and FTGL text renders, per frame. The GL functions imported by :py:mod:`game`, :py:mod:`gl_pool` and :py:mod:`text_cache` are replaced with counting wrappers (also after :py:func:`game.gl_func_map` swaps some of them for the ARB ones). The calls can go to the real OpenGL, or to :py:class:`FakeGL`, which needs no context at all, so the renderer can be checked on machines with no GPU and no display.
+
+Run as a script it plays an action stream (see :py:mod:`headless`), drawing a frame after each action, and checks per-frame budgets, e.g.::
+
+    python2 glstats.py --actions actions.txt --max-draws 40 --max-upload 65536
+
+It prints the worst and the average frame and exits with status 1 if a budget was exceeded."""
+
+import os, sys, re, math, ctypes, random, argparse
+
+#: names of GL functions (in the modules' namespaces) to wrap
+gl_name = re.compile(r"^glu?[A-Z]")
+#: prefixes of the names of functions counted as state changes
+state_prefixes = ("glEnable", "glDisable", "glBind", "glUseProgram", "glPolygonMode", "glPolygonStipple", "glLineWidth", "glBlendFunc", "glCullFace", "glDepthFunc", "glUniform", "glPushAttrib", "glPopAttrib", "glPushClientAttrib", "glPopClientAttrib")
+#: counters of a frame, see :py:meth:`GLStats.end_frame`
+counters = ("calls", "draws", "vertices", "upload", "state", "text")
+installed = None #: (gl_func_map, load_font) of the game as they were before :py:func:`install` wrapped them, None if it wasn't called yet
+
+class GLStats:
+    """This class holds the counters of the current frame and the ones of the frames ended so far."""
+    def __init__(self):
+        self.frames = [] #: counters of ended frames, list of dicts (counter name -> value, plus "by name" -> dict of call counts)
+        self.reset()
+    def reset(self):
+        """Start counting a new frame."""
+        self.current = dict([(i, 0) for i in counters])
+        self.by_name = {} #: numbers of calls of each function in the current frame
+    def call(self, name, args):
+        """Count a call of GL function *name* with arguments *args*."""
+        c = self.current
+        c["calls"] += 1
+        self.by_name[name] = self.by_name.get(name, 0)+1
+        if name == "glDrawArrays":
+            c["draws"] += 1
+            c["vertices"] += args[2]
+        elif name == "glBegin":
+            c["draws"] += 1
+        elif name.startswith("glVertex2") or name.startswith("glVertex3"):
+            c["vertices"] += 1
+        elif name.startswith("glBufferData"):
+            if args[2] is not None:
+                c["upload"] += args[1]
+        elif name.startswith("glBufferSubData"):
+            c["upload"] += args[2]
+        elif name == "glMapBufferRange":
+            c["upload"] += args[2]
+        elif name == "glTexImage2D":
+            c["upload"] += len(args[8]) if isinstance(args[8], str) else args[3]*args[4]
+        elif name.startswith(state_prefixes):
+            c["state"] += 1
+    def text(self):
+        """Count a text render."""
+        self.current["text"] += 1
+    def end_frame(self):
+        """End the current frame: store its counters and start a new one. Returns the stored counters."""
+        out = dict(self.current)
+        out["by name"] = self.by_name
+        self.frames.append(out)
+        self.reset()
+        return out
+    def report(self, skip=0):
+        """Return a human readable summary (worst and average frame) of the ended frames, without the first *skip* ones."""
+        frames = self.frames[skip:]
+        if not frames:
+            return "no frames"
+        out = ["%d frames" % len(frames)]
+        for i in counters:
+            v = [f[i] for f in frames]
+            out.append("%s: max %d, mean %.1f" % (i, max(v), sum(v)*1.0/len(v)))
+        return ", ".join(out)
+
+class Counted:
+    """This class wraps a GL function, counting its calls in a :py:class:`GLStats` before passing them on."""
+    def __init__(self, name, func, stats):
+        """*name* - string - name of the function; *func* - the function called; *stats* - :py:class:`GLStats` instance."""
+        self.name, self.func, self.stats = name, func, stats
+    def __call__(self, *args):
+        self.stats.call(self.name, args)
+        return self.func(*args)
+    def __nonzero__(self):
+        """A wrapped function is present if the wrapped one is (see :py:func:`game.gl_func_map`)."""
+        return bool(self.func)
+
+class FontProxy:
+    """This class stands in for an FTGL font, counting text renders."""
+    def __init__(self, font, stats, render=True):
+        """*font* - the font; *stats* - :py:class:`GLStats` instance; *render* - bool - pass renders on to the font."""
+        self.font, self.stats, self.render = font, stats, render
+    def Render(self, s):
+        self.stats.text()
+        if self.render:
+            self.font.Render(s)
+    def __getattr__(self, name):
+        return getattr(self.font, name)
+
+class FakeFont:
+    """This class is a font for :py:class:`FakeGL`: every glyph is a box 0.6 of the face size wide."""
+    def __init__(self, filename):
+        self.size = 12
+    def FaceSize(self, size):
+        self.size = size
+    def BBox(self, s):
+        return (0.0, -0.2*self.size, 0.0, 0.6*self.size*len(s), 0.8*self.size, 0.0)
+    def Render(self, s):
+        pass
+    @property
+    def line_height(self):
+        return 1.2*self.size
+
+class FakeGL:
+    """This class is an OpenGL implementation which draws nothing. It gives out object ids, keeps the matrix stacks and the viewport (the game reads them back for culling and picking) and answers the queries the game makes; all other functions do nothing."""
+    def __init__(self, w=640, h=480):
+        """*w*, *h* - int - size of the initial viewport."""
+        import numpy
+        from OpenGL import GL
+        self.numpy, self.GL = numpy, GL
+        self.next_id = 1
+        self.locations = {} #: uniform name -> location
+        self.mapped = [] #: memory of the current buffer mappings
+        self.viewport = [0, 0, w, h]
+        self.mode = GL.GL_MODELVIEW
+        self.attribs = [] #: attribute stack (matrix modes)
+        self.stacks = {GL.GL_MODELVIEW: [numpy.identity(4)], GL.GL_PROJECTION: [numpy.identity(4)]}
+    def function(self, name):
+        """Return the fake implementation of GL function *name*."""
+        f = getattr(self, name, None)
+        if f is None:
+            return lambda *args: None
+        return f
+    def new_ids(self, n):
+        ids = range(self.next_id, self.next_id+n)
+        self.next_id += n
+        return ids[0] if n == 1 else ids
+    def glGenBuffers(self, n):
+        return self.new_ids(n)
+    glGenBuffersARB = glGenTextures = glGenBuffers
+    def glCreateShader(self, shader_type):
+        return self.new_ids(1)
+    def glCreateProgram(self):
+        return self.new_ids(1)
+    def glGetShaderiv(self, shader, pname):
+        return 1
+    glGetProgramiv = glGetShaderiv
+    def glGetUniformLocation(self, prog, name):
+        return self.locations.setdefault(name, len(self.locations))
+    def glMapBufferRange(self, target, offset, length, access):
+        buf = ctypes.create_string_buffer(length)
+        self.mapped.append(buf)
+        return ctypes.addressof(buf)
+    def glUnmapBuffer(self, target):
+        self.mapped = []
+        return True
+    def glFenceSync(self, condition, flags):
+        return object()
+    def glClientWaitSync(self, sync, flags, timeout):
+        return self.GL.GL_ALREADY_SIGNALED
+    def glReadPixels(self, x, y, w, h, fmt, type_):
+        n = {self.GL.GL_RGB: 3, self.GL.GL_RGBA: 4}.get(fmt, 1)
+        return "\0"*(w*h*n)
+    def glGetString(self, name):
+        return "FakeGL"
+    def glViewport(self, x, y, w, h):
+        self.viewport = [x, y, w, h]
+    def glGetIntegerv(self, pname):
+        if pname == self.GL.GL_VIEWPORT:
+            return self.numpy.array(self.viewport)
+        return 0
+    def glGetFloatv(self, pname):
+        m = {self.GL.GL_MODELVIEW_MATRIX: self.GL.GL_MODELVIEW, self.GL.GL_PROJECTION_MATRIX: self.GL.GL_PROJECTION}.get(pname)
+        if m is None:
+            return 0.0
+        # column-major, like OpenGL
+        return self.stacks[m][-1].T.astype(self.numpy.float32)
+    def glMatrixMode(self, mode):
+        self.mode = mode
+    def glPushAttrib(self, mask):
+        # the only state kept is the matrix mode
+        self.attribs.append(self.mode)
+    def glPopAttrib(self, *args):
+        self.mode = self.attribs.pop()
+    def glLoadIdentity(self):
+        self.stacks[self.mode][-1] = self.numpy.identity(4)
+    def glPushMatrix(self):
+        self.stacks[self.mode].append(self.stacks[self.mode][-1].copy())
+    def glPopMatrix(self):
+        self.stacks[self.mode].pop()
+    def mult(self, m):
+        """Multiply the current matrix by *m* (4x4 array) from the right."""
+        self.stacks[self.mode][-1] = self.numpy.dot(self.stacks[self.mode][-1], m)
+    def glTranslatef(self, x, y, z):
+        m = self.numpy.identity(4)
+        m[:3, 3] = (x, y, z)
+        self.mult(m)
+    def glScalef(self, x, y, z):
+        self.mult(self.numpy.diag([x, y, z, 1.0]))
+    def glRotatef(self, angle, x, y, z):
+        a = math.radians(angle)
+        v = self.numpy.array([x, y, z], dtype=self.numpy.float64)
+        v /= self.numpy.linalg.norm(v)
+        k = self.numpy.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
+        m = self.numpy.identity(4)
+        m[:3, :3] = self.numpy.identity(3)+math.sin(a)*k+(1-math.cos(a))*self.numpy.dot(k, k)
+        self.mult(m)
+    def glOrtho(self, l, r, b, t, n, f):
+        m = self.numpy.identity(4)
+        m[0, 0], m[1, 1], m[2, 2] = 2.0/(r-l), 2.0/(t-b), -2.0/(f-n)
+        m[:3, 3] = (-(r+l)/(r-l), -(t+b)/(t-b), -(f+n)/(f-n))
+        self.mult(m)
+    def gluPerspective(self, fovy, aspect, n, f):
+        c = 1.0/math.tan(math.radians(fovy)*0.5)
+        m = self.numpy.zeros((4, 4))
+        m[0, 0], m[1, 1] = c/aspect, c
+        m[2, 2], m[2, 3], m[3, 2] = (f+n)/(n-f), 2.0*f*n/(n-f), -1.0
+        self.mult(m)
+
+def wrap_module(module, stats, backend=None):
+    """Replace GL functions in the namespace of *module* with counting wrappers (:py:class:`Counted`) calling the originals, or the functions of *backend* (:py:class:`FakeGL`) if it's given. Functions wrapped already count in *stats* from then on, and call *backend* if it's given."""
+    for name in dir(module):
+        f = getattr(module, name)
+        if isinstance(f, Counted):
+            f.stats = stats
+            if backend:
+                f.func = backend.function(name)
+        elif gl_name.match(name) and callable(f):
+            setattr(module, name, Counted(name, backend.function(name) if backend else f, stats))
+
+def install(backend=None):
+    """Start counting GL calls of the game, with the calls going to *backend* (:py:class:`FakeGL`) if it's given, to OpenGL otherwise. Returns the :py:class:`GLStats` instance counting them. Has to be called before the game is initialized; with the real OpenGL, after the platform is chosen (see :py:func:`headless.use_platform`). Calling it again starts counting in a new instance (e.g. with a new *backend*)."""
+    global installed
+    import game, gl_pool, text_cache
+    stats = GLStats()
+    modules = (game, gl_pool, text_cache)
+    for i in modules:
+        wrap_module(i, stats, backend)
+    if installed is None:
+        installed = (game.gl_func_map, gl_pool.load_font)
+    # functions swapped in by gl_func_map are wrapped again
+    func_map, load_font = installed
+    def gl_func_map():
+        func_map()
+        for i in modules:
+            wrap_module(i, stats, backend)
+    game.gl_func_map = gl_func_map
+    if backend:
+        gl_pool.load_font = lambda filename: FontProxy(FakeFont(filename), stats, False)
+    else:
+        gl_pool.load_font = lambda filename: FontProxy(load_font(filename), stats)
+    # fonts of text caches kept from an earlier game
+    for name, c in game.pool.text_caches.items():
+        while isinstance(c[1].font, FontProxy):
+            c[1].font = c[1].font.font
+        c[1].font = FontProxy(c[1].font, stats, not backend)
+    return stats
+
+def check(stats, budgets, skip=0):
+    """Return a list of messages about frames (without the first *skip* ones) of *stats* (:py:class:`GLStats`) exceeding *budgets* (dict: counter name -> maximum per frame)."""
+    out = []
+    for n in xrange(skip, len(stats.frames)):
+        f = stats.frames[n]
+        for i in counters:
+            if budgets.get(i) is not None and f[i] > budgets[i]:
+                out.append("frame %d: %s %d over budget %d" % (n, i, f[i], budgets[i]))
+    return out
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Count 4D Blocks OpenGL calls per frame and check budgets.")
+    p.add_argument("--actions", required=True, help="action stream file, see headless.py")
+    p.add_argument("--size", default="640x480", help="frame size, WxH")
+    p.add_argument("--difficulty", type=int, default=2)
+    p.add_argument("--seed", type=int, default=0, help="random seed for the blocks sequence")
+    p.add_argument("--platform", default="fake", help="fake (no OpenGL needed), or an offscreen platform from headless.py")
+    p.add_argument("--skip", type=int, default=1, help="number of first frames (building everything) not checked")
+    for i, h in (("calls", "GL calls"), ("draws", "draw calls"), ("vertices", "vertices submitted"), ("upload", "bytes uploaded"), ("state", "state changes"), ("text", "text renders")):
+        p.add_argument("--max-"+i, type=int, help="maximum number of %s per frame" % h)
+    args = p.parse_args(argv)
+    import headless
+    w, h = map(int, args.size.split("x"))
+    random.seed(args.seed)
+    if args.platform == "fake":
+        stats = install(FakeGL(w, h))
+        r = headless.Renderer(w, h, args.difficulty, None)
+    else:
+        headless.use_platform(args.platform)
+        stats = install()
+        r = headless.Renderer(w, h, args.difficulty, args.platform)
+    stats.reset()
+    r.game.render()
+    stats.end_frame()
+    for i in headless.read_actions(args.actions):
+        r.apply(i)
+        r.game.render()
+        stats.end_frame()
+    print stats.report(args.skip)
+    over = check(stats, dict([(i, getattr(args, "max_"+i)) for i in counters]), args.skip)
+    for i in over:
+        print i
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8-*-
+"""This module renders game states without a window, in an offscreen OpenGL context (EGL without a window surface, or OSMesa), so it works with a software rasterizer on machines with no GPU and no display. The regular drawing code from :py:mod:`game` is used, with a fixed camera.
+
+Run as a script it exports frames of a recorded action stream (or of a list of snapshots) as PNG files or as a raw RGB stream, e.g.::
+
+    python2 headless.py --actions actions.txt --out frames/ --size 640x480
+    python2 headless.py --actions actions.txt --format raw --out - | ffmpeg -f rawvideo -pix_fmt rgb24 -s 640x480 -i - clip.mp4
+
+An action stream is a text file with one action per line: either **fall** (a fall step), a label from :py:data:`key_num.labels` (e.g. **left**, **rot xw cw**), or a function number. Text after **#** is ignored. A snapshot file is a pickled list of :py:class:`logic.logic` instances with the same domain size."""
+
+import os, sys, time, ctypes, random, pickle, argparse
+
+def use_platform(platform):
+    """Select the PyOpenGL platform *platform* (**egl** or **osmesa**). Has to be called before OpenGL is imported."""
+    os.environ["PYOPENGL_PLATFORM"] = platform
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    if platform == "egl":
+        # render without any window system
+        os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+class EGLContext:
+    """Offscreen OpenGL context created with EGL, rendering to a pbuffer."""
+    def __init__(self, w, h):
+        """*w*, *h* - int - size of the framebuffer."""
+        from OpenGL import EGL
+        self.dpy = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.dpy, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise Exception("Can't initialize EGL.")
+        attrs = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+                 EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE]
+        cfg, n = EGL.EGLConfig(), EGL.EGLint()
+        EGL.eglChooseConfig(self.dpy, (EGL.EGLint*len(attrs))(*attrs), ctypes.pointer(cfg), 1, ctypes.pointer(n))
+        if not n.value:
+            raise Exception("No suitable EGL config found.")
+        attrs = [EGL.EGL_WIDTH, w, EGL.EGL_HEIGHT, h, EGL.EGL_NONE]
+        self.surf = EGL.eglCreatePbufferSurface(self.dpy, cfg, (EGL.EGLint*len(attrs))(*attrs))
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.ctx = EGL.eglCreateContext(self.dpy, cfg, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(self.dpy, self.surf, self.surf, self.ctx):
+            raise Exception("Can't make EGL context current.")
+
+class OSMesaContext:
+    """Offscreen OpenGL context created with OSMesa, rendering to a buffer in memory."""
+    def __init__(self, w, h):
+        """*w*, *h* - int - size of the framebuffer."""
+        from OpenGL import GL, arrays, osmesa
+        self.ctx = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        self.buf = arrays.GLubyteArray.zeros((h, w, 4))
+        if not osmesa.OSMesaMakeCurrent(self.ctx, self.buf, GL.GL_UNSIGNED_BYTE, w, h):
+            raise Exception("Can't make OSMesa context current.")
+
+#: offscreen context classes for platforms
+contexts = {"egl": EGLContext, "osmesa": OSMesaContext}
+
+class Renderer:
+    """This class draws game states with :py:func:`game.render` to an offscreen context and reads back the frames."""
+    def __init__(self, w=640, h=480, difficulty=2, platform="egl", conf=None):
+        """*w*, *h* - int - frame size; *difficulty* - int - difficulty level, see :py:func:`game.main`; *platform* - string - key of :py:data:`contexts`, or None if the caller provides OpenGL (e.g. the fake one of :py:mod:`glstats`), then no context is created; *conf* - optional - settings (instance of :py:class:`settings.Settings`), by default the default settings with the fps counter disabled."""
+        self.context = None
+        if platform:
+            use_platform(platform)
+            self.context = contexts[platform](w, h)
+        import settings, game
+        self.game = game
+        self.w, self.h = w, h
+        self.frames = 0 #: number of frames rendered
+        self.render_time = 0.0 #: time spent rendering and reading back frames (sec)
+        if conf is None:
+            conf = settings.Settings(dict(settings.default_settings))
+            conf.set("show_fps", False)
+        game.conf = conf
+        game.reset_settings()
+        game.win_width, game.win_height = w, h
+        game.gl_func_map()
+        game.start_game(difficulty)
+        game.reshape(w, h)
+        self.set_camera()
+    def set_camera(self, rotx=20.0, roty=-15.0, zoom=-20.0, rot_next_b=30.0):
+        """Set the fixed camera: rotation around x and y axes, zoom and rotation of the next block."""
+        g = self.game
+        g.rotx, g.roty, g.zoom, g.rot_next_b = rotx, roty, zoom, rot_next_b
+    def apply(self, action):
+        """Apply *action* to the game state: **fall** advances the fall of the block, an int executes the function with that number (see :py:mod:`key_num`). Ignored after game over."""
+        g = self.game
+        if g.game_over_mode:
+            return
+        if action == "fall":
+            g.log.AdvanceFall()
+        else:
+            g.execute_triggered([action])
+    def frame(self):
+        """Render the current state and return it as a string of RGB bytes, bottom row first."""
+        from OpenGL.GL import glFinish, glReadPixels, GL_RGB, GL_UNSIGNED_BYTE
+        t = time.time()
+        self.game.render()
+        glFinish()
+        data = glReadPixels(0, 0, self.w, self.h, GL_RGB, GL_UNSIGNED_BYTE)
+        self.render_time += time.time()-t
+        self.frames += 1
+        return data
+    def frames_from_actions(self, actions, every=1):
+        """Generator of frames: the initial state, then the state after each *every* actions from the list *actions*."""
+        yield self.frame()
+        for i in xrange(len(actions)):
+            self.apply(actions[i])
+            if (i+1) % every == 0:
+                yield self.frame()
+    def frames_from_snapshots(self, snapshots):
+        """Generator of frames, one for each instance of :py:class:`logic.logic` in the list *snapshots*."""
+        for i in snapshots:
+            self.game.set_logic(i)
+            yield self.frame()
+
+def read_actions(filename):
+    """Read an action stream from file *filename*, return a list of actions for :py:meth:`Renderer.apply`."""
+    import key_num
+    out = []
+    for line in open(filename):
+        line = line.split("#")[0].strip()
+        if not line:
+            continue
+        if line == "fall":
+            out.append(line)
+        elif line.isdigit():
+            out.append(int(line))
+        elif line == "menu":
+            out.append(key_num.KEY_MENU)
+        else:
+            out.append(key_num.labels.index(line))
+    return out
+
+def flip_rows(data, w, h):
+    """Return RGB bytes *data* of a *w* x *h* image with the order of rows reversed."""
+    n = w*3
+    return "".join([data[i*n:(i+1)*n] for i in xrange(h-1, -1, -1)])
+
+def export(frames, w, h, out, fmt="png"):
+    """Write *frames* (iterable of RGB strings, bottom row first) of size *w* x *h*. With *fmt* **png**, *out* is a directory and the frames are written to it as numbered PNG files. With *fmt* **raw**, frames are written top row first to the file *out* (or to the standard output if *out* is **-**). Returns the number of frames written."""
+    import pygame
+    n = 0
+    if fmt == "png":
+        if not os.path.isdir(out):
+            os.makedirs(out)
+        for i in frames:
+            pygame.image.save(pygame.image.fromstring(i, (w, h), "RGB", True), os.path.join(out, "frame%05d.png" % n))
+            n += 1
+    else:
+        stdout = sys.stdout
+        if out == "-":
+            # keep messages printed by the game out of the stream
+            f, sys.stdout = sys.stdout, sys.stderr
+        else:
+            f = open(out, "wb")
+        try:
+            for i in frames:
+                f.write(flip_rows(i, w, h))
+                n += 1
+        finally:
+            sys.stdout = stdout
+            if f is not stdout:
+                f.close()
+    return n
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Render 4D Blocks game states offscreen.")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--actions", help="action stream file")
+    src.add_argument("--snapshots", help="pickled list of logic.logic instances")
+    p.add_argument("--out", required=True, help="output directory (png) or file (raw, - for standard output)")
+    p.add_argument("--format", choices=("png", "raw"), default="png")
+    p.add_argument("--size", default="640x480", help="frame size, WxH")
+    p.add_argument("--difficulty", type=int, default=2)
+    p.add_argument("--seed", type=int, default=0, help="random seed for the blocks sequence")
+    p.add_argument("--every", type=int, default=1, help="render a frame every that many actions")
+    p.add_argument("--platform", choices=sorted(contexts.keys()), default="egl")
+    p.add_argument("--camera", default="20,-15,-20", help="rotation around x, rotation around y, zoom")
+    args = p.parse_args(argv)
+    w, h = map(int, args.size.split("x"))
+    random.seed(args.seed)
+    r = Renderer(w, h, args.difficulty, args.platform)
+    r.set_camera(*map(float, args.camera.split(",")))
+    if args.actions:
+        frames = r.frames_from_actions(read_actions(args.actions), args.every)
+    else:
+        frames = r.frames_from_snapshots(pickle.load(open(args.snapshots, "rb")))
+    t = time.time()
+    n = export(frames, w, h, args.out, args.format)
+    t = time.time()-t
+    sys.stderr.write("%d frames in %.2f s: %.1f frames/sec (%.1f frames/sec rendering only)\n" % (n, t, n/max(t, 1e-9), r.frames/max(r.render_time, 1e-9)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
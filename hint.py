@@ -0,0 +1,128 @@
+# -*- coding: utf-8-*-
+"""This module suggests where to drop the current block: a worker process searches all orientations and positions of the block for the best landing pose, so the game's frame loop never waits for it.
+
+The board is mirrored to the worker through shared memory (a **multiprocessing.RawArray** of the bytes of :py:attr:`logic.logic.board`), which the game updates on each drop. Each search has a version number; the version wanted is kept in shared memory too, so the worker drops a search as soon as it's stale, and the game shows only the result of the version it asked for last."""
+
+import ctypes, multiprocessing, Queue
+import numpy
+import polycubes
+
+#: weights of the placement score: layers cleared, empty cells covered by the block, landing height (average y of its cells)
+score_weights           =   (10.0, -4.0, -1.0)
+
+def orientations(cells):
+    """Return the distinct orientations of the block *cells* (list of (x, y, z, w) tuples) as a list of arrays of shape (n, 4), translated to non-negative coordinates touching 0."""
+    c = numpy.array(cells, dtype=numpy.int64)
+    out = {}
+    for m in polycubes.rotation_group():
+        t = c.dot(m.T)
+        t -= t.min(axis=0)
+        out.setdefault(tuple(sorted(map(tuple, t.tolist()))), t)
+    return [out[i] for i in sorted(out.keys())]
+
+def best_placement(board, cells, cancelled=None):
+    """Return the best landing pose of the block *cells* (list of (x, y, z, w) tuples, relative) dropped straight down to the board view *board* (see :py:meth:`logic.logic.BoardView`) in any orientation and position, as a list of absolute (x, y, z, w) tuples, scored with :py:data:`score_weights`. Returns None if the block fits nowhere, or if *cancelled* (function taking no arguments) returns True, which is checked between orientations."""
+    height, w_depth, depth, width = board.shape
+    filled = board != 0
+    # the lowest free y above each column
+    top = (filled*numpy.arange(1, height+1)[:, None, None, None]).max(axis=0)
+    layer_counts = filled.reshape(height, -1).sum(axis=1)
+    layer_size = w_depth*depth*width
+    best, best_score = None, None
+    for t in orientations(cells):
+        if cancelled is not None and cancelled():
+            return None
+        ext = t.max(axis=0)+1
+        nx, nz, nw = width-ext[0]+1, depth-ext[2]+1, w_depth-ext[3]+1
+        if min(nx, nz, nw) <= 0 or ext[1] > height:
+            continue
+        # columns of the block with the lowest cell in each
+        bottoms = {}
+        for x, y, z, w in t.tolist():
+            bottoms[(x, z, w)] = min(y, bottoms.get((x, z, w), y))
+        y0 = numpy.zeros((nw, nz, nx), dtype=numpy.int64)
+        holes = numpy.zeros((nw, nz, nx), dtype=numpy.int64)
+        tops = []
+        for (x, z, w), y in bottoms.iteritems():
+            col = top[w:w+nw, z:z+nz, x:x+nx]
+            tops.append((col, y))
+            y0 = numpy.maximum(y0, col-y)
+        for col, y in tops:
+            holes += y0+y-col
+        valid = y0+ext[1] <= height
+        if not valid.any():
+            continue
+        # layers the block would complete
+        ys, counts = numpy.unique(t[:, 1], return_counts=True)
+        cleared = numpy.zeros((nw, nz, nx), dtype=numpy.int64)
+        for y, k in zip(ys, counts):
+            layer = numpy.minimum(y0+y, height-1)
+            cleared += (layer_counts[layer]+k == layer_size) & valid
+        score = score_weights[0]*cleared+score_weights[1]*holes+score_weights[2]*(y0+t[:, 1].mean())
+        score[~valid] = -numpy.inf
+        i = numpy.unravel_index(numpy.argmax(score), score.shape)
+        if best_score is None or score[i] > best_score:
+            best_score = score[i]
+            off = numpy.array([i[2], y0[i], i[1], i[0]])
+            best = [tuple(int(j) for j in p) for p in t+off]
+    return best
+
+def _serve(dims, board, wanted, requests, results):
+    """Worker process: search placements for requests *(version, cells)* from the queue *requests*, skipping to the newest one, and put *(version, cells)* of the results to the queue *results*; None stops it. Arguments are the ones made by :py:class:`HintWorker`."""
+    width, height, depth, w_depth = dims
+    view = numpy.frombuffer(board, dtype=numpy.uint8).reshape(height, w_depth, depth, width)
+    while True:
+        req = requests.get()
+        try:
+            while True:
+                req = requests.get_nowait()
+        except Queue.Empty:
+            pass
+        if req is None:
+            return
+        version, cells = req
+        # the game changes the version before writing the board, so a board copied before the version was still wanted is the right one
+        b = view.copy()
+        if wanted.value != version:
+            continue
+        out = best_placement(b, cells, lambda: wanted.value != version)
+        if wanted.value == version:
+            results.put((version, out))
+
+class HintWorker:
+    """This class runs a worker process searching placement hints for a domain and gives it the board and the current block."""
+    def __init__(self, width, height, depth, w_depth):
+        """*width*, *height*, *depth*, *w_depth* - int - sizes of the domain"""
+        self.board = multiprocessing.RawArray(ctypes.c_ubyte, width*height*depth*w_depth) #: mirror of the board, see :py:attr:`logic.logic.board`
+        self.wanted = multiprocessing.RawValue(ctypes.c_long, 0) #: version of the search wanted
+        self.version = 0 #: version of the last request
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve, args=((width, height, depth, w_depth), self.board, self.wanted, self.requests, self.results))
+        self.process.daemon = True
+        self.process.start()
+    def request(self, log):
+        """Start a search for the current block of *log* (instance of :py:class:`logic.logic`), cancelling the previous one. Returns its version."""
+        self.version += 1
+        self.wanted.value = self.version
+        ctypes.memmove(self.board, log.BoardBuffer().tobytes(), len(self.board))
+        self.requests.put((self.version, [(i.x, i.y, i.z, i.w) for i in log.cur_block]))
+        return self.version
+    def poll(self):
+        """Return the result of the last request (list of (x, y, z, w) tuples, None if the block fits nowhere) if it's ready, otherwise (or if the last request has no result yet) return False. Results of older requests are dropped."""
+        out = False
+        try:
+            while True:
+                version, cells = self.results.get_nowait()
+                if version == self.version:
+                    out = cells
+        except Queue.Empty:
+            pass
+        return out
+    def close(self):
+        """Stop the worker process."""
+        self.wanted.value = -1
+        self.requests.put(None)
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -1,37 +1,47 @@
 # -*- coding: utf-8-*-
 """This module contains classes and functions for input devices handling."""
 
-import pygame, sys
+import pygame, sys, collections
 
-def find_all(L, x):
-    """Find indexes of all occurrences of *x* in list *L*, and return a list of them."""
-    out = []
-    prev = -1
-    while 1:
-        try: 
-            prev = L.index(x,prev+1)
-            out.append(prev)
-        except:
-            return out
+PAD_STATES = 256 #: number of bits reserved for each joypad in the packed input state
 
-def is_part_of(L1, L2):
-    """Return True if *L2* contains all elements of *L1*, False otherwise."""
-    for i in L1:
-        if i not in L2:
-            return False
-    return True
+#: known joypad quirks, joystick name -> dict of quirks; **ignore_axes** - axes whose events are ignored
+pad_quirks = {
+    # DragonRise pads report a constantly jittering axis 2
+    "DragonRise Inc.   Generic   USB  Joystick  ": {"ignore_axes": (2,)},
+}
+
+#: joystick hot-plug event types (only pygame 2 has them)
+hotplug_events = tuple([getattr(pygame, i) for i in ("JOYDEVICEADDED", "JOYDEVICEREMOVED") if hasattr(pygame, i)])
+
+def set_bits(n):
+    """Return a list of indexes of bits set in the int *n*, starting from the lowest."""
+    out = []
+    while n:
+        low = n & -n
+        out.append(low.bit_length()-1)
+        n ^= low
+    return out
     
 def setup_joy(jid):
     """Setup joystick with the id *jid*. Returns instance of :py:class:`PadState` associated with that joystick."""
     joy = pygame.joystick.Joystick(jid)
-    print "Joystick %d name: %s" % (jid, joy.get_name())
+    name = joy.get_name()
+    print "Joystick %d name: %s" % (jid, name)
     joy.init()
     ax = joy.get_numaxes()
     bt = joy.get_numbuttons()
     ht = joy.get_numhats()
     print "Number of axes: %d\nNumber of buttons: %d" % (ax, bt)
     print "Number of hats: %d" % ht
-    return PadState(bt, ax, ht)
+    quirks = pad_quirks.get(name, {})
+    if quirks:
+        print "Using quirks: %s" % quirks
+    pad = PadState(bt, ax, ht, ignore_axes=quirks.get("ignore_axes", ()))
+    pad.name = name
+    # pygame 2 identifies joysticks in events by instance id, older versions by device index
+    pad.instance_id = joy.get_instance_id() if hasattr(joy, "get_instance_id") else jid
+    return pad
 
 class KeyBindings:
     """This class holds information about key bindings, and allows to bind function ids to input states."""
@@ -51,14 +61,33 @@ class KeyBindings:
             if max_func < 1:
                 raise Exception("Can't construct KeyBindings without a valid (>0) max_func number or init_bindings.")
             self.bindings = [[] for i in xrange(max_func)] 
+        self.compile()
+    def compile(self):
+        """Build the index used by :py:meth:`get_triggered` from the bindings: a bitmask of packed input states (see :py:meth:`InputState.state_bit`) for each function, and a mapping from each input state bit to the functions whose combos use it."""
+        self.masks = [] #: bitmask of input states for each function
+        self.index = {} #: input state bit -> list of functions using it
+        for f in xrange(len(self.bindings)):
+            mask = 0
+            for i in self.bindings[f]:
+                mask |= 1 << self.input_state.state_bit(*i)
+            self.masks.append(mask)
+            for i in set_bits(mask):
+                self.index.setdefault(i, []).append(f)
+        # functions with bigger combos take precedence
+        order = sorted(xrange(len(self.bindings)), key=lambda f: -len(self.bindings[f]))
+        self.rank = [0]*len(order)
+        for i in xrange(len(order)):
+            self.rank[order[i]] = i
+        self.state = 0 #: packed input state the triggered functions were resolved for
+        self.trig = 0 #: bitmask of functions whose combos are fully pressed
+        self.triggered = [] #: result of the last resolution
     def bind(self, f):
         """Bind function id *f* to the current input devices state."""
-        self.bindings[f] = []
-        for i in find_all(self.input_state.kbd_state, True):
-            self.bindings[f].append((0, i))    
+        self.bindings[f] = [(0, i) for i in set_bits(self.input_state.kbd_bits)]
         for i in xrange(len(self.input_state.joys_state)):
-            for j in find_all(self.input_state.joys_state[i].digi_state, True):
+            for j in set_bits(self.input_state.joys_state[i].bits):
                 self.bindings[f].append((i+1, j))
+        self.compile()
     def wait_and_bind(self, f, timer_evt_id=0, dt=10, timeout=100, loop_callback=None, quit_callback=sys.exit, neutral_key=pygame.K_ESCAPE):
         """Wait for state change and then bind function id *f* to the current input devices state.
         
@@ -95,35 +124,39 @@ class KeyBindings:
         return True
     def is_dev_state(self, dev_num_tpl):
         """Returns True if device id *dev_num_tpl[0]* has state id *dev_num_tpl[1]*, False otherwise."""
-        if dev_num_tpl[0]:
-            try:
-                out = self.input_state.joys_state[dev_num_tpl[0]-1].digi_state[dev_num_tpl[1]]
-            except:
-                out = False
-            return out
-        else:
-            return self.input_state.kbd_state[dev_num_tpl[1]]
+        return self.input_state.is_pressed(*dev_num_tpl)
     def is_triggered(self, f):
         """Return true if function *f* is triggered by the current state."""
-        if not self.bindings[f]: 
-            return False
-        for i in self.bindings[f]:
-            if not self.is_dev_state(i):
-                return False
-        return True
+        mask = self.masks[f]
+        return bool(mask) and (self.input_state.get_bits() & mask) == mask
     def get_triggered(self):
-        """Returns list of function ids triggered by the current state. If multiple functions are triggered by the same key combination (e.g. one is bound to **left**, another to **shift+left**), only the ones with the biggest combination sizes are returned (so in this case if **shift+left** is pressed, only the second function is returned)."""
-        out = find_all(map(self.is_triggered, xrange(len(self.bindings))), True) # find all triggered functions
-        out.sort(lambda x, y: cmp(len(self.bindings[y]), len(self.bindings[x]))) # sort them by combo size
-        # filter out shorter combos 
-        tmp = []
-        for i in xrange(len(out)):
-            if is_part_of(self.bindings[out[i]], tmp):
-                out = out[:i] + out[i+1:]
-            else:
-                for j in self.bindings[out[i]]:
-                    tmp.append(j)
-        return out
+        """Returns list of function ids triggered by the current state. If multiple functions are triggered by the same key combination (e.g. one is bound to **left**, another to **shift+left**), only the ones with the biggest combination sizes are returned (so in this case if **shift+left** is pressed, only the second function is returned).
+        
+        Only the functions using input states which changed since the last call are checked, if nothing changed the previous result is returned."""
+        state = self.input_state.get_bits()
+        changed = state ^ self.state
+        if not changed:
+            return list(self.triggered)
+        self.state = state
+        trig = self.trig
+        for i in set_bits(changed):
+            for f in self.index.get(i, ()):
+                mask = self.masks[f]
+                if state & mask == mask:
+                    trig |= 1 << f
+                else:
+                    trig &= ~(1 << f)
+        self.trig = trig
+        # filter out combos contained in bigger ones
+        out = []
+        covered = 0
+        for f in sorted(set_bits(trig), key=self.rank.__getitem__):
+            mask = self.masks[f]
+            if mask & covered != mask:
+                covered |= mask
+                out.append(f)
+        self.triggered = out
+        return list(out)
     def f_to_str(self, f):
         """Return a string representation of input states combo for function id *f*."""
         out = ""
@@ -145,51 +178,77 @@ class KeyBindings:
 
 class PadState:
     """This class holds the state for a joystick/gamepad."""
-    def __init__(self, btns, axes, hats, digi_ax_thr=0.9):
-        """*btns* - int - number of buttons; *axes* - int - number of axes; *hats* - int - number of hats; *digi_ax_thr* - float (0-1) threshold for treating analog axis position as digital 1"""
+    def __init__(self, btns, axes, hats, digi_ax_thr=0.9, ignore_axes=()):
+        """*btns* - int - number of buttons; *axes* - int - number of axes; *hats* - int - number of hats; *digi_ax_thr* - float (0-1) threshold for treating analog axis position as digital 1; *ignore_axes* - list of axes whose events are ignored (see :py:data:`pad_quirks`)"""
         self.btns = btns
         self.axes = axes
         self.hats = hats
         self.digi_ax_thr = digi_ax_thr
+        self.ignore_axes = frozenset(ignore_axes)
+        self.name = "" #: joystick name
+        self.instance_id = None #: joystick id used in pygame events
         self.reset()
     def reset(self):
         """Reset the state (nothing pressed, everything in neutral position)."""
-        self.digi_state = [False for i in xrange(self.btns + self.axes*2 + self.hats*4)] # b a h
+        self.bits = 0 #: digital state packed in an int, one bit for each element (buttons, then axes, then hats)
+    def get(self, n):
+        """Return state (bool) of the *n*-th element."""
+        return bool(self.bits >> n & 1)
+    def set(self, n, state):
+        """Set state of the *n*-th element to *state* (bool)."""
+        if state:
+            self.bits |= 1 << n
+        else:
+            self.bits &= ~(1 << n)
     def update_btn(self, btn, state):
-        """Update button *btn* (int) state to *state* (bool)."""
-        self.digi_state[btn] = state
+        """Update button *btn* (int) state to *state* (bool). Returns True if the state changed."""
+        old = self.bits
+        self.set(btn, state)
+        return self.bits != old
     def update_digi_axis(self, digi_ax, state):
         """Update axis *digi_ax* (int) state to *state* (bool)."""
-        self.digi_state[self.btns+digi_ax] = state
+        self.set(self.btns+digi_ax, state)
     def update_digi_axis_sticky(self, digi_ax, state):
         """Update axis *digi_ax* (int) state to *state* (bool), but don't change from True to False."""
-        self.digi_state[self.btns+digi_ax] |= state
+        if state: self.set(self.btns+digi_ax, True)
     def update_digi_hat(self, digi_hat, state):
         """Update hat *digi_hat* (int) state to *state* (bool)."""
-        self.digi_state[self.btns+self.axes*2+digi_hat] = state   
+        self.set(self.btns+self.axes*2+digi_hat, state)
     def update_digi_hat_sticky(self, digi_hat, state):
         """Update hat *digi_hat* (int) state to *state* (bool), but don't change from True to False."""
-        self.digi_state[self.btns+self.axes*2+digi_hat] |= state  
+        if state: self.set(self.btns+self.axes*2+digi_hat, True)
     def update_digi_axis_from_analog(self, ax_num, val):
-        """Update axis state from analog axis's number *ax_num* (int) value *val* (float)."""
+        """Update axis state from analog axis's number *ax_num* (int) value *val* (float). Returns True if the digital state changed, i.e. the value crossed the threshold; moves within a zone leave the state alone."""
+        if ax_num in self.ignore_axes:
+            return False
+        old = self.bits
         self.update_digi_axis(ax_num*2, val>self.digi_ax_thr)
         self.update_digi_axis(ax_num*2+1, (-val)>self.digi_ax_thr)
+        return self.bits != old
     def update_digi_axis_from_analog_sticky(self, ax_num, val):
-        """Update axis state from analog axis's number *ax_num* (int) value *val* (float), but don't change from True to False."""
+        """Update axis state from analog axis's number *ax_num* (int) value *val* (float), but don't change from True to False. Returns True if the digital state changed."""
+        if ax_num in self.ignore_axes:
+            return False
+        old = self.bits
         self.update_digi_axis_sticky(ax_num*2, val>self.digi_ax_thr)
         self.update_digi_axis_sticky(ax_num*2+1, (-val)>self.digi_ax_thr)
+        return self.bits != old
     def update_digi_hat_from_analog(self, hat_num, val):
-        """Update hat state from analog hat's number *hat_num* (int) value *val* (float)."""
+        """Update hat state from analog hat's number *hat_num* (int) value *val* (float). Returns True if the digital state changed."""
+        old = self.bits
         self.update_digi_hat(hat_num*4, val[0]>self.digi_ax_thr)
         self.update_digi_hat(hat_num*4+1, (-val[0])>self.digi_ax_thr)
         self.update_digi_hat(hat_num*4+2, val[1]>self.digi_ax_thr)
         self.update_digi_hat(hat_num*4+3, (-val[1])>self.digi_ax_thr)
+        return self.bits != old
     def update_digi_hat_from_analog_sticky(self, hat_num, val):
-        """Update hat state from analog hat's number *hat_num* (int) value *val* (float), but don't change from True to False."""
+        """Update hat state from analog hat's number *hat_num* (int) value *val* (float), but don't change from True to False. Returns True if the digital state changed."""
+        old = self.bits
         self.update_digi_hat_sticky(hat_num*4, val[0]>self.digi_ax_thr)
         self.update_digi_hat_sticky(hat_num*4+1, (-val[0])>self.digi_ax_thr)
         self.update_digi_hat_sticky(hat_num*4+2, val[1]>self.digi_ax_thr)
         self.update_digi_hat_sticky(hat_num*4+3, (-val[1])>self.digi_ax_thr)
+        return self.bits != old
     def digi_state_index_to_str(self, n):
         """Return a name (string) of the *n*-th element in state."""
         if n < self.btns:
@@ -204,86 +263,173 @@ class InputState:
     """This class holds state for input devices (keyboards end joysticks)."""
     def __init__(self, kbd_keys=512):
         """*kbd_keys* - optional int argument, the maximum number of keyboard keys."""
-        self.kbd_state = [False for i in xrange(kbd_keys)]
-        self.joys_state = []
+        self.kbd_keys = kbd_keys
+        self.kbd_bits = 0 #: keyboard state packed in an int, bit *n* is set if key *n* is pressed
+        self.joys_state = [] #: registry of joysticks, :py:class:`PadState` for each, in device order
+        self.joy_index = {} #: joystick id used in pygame events -> index in :py:attr:`joys_state`
     def reset(self):
         """Reset the current state to the initial one (nothing pressed)."""
-        self.kbd_state = [False for i in self.kbd_state]
+        self.kbd_bits = 0
         if self.joys_state:
             for i in self.joys_state: i.reset()
     def __str__(self):
         """Convert to human readable string."""
         out = "*** Input State ***\n"
         out += "Keys on keyboard pressed:"
-        for i in xrange(len(self.kbd_state)):
-            if self.kbd_state[i]: out += " [" + pygame.key.name(i) + "]" 
+        for i in set_bits(self.kbd_bits):
+            out += " [" + pygame.key.name(i) + "]" 
         for i in xrange(len(self.joys_state)):
-            out += ("\nPad %d digital state: " % i) + "".join(map(lambda x: str(int(x)), self.joys_state[i].digi_state))
+            pad = self.joys_state[i]
+            out += ("\nPad %d digital state: " % i) + "".join([str(int(pad.get(j))) for j in xrange(pad.btns + pad.axes*2 + pad.hats*4)])
         out += "\n*******************\n"
         return out
-    def get_composite_state():
-        """Return the representation of current input devices state as a list of 0/1s."""
-        state = [] + self.kbd_state
-        for i in self.joys_state:
-            state += i.digi_state
-        return state
+    def state_bit(self, dev, n):
+        """Return the index of the bit of state id *n* of device id *dev* (see :py:class:`KeyBindings`) in the packed state returned by :py:meth:`get_bits`."""
+        if dev:
+            return self.kbd_keys + (dev-1)*PAD_STATES + n
+        return n
+    def get_bits(self):
+        """Return the state of all input devices packed in an int, see :py:meth:`state_bit`."""
+        bits = self.kbd_bits
+        for i in xrange(len(self.joys_state)):
+            bits |= self.joys_state[i].bits << self.state_bit(i+1, 0)
+        return bits
+    def is_pressed(self, dev, n):
+        """Return True if device id *dev* has state id *n*, False otherwise."""
+        if dev:
+            if dev > len(self.joys_state):
+                return False
+            return self.joys_state[dev-1].get(n)
+        return bool(self.kbd_bits >> n & 1)
+    def update_key(self, key, state):
+        """Update keyboard key *key* (int) state to *state* (bool). Keys with ids beyond the maximum number of keys are ignored. Returns True if the state changed."""
+        if key >= self.kbd_keys:
+            return False
+        old = self.kbd_bits
+        if state:
+            self.kbd_bits |= 1 << key
+        else:
+            self.kbd_bits &= ~(1 << key)
+        return self.kbd_bits != old
+    def event_pad(self, ev):
+        """Return the :py:class:`PadState` of the joystick which sent the event *ev*, or None if it's not in the registry."""
+        i = self.joy_index.get(getattr(ev, "instance_id", None), None)
+        if i is None:
+            i = self.joy_index.get(ev.joy, None)
+        if i is None:
+            return None
+        return self.joys_state[i]
     def process_event_sticky(self, ev):
-        """Process event *ev* (instance of **pygame.event.Event**), but ignore key/button release events."""
+        """Process event *ev* (instance of **pygame.event.Event**), but ignore key/button release events. Returns True if the state changed."""
         if ev.type == pygame.KEYDOWN:
-            self.kbd_state[ev.key] = True
-            return True
-        elif ev.type == pygame.JOYAXISMOTION:
-            # DragonRise joypad workaround
-            if not (ev.axis == 2 and pygame.joystick.Joystick(ev.joy).get_name() == "DragonRise Inc.   Generic   USB  Joystick  "): 
-                self.joys_state[ev.joy].update_digi_axis_from_analog_sticky(ev.axis, ev.value)
-                return True
-        elif ev.type == pygame.JOYHATMOTION:
-            self.joys_state[ev.joy].update_digi_hat_from_analog_sticky(ev.hat, ev.value)
-            return True
-        elif ev.type == pygame.JOYBUTTONDOWN:
-            self.joys_state[ev.joy].update_btn(ev.button, True)
-            return True
+            return self.update_key(ev.key, True)
+        elif ev.type in (pygame.JOYAXISMOTION, pygame.JOYHATMOTION, pygame.JOYBUTTONDOWN):
+            pad = self.event_pad(ev)
+            if pad is None:
+                return False
+            if ev.type == pygame.JOYAXISMOTION:
+                return pad.update_digi_axis_from_analog_sticky(ev.axis, ev.value)
+            elif ev.type == pygame.JOYHATMOTION:
+                return pad.update_digi_hat_from_analog_sticky(ev.hat, ev.value)
+            return pad.update_btn(ev.button, True)
         else:
+            self.process_hotplug(ev)
             return False
     def process_event(self, ev):
-        """Process event *ev* (instance of **pygame.event.Event**)"""
+        """Process event *ev* (instance of **pygame.event.Event**). Returns True if the state changed; axis motion changes it only when the axis crosses the threshold, so callers can skip resolving bindings for the flood of other axis events."""
         if ev.type == pygame.KEYDOWN:
-            self.kbd_state[ev.key] = True
-            return True
+            return self.update_key(ev.key, True)
         elif ev.type == pygame.KEYUP:
-            self.kbd_state[ev.key] = False
-            return True
-        elif ev.type == pygame.JOYAXISMOTION:
-            # DragonRise joypad workaround
-            if not (ev.axis == 2 and pygame.joystick.Joystick(ev.joy).get_name() == "DragonRise Inc.   Generic   USB  Joystick  "): 
-                self.joys_state[ev.joy].update_digi_axis_from_analog(ev.axis, ev.value)
-                return True
-            #else:
-            #    print "Ignoring axis 2 movement event because it's from a DragonRise gamepad."
-        elif ev.type == pygame.JOYHATMOTION:
-            self.joys_state[ev.joy].update_digi_hat_from_analog(ev.hat, ev.value)
-            return True
-        elif ev.type == pygame.JOYBUTTONDOWN:
-            self.joys_state[ev.joy].update_btn(ev.button, True)
-            return True
-        elif ev.type == pygame.JOYBUTTONUP:
-            self.joys_state[ev.joy].update_btn(ev.button, False)
-            return True
+            return self.update_key(ev.key, False)
+        elif ev.type in (pygame.JOYAXISMOTION, pygame.JOYHATMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP):
+            pad = self.event_pad(ev)
+            if pad is None:
+                return False
+            if ev.type == pygame.JOYAXISMOTION:
+                return pad.update_digi_axis_from_analog(ev.axis, ev.value)
+            elif ev.type == pygame.JOYHATMOTION:
+                return pad.update_digi_hat_from_analog(ev.hat, ev.value)
+            return pad.update_btn(ev.button, ev.type == pygame.JOYBUTTONDOWN)
         else:
-            return False
+            return self.process_hotplug(ev)
+    def process_hotplug(self, ev):
+        """Refresh the joystick registry if *ev* is a joystick added/removed event (pygame 2 only). Returns True if it was."""
+        if ev.type in hotplug_events:
+            self.setup_joys()
+            return True
+        return False
+    def set_pads(self, pads):
+        """Make the list *pads* (of :py:class:`PadState`) the joystick registry, e.g. one recorded on another machine, and index it by the joystick ids used in pygame events (see :py:attr:`PadState.instance_id`)."""
+        self.joys_state = list(pads)
+        self.joy_index = dict([(self.joys_state[i].instance_id, i) for i in xrange(len(self.joys_state))])
     def setup_joys(self):
-        """Setup all joysitcks."""
+        """Setup all joysitcks, (re)building the registry. States of the joysticks are reset."""
         n = pygame.joystick.get_count()
         if n:
             print "Found %d joysticks" % n
-            for jid in xrange(n):
-                self.joys_state.append(setup_joy(jid))
         else:
             print "No joysticks found"
-            self.joys_state = []
+        self.set_pads([setup_joy(jid) for jid in xrange(n)])
     def uninit_joys(self):
         """Deinitialize all joysticks."""
         self.joys_state = []
+        self.joy_index = {}
         for i in xrange(pygame.joystick.get_count()):
             joy = pygame.joystick.Joystick(i)
             joy.quit()
+
+class RepeatScheduler:
+    """This class schedules auto-repeat of functions whose combos are held: a function is executed when its combo gets pressed, then again after an initial delay, and then at a fixed interval for as long as the combo stays pressed. It's driven by timestamps rather than timer events, so repeats happen when they're due instead of on a coarse timer grid."""
+    def __init__(self, delay=300, interval=200, norepeat=(), clock=pygame.time.get_ticks, max_catch_up=10, max_samples=10000):
+        """*delay* - int - time (msec) from pressing a combo to its first repeat; *interval* - int - time (msec) between repeats; *norepeat* - list of function ids which are never repeated; *clock* - function returning current time in msec; *max_catch_up* - int - maximum number of repeats of a function returned by one call to :py:meth:`due` (when the caller was late); *max_samples* - int - number of the latest repeat latencies kept for :py:meth:`latency_report`."""
+        self.delay, self.interval = delay, max(1, interval)
+        self.norepeat = set(norepeat)
+        self.clock = clock
+        self.max_catch_up = max_catch_up
+        self.reset()
+        self.repeat_latency = collections.deque(maxlen=max_samples) #: the latest measured latencies (msec) from the moment a repeat was due to its execution (input to state change latency is measured by :py:class:`input_rec.LatencyProbe`)
+    def set_timing(self, delay, interval):
+        """Set the initial *delay* and repeat *interval* (msec), see :py:meth:`__init__`."""
+        self.delay, self.interval = delay, max(1, interval)
+    def reset(self):
+        """Forget all held functions."""
+        self.held = {} #: held function id -> time its next repeat is due (None if it's not repeated)
+    def update(self, triggered, t=None):
+        """Update the set of held functions to the list *triggered* (e.g. from :py:meth:`KeyBindings.get_triggered`), *t* is the timestamp (msec) of the input event which caused the change, current time if not set. Returns list of newly pressed function ids, which should be executed now."""
+        if t is None:
+            t = self.clock()
+        for f in self.held.keys():
+            if f not in triggered:
+                del self.held[f]
+        new = [f for f in triggered if f not in self.held]
+        for f in new:
+            self.held[f] = None if f in self.norepeat else t+self.delay
+        return new
+    def due(self, t=None):
+        """Return list of function ids whose repeats are due at time *t* (msec, current time if not set), a function is listed once for each repeat due. Schedules the following repeats."""
+        if t is None:
+            t = self.clock()
+        out = []
+        for f, next_t in self.held.items():
+            if next_t is None or next_t > t:
+                continue
+            n = 0
+            while next_t <= t and n < self.max_catch_up:
+                out.append(f)
+                self.repeat_latency.append(t-next_t)
+                next_t += self.interval
+                n += 1
+            self.held[f] = max(next_t, t+1)
+        return out
+    def next_due(self):
+        """Return the time (msec) when the next repeat is due, or None if nothing is going to be repeated."""
+        times = [i for i in self.held.itervalues() if i is not None]
+        if times:
+            return min(times)
+        return None
+    def latency_report(self):
+        """Return a human readable summary of the lateness of repeats."""
+        s = sorted(self.repeat_latency)
+        if not s:
+            return "repeat: no samples"
+        return "repeat: %d samples, mean %.1f ms, median %d ms, max %d ms" % (len(s), sum(s)*1.0/len(s), s[len(s)/2], s[-1])
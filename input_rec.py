@@ -0,0 +1,277 @@
+# -*- coding: utf-8-*-
+"""This module contains event sources for the main loop of :py:mod:`game`: the live one, which can record the raw event stream to a file, and one playing a recording back. Both also probe input latency: the time from the arrival of an input event to the change of the game state it caused, and to the next flip of the screen.
+
+A recording is a text file, each line is the **repr** of a tuple: ``("header", {...})`` first (with the random seed, difficulty and window size), ``("pads", [...])`` with the joysticks registry, then ``("batch", t, [(type, attributes), ...])`` for each batch of events dequeued by the main loop at time *t* (msec, see **pygame.time.get_ticks**), including the empty ones. The registry is written again after each joystick hot-plug event, following the batch with the event. Playback replays the batches in order on a virtual clock, so the game goes through the same states each time, as fast as it can.
+
+Run as a script it records a session or plays a recording back (offscreen by default) and prints the latency report, e.g.::
+
+    python2 input_rec.py record session.rec
+    python2 input_rec.py play session.rec"""
+
+import os, sys, time, random, ast, atexit, argparse, collections
+import pygame
+
+RECORDING_VERSION = 1 #: version of the recording format
+max_samples = 10000 #: number of the latest latencies kept by :py:class:`LatencyProbe` for each measure, older ones are dropped
+
+def _literal(v):
+    """Return True if *v* can be written with **repr** and read back with **ast.literal_eval**."""
+    if v is None or isinstance(v, (bool, int, long, float, str, unicode)):
+        return True
+    if isinstance(v, (tuple, list)):
+        return all([_literal(i) for i in v])
+    return False
+
+def stats(samples):
+    """Return a human readable summary (count, mean, median, 95th percentile, max) of the sequence of latencies *samples* (msec)."""
+    if not samples:
+        return "no samples"
+    s = sorted(samples)
+    n = len(s)
+    return "%d samples, mean %.2f ms, median %.2f ms, p95 %.2f ms, max %.2f ms" % (n, sum(s)/n, s[n/2], s[min(n-1, n*95/100)], s[-1])
+
+class LatencyProbe:
+    """This class collects input latencies. Times are measured with the wall clock even on playback, so they show how long the game really takes to react."""
+    def __init__(self):
+        self.batch_time = time.time() #: wall clock time of the arrival of the current batch of events (sec)
+        self.current = None #: arrival time of the input event being processed, None if there's none
+        self.flip_pending = collections.deque(maxlen=max_samples) #: arrival times of input events which changed the state, but weren't shown yet
+        self.to_state = collections.deque(maxlen=max_samples) #: the latest latencies from input to state change (msec)
+        self.to_flip = collections.deque(maxlen=max_samples) #: the latest latencies from input to flip (msec)
+    def batch(self):
+        """Mark the arrival of a batch of events."""
+        self.batch_time = time.time()
+        self.current = None
+    def input(self, ev):
+        """Mark the start of processing of the input event *ev*, or its end if *ev* is None."""
+        self.current = None if ev is None else self.batch_time
+    def state_changed(self):
+        """Mark a change of the game state caused by the input event being processed."""
+        if self.current is not None:
+            self.to_state.append((time.time()-self.current)*1000.0)
+            self.flip_pending.append(self.current)
+            self.current = None
+    def flipped(self):
+        """Mark a flip of the screen."""
+        if self.flip_pending:
+            t = time.time()
+            self.to_flip.extend([(t-i)*1000.0 for i in self.flip_pending])
+            self.flip_pending.clear()
+    def report(self):
+        """Return a human readable report of the latencies."""
+        return "input to state change: %s\ninput to flip: %s" % (stats(self.to_state), stats(self.to_flip))
+
+class LiveSource:
+    """This class passes pygame events, time and the display calls to the game unchanged, optionally recording the events."""
+    def __init__(self, record=None, seed=None, difficulty=None):
+        """*record* - string - optional - name of the file to record events to; *seed* - int - optional - seed of the random number generator used for the blocks sequence (by default it's taken from the time when recording, and left alone otherwise); *difficulty* - int - optional - difficulty level written to the recording header."""
+        self.probe = LatencyProbe()
+        self.out = None
+        self.posted = [] #: events posted by the game and not dequeued yet, they aren't recorded
+        if seed is None and record:
+            seed = int(time.time())
+        if seed is not None:
+            random.seed(seed)
+        if record:
+            self.out = open(record, "w")
+            atexit.register(self.close)
+            surf = pygame.display.get_surface()
+            size = surf.get_size() if surf else None
+            self.write(("header", {"version": RECORDING_VERSION, "seed": seed, "difficulty": difficulty, "size": size}))
+    def write(self, item):
+        """Write *item* as a line of the recording."""
+        self.out.write(repr(item)+"\n")
+    def close(self):
+        """Close the recording file."""
+        if self.out:
+            self.out.close()
+            self.out = None
+    def record(self, t, events):
+        """Record a batch of *events* dequeued at time *t*."""
+        out = []
+        for ev in events:
+            key = (ev.type, ev.dict)
+            if key in self.posted:
+                self.posted.remove(key)
+                continue
+            out.append((ev.type, dict([(k, v) for k, v in ev.dict.iteritems() if _literal(v)])))
+        self.write(("batch", t, out))
+    def set_pads(self, input_state):
+        """Record the joysticks registry of *input_state* (instance of :py:class:`input_dev.InputState`)."""
+        if self.out:
+            self.write(("pads", [(i.name, i.btns, i.axes, i.hats, i.instance_id) for i in input_state.joys_state]))
+    def hotplug(self, input_state, ev):
+        """Rebuild the joysticks registry of *input_state* from the devices plugged in after the hot-plug event *ev*, and record it."""
+        if input_state.process_hotplug(ev):
+            self.set_pads(input_state)
+    def get(self, wait=False):
+        """Return the list of pending events; if *wait* is True and there are none, wait for one first."""
+        if wait:
+            events = [pygame.event.wait()] + pygame.event.get()
+        else:
+            events = pygame.event.get()
+        self.probe.batch()
+        if self.out:
+            self.record(pygame.time.get_ticks(), events)
+        return events
+    def post(self, ev):
+        """Post event *ev* to the queue."""
+        if self.out:
+            self.posted.append((ev.type, ev.dict))
+        pygame.event.post(ev)
+    def get_ticks(self):
+        """Return the current time (msec)."""
+        return pygame.time.get_ticks()
+    def set_timer(self, evt, dt):
+        """Make event type *evt* appear every *dt* msec (0 stops it)."""
+        pygame.time.set_timer(evt, dt)
+    def tick(self, clock, fps_limit):
+        """Tick *clock* (instance of **pygame.time.Clock**) after a frame, waiting to keep the frame rate below *fps_limit*."""
+        clock.tick(fps_limit)
+    def window_size(self):
+        """Return the size of the window."""
+        return pygame.display.get_surface().get_size()
+    def set_mode(self, w, h):
+        """Set display mode with window width *w* and height *h*."""
+        pygame.display.set_mode((w, h), pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
+    def flip(self):
+        """Show the frame drawn."""
+        pygame.display.flip()
+        self.probe.flipped()
+
+class PlaybackSource:
+    """This class feeds a recording made by :py:class:`LiveSource` to the game. The clock is virtual: it's set to the time of each batch as it's returned, and timers are replayed from the recording, so nothing waits."""
+    def __init__(self, filename, offscreen=True):
+        """*filename* - string - name of the recording; *offscreen* - bool - if True there's no window (the game has to be drawn to an offscreen context, see :py:mod:`headless`), so setting the display mode and flipping are skipped."""
+        self.probe = LatencyProbe()
+        self.offscreen = offscreen
+        self.header, self.pads, self.batches = {}, [], []
+        self.pads_pos = 0 #: index of the next registry in :py:attr:`pads` to install
+        for line in open(filename):
+            line = line.strip()
+            if not line:
+                continue
+            item = ast.literal_eval(line)
+            if item[0] == "header":
+                self.header = item[1]
+            elif item[0] == "pads":
+                self.pads.append(item[1])
+            elif item[0] == "batch":
+                self.batches.append((item[1], item[2]))
+        if self.header.get("version") != RECORDING_VERSION:
+            raise Exception("Unsupported recording version: %s" % self.header.get("version"))
+        if self.header.get("seed") is not None:
+            random.seed(self.header["seed"])
+        self.pos = 0 #: index of the next batch
+        self.now = self.batches[0][0] if self.batches else 0 #: virtual time (msec)
+        self.posted = [] #: events posted by the game, returned with the next batch
+        self.finished = False #: was the whole recording played back
+    def set_pads(self, input_state):
+        """Replace the joysticks registry of *input_state* (instance of :py:class:`input_dev.InputState`) with the next recorded one; the last one is kept once they run out."""
+        import input_dev
+        if not self.pads:
+            return
+        out = []
+        for name, btns, axes, hats, instance_id in self.pads[min(self.pads_pos, len(self.pads)-1)]:
+            pad = input_dev.PadState(btns, axes, hats, ignore_axes=input_dev.pad_quirks.get(name, {}).get("ignore_axes", ()))
+            pad.name, pad.instance_id = name, instance_id
+            out.append(pad)
+        self.pads_pos += 1
+        input_state.set_pads(out)
+    def hotplug(self, input_state, ev):
+        """Install the registry recorded after the hot-plug event *ev* in *input_state*, the devices plugged in now don't matter."""
+        import input_dev
+        if ev.type in input_dev.hotplug_events:
+            self.set_pads(input_state)
+    def get(self, wait=False):
+        """Return the next recorded batch of events (together with the ones posted by the game), or a **pygame.QUIT** event after the last one. *wait* is ignored."""
+        events = [pygame.event.Event(*i) for i in self.posted]
+        self.posted = []
+        if self.pos < len(self.batches):
+            self.now, batch = self.batches[self.pos]
+            self.pos += 1
+            events.extend([pygame.event.Event(t, d) for t, d in batch])
+        else:
+            self.finished = True
+            events.append(pygame.event.Event(pygame.QUIT))
+        self.probe.batch()
+        return events
+    def post(self, ev):
+        """Post event *ev*, it's returned with the next batch."""
+        self.posted.append((ev.type, ev.dict))
+    def get_ticks(self):
+        """Return the virtual time (msec)."""
+        return self.now
+    def set_timer(self, evt, dt):
+        """Timers are replayed from the recording, this does nothing."""
+        pass
+    def tick(self, clock, fps_limit):
+        """Tick *clock* without limiting the frame rate."""
+        clock.tick()
+    def window_size(self):
+        """Return the recorded window size."""
+        return tuple(self.header.get("size") or (640, 480))
+    def set_mode(self, w, h):
+        """Set display mode, unless playing back offscreen."""
+        if not self.offscreen:
+            pygame.display.set_mode((w, h), pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
+    def flip(self):
+        """Show the frame drawn, unless playing back offscreen."""
+        if not self.offscreen:
+            pygame.display.flip()
+        self.probe.flipped()
+
+def run(source, difficulty, conf=None):
+    """Run :py:func:`game.main` with event source *source* until it exits. Returns the game module."""
+    import game, settings
+    if conf is None:
+        conf = settings.Settings()
+        if not conf.load():
+            print "Couldn't load settings, using defaults instead."
+    try:
+        game.main(conf, difficulty, source)
+    except SystemExit:
+        pass
+    return game
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Record 4D Blocks input or play it back and report input latency.")
+    p.add_argument("mode", choices=("record", "play"))
+    p.add_argument("file", help="recording file")
+    p.add_argument("--difficulty", type=int, default=2, help="difficulty level (when recording)")
+    p.add_argument("--seed", type=int, help="random seed (when recording), by default taken from the time")
+    p.add_argument("--window", action="store_true", help="play back in a window instead of offscreen")
+    p.add_argument("--platform", default="egl", help="offscreen platform for playback, see headless.py")
+    args = p.parse_args(argv)
+    if args.mode == "record":
+        pygame.init()
+        pygame.display.set_mode((640, 480), pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
+        pygame.display.set_caption("4DeBlock")
+        source = LiveSource(args.file, args.seed, args.difficulty)
+        difficulty = args.difficulty
+    else:
+        if not args.window:
+            import headless
+            headless.use_platform(args.platform)
+        pygame.init()
+        source = PlaybackSource(args.file, not args.window)
+        w, h = source.window_size()
+        if args.window:
+            pygame.display.set_mode((w, h), pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
+        else:
+            context = headless.contexts[args.platform](w, h) # keep the context alive while playing
+        difficulty = source.header.get("difficulty")
+        if difficulty is None:
+            difficulty = args.difficulty
+    t = time.time()
+    run(source, difficulty)
+    t = time.time()-t
+    if args.mode == "record":
+        source.close()
+    print "Ran for %.2f s" % t
+    print source.probe.report()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
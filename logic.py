@@ -1,7 +1,7 @@
 # -*- coding: utf-8-*-
 """This module provides game logic for 4D tetris-like game, with the \"Y\" dimension being the one in which blocks fall."""
 
-import random, copy, operator
+import random, copy, operator, array
 
 class p4d:
     """This class represents a point in 4-dimensional space with color index assigned."""
@@ -76,6 +76,22 @@ YZ = 3 #: Rotation in Y-Z plane.
 YW = 4 #: Rotation in Y-W plane.
 ZW = 5 #: Rotation in Z-W plane.
 
+#: mapping of difficulty level to domain size (width, height, depth, w_depth)
+difficulty2dim = (
+                    (4,14,4,2),
+                    (5,10,5,2),
+                    (5,10,5,3)
+)
+
+# change flags, see logic.TakeChanges
+CHANGE_POSE = 1 #: The current block moved (its offset changed).
+CHANGE_SHAPE = 2 #: The cells of the current block changed relative to its offset (rotation or a new block).
+CHANGE_CELLS = 4 #: Cells were added to the space.
+CHANGE_LAYERS = 8 #: Layers were cleared.
+CHANGE_NEXT = 16 #: The next block changed.
+CHANGE_SCORE = 32 #: The score changed.
+CHANGE_ALL = 63 #: All of the above.
+
 #exceptions
 BlkNotFit = Exception("Block does not fit in the domain.") #: Exception thrown when a block doesn't fit the domain in it's initial position.
 
@@ -123,22 +139,34 @@ class logic:
     """This class contains game logic, that is the current game state, 
 methods to change this state and state-change rules. It abstracts from the
 presentation of the game state."""
-    def __init__(self, width, height, depth, w_depth, blocks=defaulf_blocks, num_colors=8):
-        """*width*, *height*, *depth*, *w_depth* - int - sizes of the space in 4 dimensions; *blocks* - optional - list of lists of p4d - list of blocks to choose from; *num_colors* - optional - int - number of color indexes to cycle through"""
+    def __init__(self, width, height, depth, w_depth, blocks=defaulf_blocks, num_colors=8, seed=None):
+        """*width*, *height*, *depth*, *w_depth* - int - sizes of the space in 4 dimensions; *blocks* - optional - list of lists of p4d - list of blocks to choose from; *num_colors* - optional - int - number of color indexes to cycle through; *seed* - optional - seed of a random number generator of this game, so its blocks sequence (and garbage) doesn't depend on anything else, by default the **random** module is used"""
         self.w, self.h, self.d, self.wd = width, height, depth, w_depth 
         self.space=[]
+        self.board = bytearray(width*height*depth*w_depth) #: dense copy of the space, indexed by :py:meth:`Index` (y-major, so a layer is contiguous); 0 is an empty cell, color index + 1 a filled one
+        self.layer_counts = [0]*height #: number of filled cells in each layer
+        self.cur_cells = array.array("h") #: cells of the current block, 5 values for each: x, y, z, w, color index
+        self.next_cells = array.array("h") #: cells of the next block, same layout as :py:attr:`cur_cells`
+        self.board_version = 0 #: incremented when the board changes
+        self.block_version = 0 #: incremented when the current block changes
+        self.next_version = 0 #: incremented when the next block changes
         self.blocks=blocks #: list of blocks available
+        self.rng = None if seed is None else random.Random(seed) #: random number generator of this game (instance of **random.Random**), None if the **random** module is used
         self.num_colors = num_colors
         self.next_col = 0
         self.CheckBlocks()
-        self.next_block = copy.deepcopy(random.choice(self.blocks))
+        self.next_block = copy.deepcopy(self.Rng().choice(self.blocks))
         self.blocks_dropped = 0 #: number of blocks dropped
         self.layers_cleared = 0 #: number of layers cleared
         self.score = 0 #: current score
         self.cur_block_offset = [0, 0, 0, 0] #: offset of current block from initial position
+        self.last_dropped = [] #: cells of the block dropped last (before clearing layers)
+        self.last_cleared = [] #: y-coordinates of the layers cleared by the last drop
+        self.changes = CHANGE_ALL #: change flags accumulated since the last :py:meth:`TakeChanges`
         self.NewBlocks()
         self.MovementImpossibleCallback = None
-        self.BlockDropedCallback = None
+        self.BlockRotatedCallback = None
+        self.BlockDroppedCallback = None
         self.LayersClearedCallback = None
         self.GameOverCallback = None
         self.ScoreFunction = None
@@ -169,16 +197,139 @@ presentation of the game state."""
             self.GameOver()
         self.cur_col = self.next_col
         for i in self.cur_block: i.col = self.cur_col
-        self.next_block = copy.deepcopy(random.choice(self.blocks)) 
+        self.next_block = copy.deepcopy(self.Rng().choice(self.blocks)) 
         self.next_col = (self.next_col+1) % self.num_colors
         for i in self.next_block: i.col = self.next_col
+        self.MarkChanged(CHANGE_POSE | CHANGE_SHAPE | CHANGE_NEXT)
+    def TakeChanges(self):
+        """Return the change flags (bitwise or of *logic.CHANGE_...* constants) accumulated since the last call and clear them, so that a presentation can update only what changed, once for any number of changes."""
+        c = self.changes
+        self.changes = 0
+        return c
+    def MarkChanged(self, flags=CHANGE_ALL):
+        """Add *flags* to the change flags, e.g. to make a presentation update everything. Versions of the views (see :py:meth:`BoardView`) are incremented accordingly."""
+        self.changes |= flags
+        if flags & (CHANGE_CELLS | CHANGE_LAYERS):
+            self.board_version += 1
+        if flags & (CHANGE_POSE | CHANGE_SHAPE):
+            self.cur_cells = self.FillCells(self.cur_cells, self.cur_block)
+            self.block_version += 1
+        if flags & CHANGE_NEXT:
+            self.next_cells = self.FillCells(self.next_cells, self.next_block)
+            self.next_version += 1
+    def FillCells(self, arr, cells):
+        """Store the list of p4ds *cells* in the array *arr* (see :py:attr:`cur_cells`) in place, so views of it stay valid, and return it. A new array is returned if the number of cells changed."""
+        data = []
+        for i in cells:
+            data.extend((i.x, i.y, i.z, i.w, i.col))
+        if len(data) != len(arr):
+            return array.array("h", data)
+        arr[:] = array.array("h", data)
+        return arr
+    def Rng(self):
+        """Return the random number generator of the game, :py:attr:`rng` or the **random** module."""
+        return self.rng or random
+    def Snapshot(self):
+        """Return the game state (all but the domain size, the blocks set and the callbacks) as a tuple of immutable values, to be given to :py:meth:`Restore`. The fallen cells are kept only as a copy of :py:attr:`board`, so the cost doesn't grow with the number of cells (only the blocks are copied cell by cell)."""
+        cells = lambda l: tuple([(i.x, i.y, i.z, i.w, i.col) for i in l])
+        return (str(self.board), tuple(self.layer_counts), cells(self.cur_block), cells(self.next_block), tuple(self.cur_block_offset),
+                self.cur_col, self.next_col, self.blocks_dropped, self.layers_cleared, self.score, cells(self.last_dropped), tuple(self.last_cleared), self.Rng().getstate())
+    def Restore(self, snap):
+        """Set the game state to *snap* made by :py:meth:`Snapshot` of a game with the same domain size, rebuilding the space from the board. Everything is marked changed (see :py:meth:`MarkChanged`)."""
+        board, counts, cur, next, off, self.cur_col, self.next_col, self.blocks_dropped, self.layers_cleared, self.score, dropped, cleared, rng = snap
+        self.board[:] = board
+        self.layer_counts = list(counts)
+        self.space = []
+        n = self.w*self.d
+        for i in xrange(len(self.board)):
+            if self.board[i]:
+                self.space.append(p4d(i%self.w, i/(n*self.wd), i/self.w%self.d, i/n%self.wd, self.board[i]-1))
+        self.cur_block = [p4d(*i) for i in cur]
+        self.next_block = [p4d(*i) for i in next]
+        self.cur_block_offset = list(off)
+        self.last_dropped = [p4d(*i) for i in dropped]
+        self.last_cleared = list(cleared)
+        self.Rng().setstate(rng)
+        self.MarkChanged()
+    def Index(self, x, y, z, w):
+        """Return the index of the cell *x*, *y*, *z*, *w* in :py:attr:`board`."""
+        return ((y*self.wd+w)*self.d+z)*self.w+x
+    def SetCell(self, p):
+        """Mark the cell at p4d *p* filled in :py:attr:`board`."""
+        self.board[self.Index(p.x, p.y, p.z, p.w)] = p.col+1
+        self.layer_counts[p.y] += 1
+    def RemoveLayer(self, y):
+        """Remove layer *y* from :py:attr:`board`, moving the layers above it down in place."""
+        n = self.w*self.d*self.wd
+        self.board[y*n:len(self.board)-n] = self.board[(y+1)*n:]
+        self.board[len(self.board)-n:] = bytearray(n)
+        del self.layer_counts[y]
+        self.layer_counts.append(0)
+    def AddGarbage(self, num):
+        """Push the space up by *num* layers of garbage coming from below: each is full but for one cell at a random position (the same in all layers). The current block is pushed up as well if it's in the way. Execute the **game over callback** if cells are pushed out of the domain or the block can't move up."""
+        n = self.w*self.d*self.wd
+        num = min(num, self.h)
+        if num <= 0 or not self.cur_block:
+            return
+        lost = sum(self.layer_counts[self.h-num:])
+        hole = self.Rng().randrange(n)
+        layer = bytearray([self.num_colors]*n) # color index num_colors-1, + 1
+        layer[hole] = 0
+        self.board[num*n:] = self.board[:len(self.board)-num*n]
+        self.board[:num*n] = layer*num
+        self.layer_counts = [n-1]*num + self.layer_counts[:self.h-num]
+        self.space = [i for i in self.space if i.y < self.h-num]
+        for i in self.space:
+            i.y += num
+        for y in xrange(num):
+            for j in xrange(n):
+                if j != hole:
+                    self.space.append(p4d(j%self.w, y, j/self.w%self.d, j/(self.w*self.d), self.num_colors-1))
+        self.MarkChanged(CHANGE_CELLS | CHANGE_LAYERS)
+        if lost:
+            self.cur_block = []
+            self.MarkChanged(CHANGE_SHAPE)
+            self.GameOver()
+            return
+        # move the block up by the least amount freeing it, without leaving the domain
+        for k in xrange(num+1):
+            if all([i.y+k < self.h and not self.board[self.Index(i.x, i.y+k, i.z, i.w)] for i in self.cur_block]):
+                if k:
+                    for i in self.cur_block:
+                        i.y += k
+                    self.cur_block_offset[1] += k
+                    self.MarkChanged(CHANGE_POSE)
+                return
+        self.cur_block = []
+        self.MarkChanged(CHANGE_SHAPE)
+        self.GameOver()
+    def BoardView(self):
+        """Return a read-only numpy array of shape *(height, w_depth, depth, width)* sharing memory with :py:attr:`board` (values as there), indexed *[y, w, z, x]*. It follows changes of the game state; compare :py:attr:`board_version` to notice them."""
+        import numpy
+        v = numpy.frombuffer(self.board, dtype=numpy.uint8).reshape(self.h, self.wd, self.d, self.w)
+        v.flags.writeable = False
+        return v
+    def BoardBuffer(self):
+        """Return a read-only memoryview of :py:attr:`board`, for consumers without numpy."""
+        return memoryview(buffer(self.board))
+    def CellsView(self, arr):
+        """Return a read-only numpy array of shape *(n, 5)* sharing memory with the cells array *arr* (:py:attr:`cur_cells` or :py:attr:`next_cells`)."""
+        import numpy
+        v = numpy.frombuffer(arr, dtype=numpy.int16).reshape(-1, 5) if len(arr) else numpy.zeros((0, 5), dtype=numpy.int16)
+        v.flags.writeable = False
+        return v
+    def CurrentBlockView(self):
+        """Return a read-only view (see :py:meth:`CellsView`) of cells of the current block, in the coordinates of the space. It stays valid until :py:attr:`block_version` changes."""
+        return self.CellsView(self.cur_cells)
+    def NextBlockView(self):
+        """Return a read-only view (see :py:meth:`CellsView`) of cells of the next block. It stays valid until :py:attr:`next_version` changes."""
+        return self.CellsView(self.next_cells)
     def CheckCollision(self):
         """Check if the current block in current position collides with something. If it collides with the fallen cells, returns True. If it collides with borders, try to move it so it doesn't. If that's successful, return the translation vector *[x, 0, z, w]* (the second element is always 0). If it's not, return True. Finally if no collision is detected, return False."""
         # is the block interfering with the space
         for i in self.cur_block:
-            for j in self.space:
-                if i==j:
-                    return True
+            if 0<=i.x<self.w and 0<=i.y<self.h and 0<=i.z<self.d and 0<=i.w<self.wd and self.board[self.Index(i.x, i.y, i.z, i.w)]:
+                return True
         # is the block to high/to low
         ys = [i.y for i in self.cur_block]
         if (min(ys)<0) or (max(ys)>=self.h): return True
@@ -216,32 +367,36 @@ presentation of the game state."""
         """Return a list of instances of *p4d* representing the parts of space already filled and the elements of the currently falling block."""
         return self.space+self.cur_block
     def GetCurrentBlock(self):
-        """Return a list of instances of *p4d* representing elements of the currently falling block."""
+        """Return a list of instances of *p4d* representing elements of the currently falling block (relative to its offset). See :py:meth:`CurrentBlockView` for a view which doesn't allocate."""
         return map(lambda p:p-self.cur_block_offset, self.cur_block)
     def ShadowY(self):
         """Calculate the shadow of the currently falling block and return it as a list of p4ds."""
         if not self.cur_block:
             return []
-        tmp = copy.deepcopy(self.cur_block)
-        for i in tmp:
-            i.y = 0
-        tmp.sort()
-        last = tmp[-1]
-        for i in range(len(tmp)-2, -1, -1):
-            if last == tmp[i]:
-                del tmp[i]
-            else:
-                last = tmp[i]
-        for i in tmp:
-            ys = map(lambda p: p.y, filter(lambda p: p.x==i.x and p.z==i.z and p.w==i.w,self.space)) 
-            if ys:
-                i.y = max(ys)+1
+        tmp = []
+        seen = set()
+        for i in self.cur_block:
+            if (i.x, i.z, i.w) in seen:
+                continue
+            seen.add((i.x, i.z, i.w))
+            y = self.h-1
+            while y >= 0 and not self.board[self.Index(i.x, y, i.z, i.w)]:
+                y -= 1
+            tmp.append(p4d(i.x, y+1, i.z, i.w, i.col))
         return tmp
+    def CanFall(self):
+        """Return True if the current block can be moved one step down, False otherwise (also when there is no current block)."""
+        if not self.cur_block:
+            return False
+        for i in self.cur_block:
+            if i.y < 1 or self.board[self.Index(i.x, i.y-1, i.z, i.w)]:
+                return False
+        return True
     def GetNextBlock(self):
         """Return a list of instances of *p4d* representing elements of the next block."""
         return self.next_block
     def Rotate(self, plane, direction):
-        """Rotate the current 90° block in the plane of rotation *plane* with direction, if it's possible. If successful, execute the **block rotated callback**. If not, execute the **movement rotated callback**.
+        """Rotate the current 90° block in the plane of rotation *plane* with direction, if it's possible. If successful, execute the **block rotated callback**. If not, execute the **movement impossible callback**.
         
         Possible values for *plane*: *logic.XY*, *logic.XZ*, *logic.XW*, *logic.YZ*, *logic.YW*, *logic.ZW*
         
@@ -258,6 +413,8 @@ presentation of the game state."""
         if col is not False:
             self.cur_block = tmp
             self.MovementImpossible()
+            return
+        self.MarkChanged(CHANGE_SHAPE)
         self.BlockRotated()
     def Translate_(self, vector):
         tmp = copy.deepcopy(self.cur_block)
@@ -267,6 +424,7 @@ presentation of the game state."""
             return True
         else:
             self.cur_block_offset = map(operator.add, self.cur_block_offset, vector)
+            self.MarkChanged(CHANGE_POSE)
             return False
     def Translate(self, v3d):
         """Translate the current block by the vector *[v3d[0], 0, v3d[1], v3d[2]]* if possible. If not, execute the **movement impossible callback**"""
@@ -279,29 +437,27 @@ presentation of the game state."""
             pass
     def CheckLayers(self):
         """Check if any 3d layers are cleared, return a list of y-coordinates of such layers."""
-        cleared = []
-        for i in xrange(self.h):
-            clear = True
-            layer = filter(lambda p: p.y==i, self.space)
-            for x in xrange(self.w):
-                for z in xrange(self.d):
-                    for w in xrange(self.wd):
-                        if p4d(x, i, z, w) not in layer:
-                            clear = False
-                            break
-            if clear: cleared.append(i)
-        return cleared
+        n = self.w*self.d*self.wd
+        return [i for i in xrange(self.h) if self.layer_counts[i] == n]
     def AdvanceFall(self):
         """Advance the fall of the current block by one step. If impossible, due to collision with fallen cells, check if any layers were cleared. If some are, execute the **layers cleared callback**. Then recalculate score using the **score function**, call :py:meth:`NewBlocks` and execute the **blocks dropped callback**. Return True if fall was advanced, False if not."""
         if self.Translate_([0,-1,0,0]):
             self.space+=self.cur_block
+            for i in self.cur_block:
+                self.SetCell(i)
+            self.last_dropped = [p4d(i.x, i.y, i.z, i.w, i.col) for i in self.cur_block] # copies, the cells in the space move when layers are cleared
             cleared = self.CheckLayers()
+            self.last_cleared = list(cleared)
             num_cleared = len(cleared)
+            self.MarkChanged(CHANGE_CELLS | CHANGE_SCORE)
             if num_cleared:
+                self.MarkChanged(CHANGE_LAYERS)
                 self.LayersCleared(cleared)
                 self.layers_cleared += num_cleared
                 self.score += self.ScoreFunc(0, num_cleared)
                 self.space = filter(lambda p:p.y not in cleared, self.space)
+                for l in reversed(cleared):
+                    self.RemoveLayer(l)
                 while cleared:
                     l = cleared[0]
                     cleared = cleared[1:]
@@ -1,10 +1,24 @@
 #!/usr/bin/python2
 # -*- coding: utf-8-*-
-import game, settings, pygame
+import sys, settings, pygame
+if "--versus" in sys.argv:
+    # a versus game over UDP, drawn without OpenGL, the rest of the arguments are versus.py's
+    import versus
+    sys.exit(versus.main(["human"]+sys.argv[sys.argv.index("--versus")+1:]))
 conf = settings.Settings()
 if not conf.load():
     print "Couldn't load settings, using defaults instead."  
 pygame.init()
 pygame.display.set_mode((640, 480), pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
 pygame.display.set_caption("4DeBlock")
+# the game module pulls in OpenGL and numpy, import it once the window is up
+import game
+if "--spectate" in sys.argv:
+    # stream the game to spectators on the port given, see spectator.py; only local ones unless --spectate-host names another address
+    import spectator
+    host = sys.argv[sys.argv.index("--spectate-host")+1] if "--spectate-host" in sys.argv else "127.0.0.1"
+    game.spectator = spectator.SpectatorServer((host, int(sys.argv[sys.argv.index("--spectate")+1])))
+if "--stats" in sys.argv:
+    # print input and resource statistics when the game ends
+    game.print_stats = True
 game.main(conf, 2)
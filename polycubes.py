@@ -0,0 +1,161 @@
+# -*- coding: utf-8-*-
+"""This module enumerates free 4D polycubes (blocks of cells connected through faces) of a given size, to be used as block sets for :py:class:`logic.logic`. Shapes of size n are grown from the ones of size n-1 by adding a neighbour cell, in a pool of processes, and deduplicated by a canonical form: the smallest (sorted, translated to the origin) cell list over the rotation group generated by :py:data:`logic.rot_mat`, optionally with reflections. Results are cached to disk. E.g.::
+
+    python2 polycubes.py 5
+    python2 polycubes.py 6 --reflections --fit 5x10x5x3
+
+The numbers of shapes of sizes 1 to 6 are 1, 1, 2, 7, 27, 164, or 1, 1, 2, 7, 26, 147 with reflections (mirror images of shapes lying in a 3D subspace are rotations in 4D, so the counts differ only from size 5)."""
+
+import os, sys, ast, argparse
+import numpy
+import logic
+
+cache_dir               =   "polycube_cache" #: directory of the shapes cache, None disables it
+cache_version           =   1               #: version of the cache format, part of the file names
+#: offsets of the 8 face neighbours of a cell
+neighbours              =   [tuple(s*(i == j) for j in xrange(4)) for i in xrange(4) for s in (1, -1)]
+
+def rotation_group(reflections=False):
+    """Return the group generated by :py:data:`logic.rot_mat` (192 matrices) as an array of shape (n, 4, 4), including the reflection of the w axis composed with each (384 matrices) if *reflections* is True. The identity is first."""
+    gens = [numpy.array(m.dat, dtype=numpy.int64) for m in logic.rot_mat]
+    if reflections:
+        gens.append(numpy.diag([1, 1, 1, -1]))
+    group = [numpy.identity(4, dtype=numpy.int64)]
+    seen = set([group[0].tobytes()])
+    n = 0
+    while n < len(group):
+        for g in gens:
+            m = g.dot(group[n])
+            key = m.tobytes()
+            if key not in seen:
+                seen.add(key)
+                group.append(m)
+        n += 1
+    return numpy.array(group)
+
+def canonical(cells, group):
+    """Return the canonical form of the shape *cells* (sequence of (x, y, z, w) tuples) under translation and the matrices *group* (see :py:func:`rotation_group`): the smallest of its sorted cell tuples, translated to non-negative coordinates touching 0, over all transformations."""
+    c = numpy.array(cells, dtype=numpy.int64)
+    n = len(c)
+    t = numpy.einsum("gij,nj->gni", group, c)
+    t -= t.min(axis=1)[:, None, :]
+    # a cell as one number (coordinates are below n), sorted cells as rows, the smallest row wins
+    codes = numpy.sort(((t[:, :, 0]*n+t[:, :, 1])*n+t[:, :, 2])*n+t[:, :, 3], axis=1)
+    best = codes[numpy.lexsort(codes.T[::-1])[0]]
+    return tuple([(int(i)/(n*n*n), int(i)/(n*n)%n, int(i)/n%n, int(i)%n) for i in best])
+
+_group = None #: rotation group of a worker process, see :py:func:`_init_worker`
+
+def _init_worker(reflections):
+    """Set up the rotation group in a worker process."""
+    global _group
+    _group = rotation_group(reflections)
+
+def _extend(shapes):
+    """Return the set of canonical forms of all shapes made by adding a face neighbour cell to one of *shapes* (list of canonical shapes), in a worker process."""
+    out = set()
+    for shape in shapes:
+        cells = set(shape)
+        for c in shape:
+            for d in neighbours:
+                p = (c[0]+d[0], c[1]+d[1], c[2]+d[2], c[3]+d[3])
+                if p not in cells:
+                    out.add(canonical(list(cells)+[p], _group))
+    return out
+
+def cache_file(n, reflections):
+    """Return the name of the cache file of shapes of size *n*."""
+    return os.path.join(cache_dir, "polycubes_v%d_n%d_%s.txt" % (cache_version, n, "r" if reflections else "nr"))
+
+def load_cached(n, reflections):
+    """Return the list of shapes of size *n* from the cache, None if they aren't there."""
+    if cache_dir is None:
+        return None
+    try:
+        return ast.literal_eval(open(cache_file(n, reflections)).read())
+    except (IOError, SyntaxError, ValueError):
+        return None
+
+def save_cached(n, reflections, shapes):
+    """Save the list of shapes of size *n* to the cache."""
+    if cache_dir is None:
+        return
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        name = cache_file(n, reflections)
+        f = open(name+".tmp", "w")
+        f.write(repr(shapes)+"\n")
+        f.close()
+        os.rename(name+".tmp", name)
+    except (IOError, OSError), e:
+        print "Warning: can't cache polycubes (%s)." % e
+
+def enumerate_shapes(n, reflections=False, processes=None, chunk=16):
+    """Return the sorted list of canonical forms (tuples of (x, y, z, w) tuples) of all free polycubes of *n* cells. *reflections* - bool - count mirror images as the same shape; *processes* - int - optional - size of the process pool (by default the number of CPUs, 1 doesn't start any); *chunk* - int - number of shapes given to a process at a time."""
+    shapes = load_cached(n, reflections)
+    if shapes is not None:
+        return shapes
+    if n <= 1:
+        shapes = [((0, 0, 0, 0),)]
+    else:
+        smaller = enumerate_shapes(n-1, reflections, processes, chunk)
+        parts = [smaller[i:i+chunk] for i in xrange(0, len(smaller), chunk)]
+        if processes == 1 or len(parts) == 1:
+            _init_worker(reflections)
+            found = map(_extend, parts)
+        else:
+            import multiprocessing
+            pool = multiprocessing.Pool(processes, _init_worker, (reflections,))
+            try:
+                found = pool.map(_extend, parts)
+            finally:
+                pool.close()
+                pool.join()
+        shapes = sorted(set().union(*found))
+    save_cached(n, reflections, shapes)
+    return shapes
+
+def orientation_fitting(shape, dims, group):
+    """Return the cells of *shape* in the first orientation (of the matrices *group*) in which it fits the domain of sizes *dims* (tuple of width, height, depth, w_depth) as required by :py:meth:`logic.logic.CheckBlocks`, None if there's none."""
+    c = numpy.array(shape, dtype=numpy.int64)
+    for m in group:
+        t = c.dot(m.T)
+        if ((t.max(axis=0)-t.min(axis=0)) < dims).all():
+            return t
+    return None
+
+def blocks(n, dims=None, reflections=False, processes=None):
+    """Return all free polycubes of *n* cells as a list of blocks (lists of :py:class:`logic.p4d`) for :py:class:`logic.logic`. Each block has the cell nearest to its center at the origin, so it rotates about it. If *dims* (tuple of width, height, depth, w_depth) is given, blocks are turned to an orientation fitting that domain, and the ones which don't fit in any are left out. Other arguments mean the same as in :py:func:`enumerate_shapes`."""
+    group = rotation_group(reflections)
+    out = []
+    for shape in enumerate_shapes(n, reflections, processes):
+        if dims is None:
+            cells = numpy.array(shape)
+        else:
+            cells = orientation_fitting(shape, dims, group)
+            if cells is None:
+                continue
+        center = cells[numpy.argmin(((cells-cells.mean(axis=0))**2).sum(axis=1))]
+        out.append([logic.p4d(*[int(j) for j in i-center]) for i in cells])
+    return out
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Enumerate free 4D polycubes.")
+    p.add_argument("n", type=int, help="maximum number of cells")
+    p.add_argument("--reflections", action="store_true", help="count mirror images as the same shape")
+    p.add_argument("--fit", help="count only shapes fitting a domain, e.g. 5x10x5x3")
+    p.add_argument("--processes", type=int, help="size of the process pool")
+    p.add_argument("--no-cache", action="store_true", help="don't use the cache")
+    args = p.parse_args(argv)
+    global cache_dir
+    if args.no_cache:
+        cache_dir = None
+    dims = tuple(map(int, args.fit.split("x"))) if args.fit else None
+    for n in xrange(1, args.n+1):
+        print "%d: %d" % (n, len(blocks(n, dims, args.reflections, args.processes)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
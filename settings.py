@@ -26,7 +26,7 @@ default_bindings = [
 _font_file = "/usr/share/fonts/TTF/DejaVuSans.ttf"
 
 #: default settings, used in the absence of **settings file**
-default_settings = { "font_filename": _font_file, "menu_font_filename": _font_file, "show_fps":True, "speed":5, "key_bindings":input_dev.KeyBindings(input_dev.InputState(), init_bindings=default_bindings) }
+default_settings = { "font_filename": _font_file, "menu_font_filename": _font_file, "show_fps":True, "speed":5, "repeat_delay":300, "repeat_interval":200, "show_hint":False, "key_bindings":input_dev.KeyBindings(input_dev.InputState(), init_bindings=default_bindings) }
 
 class Settings:
     """This class contains settings used by the game.
@@ -41,8 +41,10 @@ class Settings:
         """Sets setting *name* to *value*"""
         self.dat[name] = value
     def get(self, name):
-        """Returns value of setting *name*"""
-        return self.dat[name]
+        """Returns value of setting *name*, or its default value if it's not set (e.g. it's missing in an older settings file)"""
+        if name in self.dat:
+            return self.dat[name]
+        return self.def_sett[name]
     def reset(self):
         """Resets settings to defaults"""
         self.dat = self.def_sett
@@ -0,0 +1,341 @@
+# -*- coding: utf-8-*-
+"""This module streams a running game to spectators over TCP. A :py:class:`SpectatorServer` is fed the game state (a :py:class:`logic.logic` instance) once per tick by :py:meth:`SpectatorServer.publish`, and serviced without blocking by :py:meth:`SpectatorServer.poll`, so it runs inside the game's frame loop (see :py:data:`game.spectator`) or any other driver, e.g. a replay of an action stream.
+
+A client gets a keyframe first (the zlib-compressed board with the block pose and the score), then a delta for each tick in which something changed: the cells added by a dropped block, the layers removed, the pose of the current block and the score. Messages are encoded once per tick and the same string is queued for every client. A client whose queue grows over :py:attr:`SpectatorServer.max_buffer` bytes (it reads slower than the game changes) has its queued deltas dropped and gets the next keyframe once it has caught up.
+
+Each message is framed as a big endian 4-byte length (of the rest), a type byte (**K** keyframe, **D** delta) and the payload; :py:class:`Viewer` decodes the stream back into a board. Run as a script it serves a replay of an action stream (see :py:mod:`headless`), or connects viewers to a server and reports what they got, e.g.::
+
+    python2 spectator.py serve --actions actions.txt --port 7450
+    python2 spectator.py watch --port 7450 --clients 200 --slow 20"""
+
+import sys, time, socket, struct, zlib, asyncore, argparse
+
+MSG_KEYFRAME = "K" #: type of keyframe messages
+MSG_DELTA = "D" #: type of delta messages
+FLAG_POSE = 1 #: delta flag: the pose of the current block is included
+
+frame_head = struct.Struct(">IB") #: message framing: length of the type and payload, type
+key_head = struct.Struct(">IHHHHii") #: keyframe header: tick, width, height, depth, w_depth, score, blocks dropped
+delta_head = struct.Struct(">IiB") #: delta header: tick, score, flags
+
+def pack_frame(kind, payload):
+    """Return the message of type *kind* with *payload* (string), framed."""
+    return frame_head.pack(len(payload)+1, ord(kind)) + payload
+
+def pack_cells(cells):
+    """Return the list of (x, y, z, w, color) tuples *cells* encoded as a count and 5 shorts for each."""
+    flat = [j for i in cells for j in i]
+    return struct.pack(">H%dh" % len(flat), len(cells), *flat)
+
+def unpack_cells(data, pos):
+    """Decode cells encoded by :py:func:`pack_cells` from the string *data* at *pos*. Returns a tuple *(list of (x, y, z, w, color) tuples, position after them)*."""
+    n = struct.unpack_from(">H", data, pos)[0]
+    flat = struct.unpack_from(">%dh" % (5*n), data, pos+2)
+    return [flat[i:i+5] for i in xrange(0, 5*n, 5)], pos+2+10*n
+
+def pack_shorts(values):
+    """Return the list of ints *values* encoded as a count and a short for each."""
+    return struct.pack(">H%dh" % len(values), len(values), *values)
+
+def unpack_shorts(data, pos):
+    """Decode ints encoded by :py:func:`pack_shorts` from the string *data* at *pos*. Returns a tuple *(list of ints, position after them)*."""
+    n = struct.unpack_from(">H", data, pos)[0]
+    return list(struct.unpack_from(">%dh" % n, data, pos+2)), pos+2+2*n
+
+def block_pose(log):
+    """Return the cells of the current block of *log* (instance of :py:class:`logic.logic`) as a tuple of (x, y, z, w, color) tuples."""
+    return tuple([(i.x, i.y, i.z, i.w, i.col) for i in log.cur_block])
+
+class Channel(asyncore.dispatcher):
+    """This class is the connection to a single spectator, with the queue of messages to send it."""
+    def __init__(self, sock, server):
+        """*sock* - the accepted socket; *server* - :py:class:`SpectatorServer` it belongs to."""
+        asyncore.dispatcher.__init__(self, sock, map=server.map)
+        self.server = server
+        self.queue = [] #: messages to send, the first one partially sent if :py:attr:`sent` isn't 0
+        self.sent = 0 #: bytes of the first message sent
+        self.queued = 0 #: bytes in the queue, not sent yet
+        self.needs_key = True #: does the client need a keyframe before deltas
+        self.dropped = 0 #: number of times the queued deltas were dropped
+    def push(self, msg):
+        """Queue the message *msg* (string)."""
+        self.queue.append(msg)
+        self.queued += len(msg)
+    def drop(self):
+        """Drop the queued messages (except the partially sent one) and ask for a keyframe."""
+        keep = self.queue[:1] if self.sent else []
+        self.queued = sum([len(i) for i in keep])-self.sent
+        self.queue = keep
+        self.needs_key = True
+        self.dropped += 1
+    def writable(self):
+        """Is there anything to send."""
+        return bool(self.queue)
+    def handle_write(self):
+        """Send as much of the queue as the socket takes."""
+        while self.queue:
+            head = self.queue[0]
+            n = self.send(buffer(head, self.sent, self.server.send_size))
+            if not n:
+                return
+            self.sent += n
+            self.queued -= n
+            if self.sent < len(head):
+                return
+            self.queue.pop(0)
+            self.sent = 0
+    def handle_read(self):
+        """Spectators don't send anything, data is ignored."""
+        self.recv(4096)
+    def handle_close(self):
+        """Forget the client."""
+        self.server.channels.remove(self)
+        self.close()
+
+class SpectatorServer(asyncore.dispatcher):
+    """This class is the server publishing the game state to all connected spectators."""
+    def __init__(self, address=("127.0.0.1", 7450), max_buffer=256*1024, send_size=64*1024):
+        """*address* - tuple - host and port to listen on; *max_buffer* - int - maximum number of bytes queued for a client, over it its deltas are dropped; *send_size* - int - maximum number of bytes given to a socket at a time."""
+        self.map = {} #: asyncore socket map of the server and its channels
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(address)
+        self.listen(128)
+        self.address = self.socket.getsockname() #: address listened on (the port is known even if 0 was asked for)
+        self.max_buffer, self.send_size = max_buffer, send_size
+        self.channels = [] #: connected clients, instances of :py:class:`Channel`
+        self.tick = 0 #: number of the last tick published
+        self.state = None #: (logic instance, blocks dropped, block pose, score) at the last tick
+        self.keyframe = None #: keyframe message of the last tick, None if it wasn't made
+        self.stats = {"ticks": 0, "deltas": 0, "keyframes": 0, "bytes encoded": 0, "bytes queued": 0, "drops": 0}
+    def handle_accept(self):
+        """Accept a spectator, it gets a keyframe with the next tick."""
+        pair = self.accept()
+        if pair is not None:
+            pair[0].setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.channels.append(Channel(pair[0], self))
+    def make_keyframe(self, log):
+        """Return the keyframe message for the state of *log* (instance of :py:class:`logic.logic`)."""
+        head = key_head.pack(self.tick, log.w, log.h, log.d, log.wd, log.score, log.blocks_dropped)
+        msg = pack_frame(MSG_KEYFRAME, zlib.compress(head + str(log.board) + pack_cells(block_pose(log)), 6))
+        self.stats["keyframes"] += 1
+        self.stats["bytes encoded"] += len(msg)
+        return msg
+    def publish(self, log):
+        """Send the changes of the state of *log* (instance of :py:class:`logic.logic`) since the last call as a tick. A state which can't be sent as a delta (another game, or more than one block dropped since the last tick) is sent as a keyframe to everyone."""
+        pose, score = block_pose(log), log.score
+        old = self.state
+        self.state = (log, log.blocks_dropped, pose, score)
+        delta = None
+        if old is not None and old[0] is log and old[1:] == self.state[1:]:
+            # nothing changed, new clients get the keyframe of the last tick
+            if not [c for c in self.channels if c.needs_key]:
+                return
+        else:
+            self.tick += 1
+            self.stats["ticks"] += 1
+            self.keyframe = None
+            if old is None or old[0] is not log or log.blocks_dropped-old[1] > 1:
+                for c in self.channels:
+                    c.needs_key = True
+            else:
+                delta = ""
+        if delta is not None:
+            flags = FLAG_POSE if pose != old[2] else 0
+            added, layers = [], []
+            if log.blocks_dropped != old[1]:
+                added = [(i.x, i.y, i.z, i.w, i.col) for i in log.last_dropped]
+                layers = log.last_cleared
+            delta = pack_frame(MSG_DELTA, delta_head.pack(self.tick, score, flags) + pack_cells(added) + pack_shorts(layers) + (pack_cells(pose) if flags else ""))
+            self.stats["deltas"] += 1
+            self.stats["bytes encoded"] += len(delta)
+        for c in self.channels:
+            if c.needs_key:
+                # a slow client gets a keyframe only once it has sent what it had
+                if c.queued > self.max_buffer/2:
+                    continue
+                if self.keyframe is None:
+                    self.keyframe = self.make_keyframe(log)
+                c.push(self.keyframe)
+                c.needs_key = False
+                self.stats["bytes queued"] += len(self.keyframe)
+            elif delta:
+                if c.queued+len(delta) > self.max_buffer:
+                    c.drop()
+                    self.stats["drops"] += 1
+                    continue
+                c.push(delta)
+                self.stats["bytes queued"] += len(delta)
+    def poll(self, timeout=0.0):
+        """Accept clients and send queued data, waiting at most *timeout* seconds for the sockets."""
+        asyncore.loop(timeout, count=1, map=self.map)
+    def pending(self):
+        """Return the number of bytes queued for all clients."""
+        return sum([c.queued for c in self.channels])
+    def shutdown(self):
+        """Disconnect all clients and stop listening."""
+        for c in list(self.channels):
+            c.close()
+        self.channels = []
+        self.close()
+    def report(self):
+        """Return a human readable summary of the counters."""
+        return "%d clients, " % len(self.channels) + ", ".join(["%s: %d" % (i, self.stats[i]) for i in sorted(self.stats.keys())])
+
+class Viewer:
+    """This class rebuilds the game state from the stream of messages of :py:class:`SpectatorServer`."""
+    def __init__(self):
+        self.data = "" #: received data not decoded yet
+        self.dims = None #: domain size (width, height, depth, w_depth), None before the first keyframe
+        self.board = None #: board, laid out as :py:attr:`logic.logic.board`
+        self.pose = [] #: cells of the current block, (x, y, z, w, color) tuples
+        self.tick = 0 #: number of the last tick received
+        self.score = 0 #: score
+        self.keyframes = 0 #: number of keyframes received
+        self.deltas = 0 #: number of deltas received
+        self.skipped = 0 #: number of ticks missed (dropped by the server for being too slow)
+    def feed(self, data):
+        """Decode the received string *data*, applying all complete messages."""
+        self.data += data
+        pos = 0
+        while len(self.data)-pos >= frame_head.size:
+            n, kind = frame_head.unpack_from(self.data, pos)
+            if len(self.data)-pos-4 < n:
+                break
+            self.apply(chr(kind), self.data[pos+frame_head.size:pos+4+n])
+            pos += 4+n
+        self.data = self.data[pos:]
+    def apply(self, kind, payload):
+        """Apply the message of type *kind* with *payload*."""
+        if kind == MSG_KEYFRAME:
+            data = zlib.decompress(payload)
+            tick, w, h, d, wd, self.score, dropped = key_head.unpack_from(data)
+            self.dims = (w, h, d, wd)
+            size = w*h*d*wd
+            self.board = bytearray(data[key_head.size:key_head.size+size])
+            self.pose = unpack_cells(data, key_head.size+size)[0]
+            self.keyframes += 1
+        elif kind == MSG_DELTA and self.board is not None:
+            tick, self.score, flags = delta_head.unpack_from(payload)
+            if tick != self.tick+1:
+                self.skipped += tick-self.tick-1
+            added, pos = unpack_cells(payload, delta_head.size)
+            layers, pos = unpack_shorts(payload, pos)
+            if flags & FLAG_POSE:
+                self.pose = unpack_cells(payload, pos)[0]
+            w, h, d, wd = self.dims
+            for x, y, z, ww, col in added:
+                self.board[((y*wd+ww)*d+z)*w+x] = col+1
+            # the same order as logic.logic.AdvanceFall: the highest layer first
+            layer = w*d*wd
+            for y in reversed(layers):
+                del self.board[y*layer:(y+1)*layer]
+                self.board.extend(bytearray(layer))
+            self.deltas += 1
+        else:
+            return
+        self.tick = tick
+
+def serve(args):
+    """Replay an action stream with the game logic, publishing each action as a tick."""
+    import random, logic, key_num, headless
+    random.seed(args.seed)
+    dims = logic.difficulty2dim[args.difficulty]
+    log = logic.logic(*dims, num_colors=6)
+    actions = headless.read_actions(args.actions)
+    server = SpectatorServer((args.host, args.port), args.max_buffer)
+    print "Serving on %s:%d" % server.address
+    t = time.time()
+    while time.time()-t < args.wait:
+        server.poll(0.05)
+    for a in actions:
+        if not log.cur_block:
+            break
+        if a == "fall":
+            log.AdvanceFall()
+        else:
+            execute(log, a)
+        server.publish(log)
+        end = time.time()+1.0/args.rate
+        while True:
+            server.poll(max(0.0, end-time.time()))
+            if time.time() >= end:
+                break
+    # let the clients get the rest
+    t = time.time()
+    while server.pending() and time.time()-t < 5.0:
+        server.poll(0.05)
+    print server.report()
+    print "final tick %d, score %d, board crc %08x" % (server.tick, log.score, zlib.crc32(str(log.board)) & 0xffffffff)
+    server.shutdown()
+    return 0
+
+def execute(log, a):
+    """Apply the game function number *a* (see :py:mod:`key_num`) to *log*, as :py:func:`game.execute_triggered` does; other functions are ignored."""
+    import key_num
+    moves = {key_num.KEY_MOV_UP: [0,-1,0], key_num.KEY_MOV_DOWN: [0,1,0], key_num.KEY_MOV_LEFT: [-1,0,0], key_num.KEY_MOV_RIGHT: [1,0,0], key_num.KEY_MOV_LEFT_W: [0,0,-1], key_num.KEY_MOV_RIGHT_W: [0,0,1]}
+    if a in moves:
+        log.Translate(moves[a])
+    elif a == key_num.KEY_FORCE_DROP:
+        log.ForceDrop()
+        log.AdvanceFall()
+    elif key_num.KEY_ROT_XY_CW <= a <= key_num.KEY_ROT_ZW_CCW:
+        # the same mapping as game.func2rot: planes in order, clockwise first
+        log.Rotate(*divmod(a-key_num.KEY_ROT_XY_CW, 2))
+
+def watch(args):
+    """Connect viewers to a server, read until it disconnects and report what they got; every *slow*-th viewer reads only a little at a time."""
+    import select
+    viewers = {}
+    for i in xrange(args.clients):
+        s = socket.create_connection((args.host, args.port))
+        if args.slow and i % args.slow == 0:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        viewers[s] = (Viewer(), bool(args.slow and i % args.slow == 0))
+    open_ = list(viewers.keys())
+    while open_:
+        ready = select.select(open_, [], [], 10.0)[0]
+        if not ready:
+            break
+        for s in ready:
+            v, slow = viewers[s]
+            data = s.recv(512 if slow else 65536)
+            if not data:
+                open_.remove(s)
+                s.close()
+                continue
+            v.feed(data)
+            if slow:
+                time.sleep(0.002)
+    for label, sel in (("fast", False), ("slow", True)):
+        vs = [v for v, slow in viewers.values() if slow == sel]
+        if not vs:
+            continue
+        crcs = set(["%08x" % (zlib.crc32(str(v.board)) & 0xffffffff) for v in vs if v.board is not None])
+        print "%s viewers: %d, keyframes %d, deltas %d, ticks skipped %d, last tick %d-%d, board crcs %s" % (label, len(vs),
+            sum([v.keyframes for v in vs]), sum([v.deltas for v in vs]), sum([v.skipped for v in vs]),
+            min([v.tick for v in vs]), max([v.tick for v in vs]), " ".join(sorted(crcs)))
+    return 0
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Stream 4D Blocks games to spectators.")
+    p.add_argument("mode", choices=("serve", "watch"))
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=7450)
+    p.add_argument("--actions", help="action stream to replay (serve)")
+    p.add_argument("--difficulty", type=int, default=2, help="difficulty level (serve)")
+    p.add_argument("--seed", type=int, default=0, help="random seed for the blocks sequence (serve)")
+    p.add_argument("--rate", type=float, default=50.0, help="ticks per second (serve)")
+    p.add_argument("--wait", type=float, default=0.0, help="time to wait for clients before starting (serve, sec)")
+    p.add_argument("--max-buffer", type=int, default=256*1024, help="bytes queued for a client before its deltas are dropped (serve)")
+    p.add_argument("--clients", type=int, default=1, help="number of viewers (watch)")
+    p.add_argument("--slow", type=int, default=0, help="make every that many viewers slow, 0 for none (watch)")
+    args = p.parse_args(argv)
+    if args.mode == "serve":
+        return serve(args)
+    return watch(args)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
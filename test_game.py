@@ -0,0 +1,117 @@
+# -*- coding: utf-8-*-
+"""Tests of the static blocks of :py:mod:`game`, drawn with the fake OpenGL of :py:mod:`glstats`: frustum culling of the w-slices and rebuilding only the slices which changed."""
+
+import os, math, random, unittest
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import numpy
+import logic, glstats, headless
+
+def perspective(fovy, aspect, n, f):
+    """Return the projection matrix of **gluPerspective**, for row vectors (the way :py:func:`game.draw_sblocks` reads it back)."""
+    c = 1.0/math.tan(math.radians(fovy)*0.5)
+    m = numpy.zeros((4, 4))
+    m[0, 0], m[1, 1] = c/aspect, c
+    m[2, 2], m[2, 3], m[3, 2] = (f+n)/(n-f), 2.0*f*n/(n-f), -1.0
+    return m.T
+
+class BoxVisibleTest(unittest.TestCase):
+    def setUp(self):
+        import game
+        self.visible = game.box_visible
+    def test_clip_cube(self):
+        mvp = numpy.identity(4)
+        self.assertTrue(self.visible(((0, 0, 0), (0.5, 0.5, 0.5)), mvp))
+        self.assertTrue(self.visible(((-5, -5, -5), (5, 5, 5)), mvp))
+        self.assertTrue(self.visible(((0.9, -3, -3), (4, 3, 3)), mvp))
+        self.assertFalse(self.visible(((2, 2, 2), (3, 3, 3)), mvp))
+        self.assertFalse(self.visible(((-3, -0.5, -0.5), (-1.5, 0.5, 0.5)), mvp))
+        # out on x, in on y and z
+        self.assertFalse(self.visible(((1.1, -5, -5), (2, 5, 5)), mvp))
+    def test_perspective(self):
+        mvp = perspective(60.0, 1.0, 1.0, 100.0)
+        self.assertTrue(self.visible(((-1, -1, -11), (1, 1, -9)), mvp))
+        self.assertFalse(self.visible(((-1, -1, 9), (1, 1, 11)), mvp)) # behind the eye
+        self.assertFalse(self.visible(((-1, -1, -0.5), (1, 1, -0.1)), mvp)) # before the near plane
+        self.assertFalse(self.visible(((-1, -1, -300), (1, 1, -200)), mvp)) # past the far plane
+        self.assertFalse(self.visible(((30, -1, -11), (40, 1, -9)), mvp)) # to the side
+        self.assertTrue(self.visible(((5, -1, -11), (40, 1, -9)), mvp)) # partly in
+        # moved into the view by the modelview matrix
+        move = numpy.identity(4)
+        move[3, :3] = (-35, 0, 0)
+        self.assertTrue(self.visible(((30, -1, -11), (40, 1, -9)), numpy.dot(move, mvp)))
+
+class StaticBlocksTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        self.stats = glstats.install(glstats.FakeGL(320, 240))
+        r = headless.Renderer(320, 240, 2, None)
+        self.game = g = r.game
+        # single cells, so a drop touches one slice
+        g.set_logic(logic.logic(g.width, g.height, g.depth, g.w_depth, blocks=[[logic.p4d(0, 0, 0, 0)]], num_colors=len(g.colors)))
+        g.render()
+        self.built = []
+        self.slice_vertices = g.slice_vertices
+        def slice_vertices(w):
+            self.built.append(w)
+            return self.slice_vertices(w)
+        g.slice_vertices = slice_vertices
+    def tearDown(self):
+        self.game.slice_vertices = self.slice_vertices
+    def drop(self, x, z, w):
+        """Drop the current block at *x*, *z*, *w* and update the objects."""
+        log = self.game.log
+        log.Translate([x, z, w])
+        log.ForceDrop()
+        log.AdvanceFall()
+        self.game.update_objects()
+    def test_drop_rebuilds_its_slice(self):
+        g = self.game
+        self.assertEqual([i[1] for i in g.sb_chunks], [0, 0, 0])
+        self.drop(0, 0, 1)
+        self.assertEqual(self.built, [1])
+        self.assertEqual([i[1] for i in g.sb_chunks], [0, 24, 0])
+        self.drop(1, 1, 2)
+        self.assertEqual(self.built, [1, 2])
+        self.assertEqual([i[1] for i in g.sb_chunks], [0, 24, 24])
+        # nothing dropped, nothing rebuilt
+        g.log.Translate([1, 0, 0])
+        g.update_objects()
+        self.assertEqual(self.built, [1, 2])
+    def test_clear_rebuilds_all(self):
+        g = self.game
+        log = g.log
+        for x in xrange(g.width):
+            for z in xrange(g.depth):
+                for w in xrange(g.w_depth):
+                    if (x, z, w) != (0, 0, 0):
+                        log.SetCell(logic.p4d(x, 0, z, w))
+        self.drop(0, 0, 0)
+        self.assertEqual(log.layers_cleared, 1)
+        self.assertEqual(sorted(self.built), [0, 1, 2]) # in worker threads
+    def test_draw_skips_empty_and_culled(self):
+        g = self.game
+        self.drop(0, 0, 0)
+        self.drop(0, 0, 2)
+        def draw(box):
+            """Draw the static blocks with an orthographic view of *box*, return the number of draw calls."""
+            (l, b, n), (r, t, f) = box
+            g.glMatrixMode(g.GL_PROJECTION)
+            g.glLoadIdentity()
+            g.glOrtho(l, r, b, t, -f-1, -n+1)
+            g.glMatrixMode(g.GL_MODELVIEW)
+            g.glLoadIdentity()
+            self.stats.reset()
+            g.draw_sblocks()
+            return self.stats.by_name.get("glDrawArrays", 0)
+        lo, hi = g.slice_box(0)
+        self.assertEqual(draw((lo, hi)), 1)
+        self.assertEqual(g.sb_culled, 1) # slice 2, the empty slice 1 isn't even tested
+        lo2, hi2 = g.slice_box(2)
+        self.assertEqual(draw((numpy.minimum(lo, lo2), numpy.maximum(hi, hi2))), 2)
+        self.assertEqual(g.sb_culled, 0)
+        lo, hi = g.slice_box(1)
+        self.assertEqual(draw((lo, hi)), 0)
+        self.assertEqual(g.sb_culled, 2)
+
+if __name__ == "__main__":
+    unittest.main()
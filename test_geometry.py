@@ -0,0 +1,60 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`geometry`, which needs no OpenGL."""
+
+import unittest
+import numpy
+import logic, geometry
+
+colors = [[1,0,0],[0,1,0],[1,1,0],[0,0,1]]
+
+class GeometryTest(unittest.TestCase):
+    def test_palette(self):
+        p = geometry.palette([[1, 0.5, 0]], 0.5)
+        self.assertEqual(p.tolist(), [[128, 64, 0, 255]])
+    def test_cells_vertices(self):
+        v = geometry.cells_vertices(numpy.array([1, 2]), numpy.array([3, 0]), numpy.array([0, 1]), numpy.array([0, 2]), numpy.array([1, 3]), colors, w_step=10)
+        self.assertEqual(v.dtype, geometry.vertex_dtype)
+        self.assertEqual(v.dtype.itemsize, 12)
+        self.assertEqual(len(v), 48)
+        first, second = v["pos"][:24], v["pos"][24:]
+        # cubes span their cell, the w slice is moved by w_step and kept in the fourth coordinate
+        self.assertEqual(first[:, :3].min(axis=0).tolist(), [1, 3, 0])
+        self.assertEqual(first[:, :3].max(axis=0).tolist(), [2, 4, 1])
+        self.assertEqual(second[:, :3].min(axis=0).tolist(), [22, 0, 1])
+        self.assertEqual(sorted(set(second[:, 3].tolist())), [8, 9, 10, 11])
+        self.assertEqual(v["col"][0].tolist(), [0, 255, 0, 255])
+        self.assertEqual(v["col"][47].tolist(), [0, 0, 255, 255])
+    def test_board_slice_matches_cells(self):
+        log = logic.logic(*logic.difficulty2dim[2], num_colors=len(colors))
+        for p in [logic.p4d(0, 0, 0, 1, 2), logic.p4d(4, 1, 3, 1, 0), logic.p4d(2, 0, 2, 0, 1)]:
+            log.SetCell(p)
+        board = log.BoardView()
+        v = geometry.board_slice_vertices(board, 1, colors, w_step=6)
+        ref = geometry.cells_vertices(numpy.array([0, 4]), numpy.array([0, 1]), numpy.array([0, 3]), numpy.array([1, 1]), numpy.array([2, 0]), colors, w_step=6)
+        self.assertEqual(v.tobytes(), ref.tobytes())
+        self.assertEqual(len(geometry.board_slice_vertices(board, 2, colors)), 0)
+    def test_shadow_vertices(self):
+        v = geometry.shadow_vertices([logic.p4d(1, 2, 3, 1, 0)], colors, w_step=5)
+        self.assertEqual(len(v), 4)
+        self.assertEqual(set(v["pos"][:, 1].tolist()), set([2]))
+        self.assertEqual(v["pos"][:, 0].min(), 6)
+        self.assertEqual(v["col"][0].tolist(), [191, 0, 0, 255])
+        self.assertEqual(len(geometry.shadow_vertices([], colors)), 0)
+    def test_grid_wall_lines(self):
+        lines = geometry.grid_wall_lines(2, 0, 0, 3, 1, 2)
+        # 4 lines along y and 3 along x, two points each, all on the wall
+        self.assertEqual(lines.shape, (14, 3))
+        self.assertTrue((lines[:, 2] == 0).all())
+        segs = set([tuple(map(tuple, lines[i:i+2].tolist())) for i in xrange(0, len(lines), 2)])
+        self.assertEqual(len(segs), 7)
+    def test_outer_grid(self):
+        coor, table = geometry.outer_grid(4, 6, 3, 2, 1)
+        self.assertEqual(table.shape, (12, 8))
+        self.assertEqual(int(table[-1, 0]+table[-1, 1]), len(coor))
+        # walls follow each other, the second slice is moved by the width and the spacing
+        self.assertEqual((table[1:, 0] == table[:-1, 0]+table[:-1, 1]).all(), True)
+        self.assertEqual(coor[int(table[6, 0]):, 0].min(), 5)
+        self.assertEqual(numpy.abs(table[:, 5:]).sum(axis=1).tolist(), [1]*12)
+
+if __name__ == "__main__":
+    unittest.main()
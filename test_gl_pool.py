@@ -0,0 +1,144 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`gl_pool` with the fake OpenGL of :py:mod:`glstats`: reuse of resources between games and the upload modes of :py:class:`gl_pool.StreamBuffer`."""
+
+import os, random, unittest
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import numpy
+from OpenGL import GL
+import glstats, headless, gl_pool
+
+class RecordingGL(glstats.FakeGL):
+    """Fake OpenGL keeping what was written through buffer mappings and the ids of deleted buffers, whose fences time out the first *timeouts* times they're polled."""
+    def __init__(self, w=640, h=480, timeouts=0):
+        glstats.FakeGL.__init__(self, w, h)
+        self.timeouts = timeouts
+        self.written = [] #: (offset, data) of each mapping, when it's unmapped
+        self.ranges = [] #: offsets of the current mappings
+        self.deleted = [] #: ids of deleted buffers
+    def glDeleteBuffers(self, n, ids):
+        self.deleted.extend(ids)
+    def glMapBufferRange(self, target, offset, length, access):
+        self.ranges.append(offset)
+        return glstats.FakeGL.glMapBufferRange(self, target, offset, length, access)
+    def glUnmapBuffer(self, target):
+        for offset, buf in zip(self.ranges, self.mapped):
+            self.written.append((offset, buf.raw))
+        self.ranges = []
+        return glstats.FakeGL.glUnmapBuffer(self, target)
+    def glClientWaitSync(self, sync, flags, timeout):
+        if timeout == 0 and self.timeouts:
+            self.timeouts -= 1
+            return GL.GL_TIMEOUT_EXPIRED
+        return GL.GL_ALREADY_SIGNALED
+
+def data(n, fill):
+    """Return *n* bytes of vertex data, all *fill*."""
+    return numpy.zeros(n, dtype=numpy.uint8)+fill
+
+class StreamBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.gl = RecordingGL()
+        self.stats = glstats.install(self.gl)
+    def calls(self, name):
+        return self.stats.by_name.get(name, 0)
+    def test_ring_wraps_around(self):
+        b = gl_pool.StreamBuffer(100, 3, "ring")
+        self.assertTrue(b.fenced)
+        offsets = [b.upload(data(40, i)) for i in xrange(7)]
+        self.assertEqual(offsets, [100, 200, 0, 100, 200, 0, 100])
+        self.assertEqual(self.gl.written, [(offsets[i], chr(i)*40) for i in xrange(7)])
+        # a fence for each upload, each segment waited for once it comes round again
+        self.assertEqual(self.calls("glFenceSync"), 7)
+        self.assertEqual(self.calls("glClientWaitSync"), 5)
+        self.assertEqual(self.calls("glDeleteSync"), 5)
+        self.assertEqual((b.uploads, b.stalls), (7, 0))
+        b.delete()
+        self.assertEqual(self.calls("glDeleteSync"), 7)
+        self.assertEqual(b.fences, [None]*3)
+    def test_ring_stalls_on_busy_segment(self):
+        self.gl.timeouts = 1
+        b = gl_pool.StreamBuffer(100, 2, "ring")
+        for i in xrange(4):
+            b.upload(data(10, i))
+        self.assertEqual(b.stalls, 1)
+        # the stalled upload waited again, with a timeout
+        self.assertEqual(self.calls("glClientWaitSync"), 4)
+    def test_ring_empty_upload(self):
+        b = gl_pool.StreamBuffer(100, 2, "ring")
+        self.assertEqual(b.upload(data(0, 0)), 100)
+        self.assertEqual(self.calls("glMapBufferRange"), 0)
+    def test_orphan_and_static(self):
+        b = gl_pool.StreamBuffer(100, 3, "orphan")
+        self.stats.reset()
+        self.assertEqual([b.upload(data(40, i)) for i in xrange(4)], [0]*4)
+        self.assertEqual((self.calls("glBufferData"), self.calls("glBufferSubData"), self.calls("glFenceSync")), (4, 4, 0))
+        b = gl_pool.StreamBuffer(100, 3, "static")
+        self.stats.reset()
+        self.assertEqual([b.upload(data(40, i)) for i in xrange(4)], [0]*4)
+        self.assertEqual((self.calls("glBufferData"), self.calls("glBufferSubData"), self.calls("glFenceSync")), (0, 4, 0))
+        self.assertEqual(self.gl.written, [])
+
+class ResourcePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = glstats.install(glstats.FakeGL(320, 240))
+    def test_buffer(self):
+        pool = gl_pool.ResourcePool()
+        vbo, valid = pool.buffer("a", 100, key=1)
+        self.assertFalse(valid)
+        self.assertEqual(pool.buffer("a", 100, key=1), (vbo, True))
+        self.assertEqual(pool.buffer("a", 100, key=2), (vbo, False))
+        self.assertEqual(pool.buffer("a", 200, key=2), (vbo, False))
+        self.assertEqual([pool.stats["buffers "+i] for i in ("created", "allocated", "reused")], [1, 2, 2])
+        pool.release_buffer("a")
+        pool.release_buffer("a")
+        self.assertEqual(self.stats.by_name["glDeleteBuffers"], 1)
+        self.assertNotEqual(pool.buffer("a", 200)[0], vbo)
+    def test_stream_and_program(self):
+        pool = gl_pool.ResourcePool()
+        b = pool.stream("s", 100)
+        self.assertTrue(pool.stream("s", 100) is b)
+        self.assertTrue(pool.stream("s", 100, mode=b.mode) is b)
+        self.assertFalse(pool.stream("s", 200) is b)
+        built = []
+        build = lambda: built.append(1) or 7
+        self.assertEqual((pool.program("p", build), pool.program("p", build)), (7, 7))
+        self.assertEqual(built, [1])
+        self.assertEqual([pool.stats[i] for i in ("buffers created", "buffers reused", "programs created", "programs reused")], [2, 2, 1, 1])
+
+class GamesTest(unittest.TestCase):
+    def setUp(self):
+        import game
+        self.game = game
+        self.pool = game.pool
+        game.pool = gl_pool.ResourcePool()
+        random.seed(2)
+        self.gl = RecordingGL(320, 240)
+        self.stats = glstats.install(self.gl)
+        headless.Renderer(320, 240, 2, None)
+    def tearDown(self):
+        self.game.pool = self.pool
+    def test_next_game_reuses(self):
+        pool = self.game.pool
+        self.game.render()
+        created = dict(pool.stats)
+        self.game.start_game(2)
+        self.game.render()
+        for i in ("buffers created", "buffers allocated", "programs created", "fonts created"):
+            self.assertEqual(pool.stats[i], created[i])
+        for i in ("buffers reused", "fonts reused"):
+            self.assertTrue(pool.stats[i] > created[i])
+    def test_smaller_domain_releases_slices(self):
+        pool = self.game.pool
+        self.assertEqual(sorted([i for i in pool.buffers if i.startswith("static_blocks_")]), ["static_blocks_0", "static_blocks_1", "static_blocks_2"])
+        kept = [pool.buffers["static_blocks_%d" % i][0] for i in xrange(2)]
+        dropped = pool.buffers["static_blocks_2"][0]
+        self.game.start_game(1)
+        self.assertEqual(sorted([i for i in pool.buffers if i.startswith("static_blocks_")]), ["static_blocks_0", "static_blocks_1"])
+        self.assertEqual([pool.buffers["static_blocks_%d" % i][0] for i in xrange(2)], kept)
+        self.assertEqual(len(self.game.sb_chunks), 2)
+        self.assertTrue(dropped in self.gl.deleted)
+        self.assertFalse(set(kept) & set(self.gl.deleted))
+        self.game.render()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`glstats`: the game drawn with :py:class:`glstats.FakeGL` through :py:class:`headless.Renderer`, which needs no GPU."""
+
+import os, random, unittest
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import key_num, glstats, headless
+
+#: action stream played by the tests, see :py:func:`headless.read_actions`
+actions = ["fall", key_num.KEY_MOV_LEFT, key_num.KEY_ROT_XW_CW, "fall", key_num.KEY_FORCE_DROP, key_num.KEY_MOV_RIGHT, "fall", key_num.KEY_FORCE_DROP]
+
+class FakeRunTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(3)
+        self.stats = glstats.install(glstats.FakeGL(320, 240))
+        r = headless.Renderer(320, 240, 1, None)
+        self.stats.reset()
+        r.game.render()
+        self.stats.end_frame()
+        for i in actions:
+            r.apply(i)
+            r.game.render()
+            self.stats.end_frame()
+    def test_counts(self):
+        frames = self.stats.frames
+        self.assertEqual(len(frames), len(actions)+1)
+        for f in frames:
+            self.assertTrue(f["calls"] > 0)
+            self.assertTrue(f["draws"] > 0)
+            self.assertTrue(f["vertices"] > 0)
+            self.assertEqual(sum(f["by name"].values()), f["calls"])
+        # the first frame builds everything
+        self.assertTrue(frames[0]["upload"] > 0)
+        self.assertTrue(self.stats.report(1).startswith("%d frames, calls: max " % len(actions)))
+    def test_budgets(self):
+        generous = dict([(i, 1000000) for i in glstats.counters])
+        self.assertEqual(glstats.check(self.stats, generous), [])
+        self.assertEqual(glstats.check(self.stats, {"draws": None}), [])
+        over = glstats.check(self.stats, {"draws": 1}, skip=1)
+        self.assertEqual(len(over), len(actions))
+        self.assertTrue(over[0].startswith("frame 1: draws "))
+        self.assertTrue(over[0].endswith(" over budget 1"))
+    def test_install_again(self):
+        stats = glstats.install(glstats.FakeGL(320, 240))
+        r = headless.Renderer(320, 240, 1, None)
+        stats.reset()
+        r.game.render()
+        stats.end_frame()
+        self.assertTrue(stats.frames[0]["draws"] > 0)
+        # the earlier instance doesn't count any more
+        self.assertEqual(self.stats.current["calls"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`hint`: the placement search and its worker process."""
+
+import time, unittest
+import numpy
+import logic, hint
+
+def board(dims, filled):
+    """Return a board view (see :py:meth:`logic.logic.BoardView`) of the domain *dims* with the list of (x, y, z, w) cells *filled*."""
+    width, height, depth, w_depth = dims
+    b = numpy.zeros((height, w_depth, depth, width), dtype=numpy.uint8)
+    for x, y, z, w in filled:
+        b[y, w, z, x] = 1
+    return b
+
+dims = logic.difficulty2dim[0]
+
+class PlacementTest(unittest.TestCase):
+    def test_orientations(self):
+        self.assertEqual(len(hint.orientations([(0, 0, 0, 0)])), 1)
+        line = hint.orientations([(0, i, 0, 0) for i in xrange(3)])
+        self.assertEqual(len(line), 4)
+        for t in line:
+            self.assertEqual(t.min(axis=0).tolist(), [0, 0, 0, 0])
+    def test_fills_the_hole(self):
+        width, height, depth, w_depth = dims
+        layer = [(x, 0, z, w) for x in xrange(width) for z in xrange(depth) for w in xrange(w_depth) if (x, z, w) != (1, 2, 1)]
+        self.assertEqual(hint.best_placement(board(dims, layer), [(0, 0, 0, 0)]), [(1, 0, 2, 1)])
+    def test_lands_on_top(self):
+        b = board(dims, [(x, y, z, w) for x in xrange(dims[0]) for y in xrange(3) for z in xrange(dims[2]) for w in xrange(dims[3]) if (x+z+w+y) % 3])
+        out = hint.best_placement(b, [(0, 0, 0, 0), (1, 0, 0, 0), (1, 1, 0, 0), (1, 0, 1, 0)])
+        self.assertEqual(len(out), 4)
+        for x, y, z, w in out:
+            self.assertFalse(b[y, w, z, x])
+        # some cell rests on a filled one or the floor, none hangs over a free one it could fall into
+        self.assertTrue([i for i in out if i[1] == 0 or b[i[1]-1, i[3], i[2], i[0]]])
+        for x, y, z, w in out:
+            if y > 0 and (x, y-1, z, w) not in out:
+                self.assertTrue(b[:y, w, z, x].any())
+    def test_no_room(self):
+        full = board(dims, [(x, y, z, w) for x in xrange(dims[0]) for y in xrange(dims[1]) for z in xrange(dims[2]) for w in xrange(dims[3]) if y < dims[1]-1 or x or z or w])
+        # one free cell, at the top
+        self.assertEqual(hint.best_placement(full, [(0, 0, 0, 0)]), [(0, dims[1]-1, 0, 0)])
+        self.assertEqual(hint.best_placement(full, [(0, 0, 0, 0), (0, 1, 0, 0)]), None)
+        self.assertEqual(hint.best_placement(board(dims, []), [(0, i, 0, 0) for i in xrange(dims[1]+1)]), None)
+    def test_cancelled(self):
+        self.assertEqual(hint.best_placement(board(dims, []), [(0, 0, 0, 0)], lambda: True), None)
+
+class WorkerTest(unittest.TestCase):
+    def test_request_and_poll(self):
+        log = logic.logic(*dims)
+        worker = hint.HintWorker(*dims)
+        try:
+            old = worker.request(log)
+            version = worker.request(log)
+            self.assertEqual(version, old+1)
+            deadline = time.time()+10
+            out = False
+            while out is False and time.time() < deadline:
+                out = worker.poll()
+                time.sleep(0.01)
+            self.assertEqual(out, hint.best_placement(log.BoardView(), [(i.x, i.y, i.z, i.w) for i in log.cur_block]))
+            self.assertEqual(worker.poll(), False)
+        finally:
+            worker.close()
+        self.assertFalse(worker.process.is_alive())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`input_dev` which need no input devices."""
+
+import os, unittest
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import input_dev
+
+class Clock:
+    """Fake clock for :py:class:`input_dev.RepeatScheduler`, set by hand."""
+    def __init__(self):
+        self.t = 0
+    def __call__(self):
+        return self.t
+
+class RepeatSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.sched = input_dev.RepeatScheduler(delay=300, interval=100, norepeat=[9], clock=self.clock, max_catch_up=3)
+    def test_press_then_repeats(self):
+        self.assertEqual(self.sched.update([1], 1000), [1])
+        self.assertEqual(self.sched.update([1], 1010), [])
+        self.assertEqual(self.sched.next_due(), 1300)
+        self.assertEqual(self.sched.due(1299), [])
+        self.assertEqual(self.sched.due(1300), [1])
+        self.assertEqual(self.sched.next_due(), 1400)
+        self.assertEqual(self.sched.due(1420), [1])
+        self.assertEqual(list(self.sched.repeat_latency), [0, 20])
+    def test_latency_samples_are_bounded(self):
+        sched = input_dev.RepeatScheduler(delay=100, interval=100, clock=self.clock, max_samples=4)
+        sched.update([1], 0)
+        for t in xrange(100, 1100, 100):
+            sched.due(t+t/100)
+        self.assertEqual(list(sched.repeat_latency), [7, 8, 9, 10])
+        self.assertEqual(sched.latency_report(), "repeat: 4 samples, mean 8.5 ms, median 9 ms, max 10 ms")
+    def test_press_uses_clock_without_timestamp(self):
+        self.clock.t = 500
+        self.sched.update([1])
+        self.assertEqual(self.sched.next_due(), 800)
+    def test_catch_up_is_capped(self):
+        self.sched.update([1], 0)
+        self.assertEqual(self.sched.due(1000), [1]*3)
+        # the rest is dropped, the next repeat isn't in the past
+        self.assertTrue(self.sched.next_due() > 1000)
+    def test_release_and_norepeat(self):
+        self.assertEqual(sorted(self.sched.update([1, 9], 0)), [1, 9])
+        self.assertEqual(self.sched.due(1000), [1]*3)
+        self.sched.update([9], 1000)
+        self.assertEqual(self.sched.due(5000), [])
+        self.assertEqual(self.sched.next_due(), None)
+    def test_latency_report(self):
+        self.assertEqual(self.sched.latency_report(), "repeat: no samples")
+        self.sched.update([1], 0)
+        self.sched.due(310)
+        self.assertTrue(self.sched.latency_report().startswith("repeat: 1 samples, mean 10.0 ms"))
+
+class KeyBindingsTest(unittest.TestCase):
+    def setUp(self):
+        self.state = input_dev.InputState()
+        pad = input_dev.PadState(8, 2, 1)
+        pad.instance_id = 5
+        self.state.set_pads([pad])
+        # l, s+l, a pad button, s+pad button, nothing (keys with small ids, pygame 2 gives arrows and modifiers ids beyond the keyboard state)
+        self.keys = input_dev.KeyBindings(self.state, init_bindings=[[(0, pygame.K_l)], [(0, pygame.K_l), (0, pygame.K_s)], [(1, 3)], [(0, pygame.K_s), (1, 3)], []])
+    def key(self, key, down=True):
+        return self.state.process_event(pygame.event.Event(pygame.KEYDOWN if down else pygame.KEYUP, key=key, mod=0))
+    def button(self, button, down=True):
+        return self.state.process_event(pygame.event.Event(pygame.JOYBUTTONDOWN if down else pygame.JOYBUTTONUP, joy=0, instance_id=5, button=button))
+    def test_single_keys(self):
+        self.assertEqual(self.keys.get_triggered(), [])
+        self.assertTrue(self.key(pygame.K_l))
+        self.assertEqual(self.keys.get_triggered(), [0])
+        self.key(pygame.K_l, False)
+        self.assertEqual(self.keys.get_triggered(), [])
+    def test_bigger_combo_wins(self):
+        self.key(pygame.K_s)
+        self.assertEqual(self.keys.get_triggered(), [])
+        self.key(pygame.K_l)
+        self.assertEqual(self.keys.get_triggered(), [1])
+        self.key(pygame.K_s, False)
+        self.assertEqual(self.keys.get_triggered(), [0])
+    def test_devices_combined(self):
+        self.button(3)
+        self.assertEqual(self.keys.get_triggered(), [2])
+        self.key(pygame.K_l)
+        self.assertEqual(sorted(self.keys.get_triggered()), [0, 2])
+        self.key(pygame.K_s)
+        self.assertEqual(sorted(self.keys.get_triggered()), [1, 3])
+        self.button(3, False)
+        self.assertEqual(self.keys.get_triggered(), [1])
+    def test_unchanged_state_returns_a_copy(self):
+        self.key(pygame.K_l)
+        out = self.keys.get_triggered()
+        out.append(4)
+        self.assertEqual(self.keys.get_triggered(), [0])
+    def test_compile_after_rebinding(self):
+        self.keys.bindings[0] = [(0, pygame.K_a)]
+        self.keys.compile()
+        self.key(pygame.K_l)
+        self.assertEqual(self.keys.get_triggered(), [])
+        self.key(pygame.K_a)
+        self.assertEqual(self.keys.get_triggered(), [0])
+    def test_is_triggered(self):
+        self.key(pygame.K_l)
+        self.key(pygame.K_s)
+        # both are triggered, get_triggered returns only the bigger combo
+        self.assertTrue(self.keys.is_triggered(0))
+        self.assertTrue(self.keys.is_triggered(1))
+        self.assertFalse(self.keys.is_triggered(2))
+        self.assertFalse(self.keys.is_triggered(4))
+
+if __name__ == "__main__":
+    unittest.main()
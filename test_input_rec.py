@@ -0,0 +1,80 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`input_rec`: the joysticks registry recorded with the events is the one events are resolved with on playback."""
+
+import os, ast, shutil, tempfile, unittest
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import input_dev, input_rec
+
+class PlaybackPadsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.name = os.path.join(self.dir, "session.rec")
+        pad7 = ("Pad A", 8, 2, 1, 7)
+        pad9 = ("Pad B", 4, 2, 0, 9)
+        f = open(self.name, "w")
+        for item in [
+                ("header", {"version": input_rec.RECORDING_VERSION, "seed": 1, "difficulty": 0, "size": (320, 240)}),
+                ("pads", [pad7]),
+                # the recording machine's pads have instance ids which aren't device indexes
+                ("batch", 100, [(pygame.JOYBUTTONDOWN, {"joy": 0, "instance_id": 7, "button": 3})]),
+                ("batch", 200, [(pygame.JOYDEVICEADDED, {"device_index": 1}), (pygame.JOYBUTTONDOWN, {"joy": 1, "instance_id": 9, "button": 2})]),
+                ("pads", [pad7, pad9])]:
+            f.write(repr(item)+"\n")
+        f.close()
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    def play(self, source, state):
+        """Feed the next batch of *source* to *state* the way :py:func:`game.run` does."""
+        for ev in source.get():
+            if ev.type in input_dev.hotplug_events:
+                source.hotplug(state, ev)
+            else:
+                state.process_event(ev)
+    def test_recorded_registry_resolves_events(self):
+        source = input_rec.PlaybackSource(self.name)
+        state = input_dev.InputState()
+        source.set_pads(state)
+        self.assertEqual(state.joy_index, {7: 0})
+        self.play(source, state)
+        self.assertTrue(state.is_pressed(1, 3))
+    def test_hotplug_installs_next_registry(self):
+        source = input_rec.PlaybackSource(self.name)
+        state = input_dev.InputState()
+        source.set_pads(state)
+        self.play(source, state)
+        self.play(source, state)
+        self.assertEqual(state.joy_index, {7: 0, 9: 1})
+        self.assertEqual([i.name for i in state.joys_state], ["Pad A", "Pad B"])
+        self.assertTrue(state.is_pressed(2, 2))
+    def test_hotplug_is_recorded(self):
+        pygame.joystick.init()
+        name = os.path.join(self.dir, "live.rec")
+        source = input_rec.LiveSource(name, seed=1)
+        state = input_dev.InputState()
+        source.set_pads(state)
+        source.hotplug(state, pygame.event.Event(pygame.JOYDEVICEADDED, device_index=0))
+        source.close()
+        kinds = [ast.literal_eval(line)[0] for line in open(name)]
+        self.assertEqual(kinds, ["header", "pads", "pads"])
+
+class LatencyProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.max_samples = input_rec.max_samples
+        input_rec.max_samples = 5
+    def tearDown(self):
+        input_rec.max_samples = self.max_samples
+    def test_keeps_latest_samples(self):
+        probe = input_rec.LatencyProbe()
+        for i in xrange(12):
+            probe.batch()
+            probe.input(True)
+            probe.state_changed()
+            probe.input(None)
+            if i % 4 == 3:
+                probe.flipped()
+        self.assertEqual((len(probe.to_state), len(probe.to_flip), len(probe.flip_pending)), (5, 5, 0))
+        self.assertTrue(probe.report().startswith("input to state change: 5 samples"))
+
+if __name__ == "__main__":
+    unittest.main()
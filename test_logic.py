@@ -0,0 +1,201 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`logic`: seeded games, snapshots and garbage used by :py:mod:`versus`, the change flags and the views."""
+
+import unittest
+import logic, key_num
+from spectator import execute
+
+def play(log, moves):
+    """Apply the function numbers *moves* to *log*, advancing the fall after each."""
+    for a in moves:
+        if not log.cur_block:
+            return
+        execute(log, a)
+        log.AdvanceFall()
+
+def cells(l):
+    """Return the p4ds *l* as a sorted list of tuples."""
+    return sorted([(i.x, i.y, i.z, i.w, i.col) for i in l])
+
+#: function numbers played by the tests, dropping blocks at a few places and orientations
+moves = [key_num.KEY_MOV_LEFT, key_num.KEY_ROT_XY_CW, key_num.KEY_FORCE_DROP, key_num.KEY_MOV_RIGHT, key_num.KEY_MOV_RIGHT_W, key_num.KEY_FORCE_DROP,
+         key_num.KEY_ROT_ZW_CCW, key_num.KEY_MOV_UP, key_num.KEY_FORCE_DROP, key_num.KEY_MOV_DOWN, key_num.KEY_FORCE_DROP]*3
+
+class LogicTest(unittest.TestCase):
+    def make(self, seed=5):
+        return logic.logic(*logic.difficulty2dim[1], num_colors=6, seed=seed)
+    def assertConsistent(self, log):
+        """Check that the space, the board and the layer counts agree."""
+        for i in log.space:
+            self.assertEqual(log.board[log.Index(i.x, i.y, i.z, i.w)], i.col+1)
+        self.assertEqual(len(log.space), sum([1 for i in log.board if i]))
+        n = log.w*log.d*log.wd
+        self.assertEqual(log.layer_counts, [sum([1 for i in log.board[y*n:(y+1)*n] if i]) for y in xrange(log.h)])
+    def test_seed_makes_the_game(self):
+        a, b = self.make(), self.make()
+        play(a, moves)
+        play(b, moves)
+        self.assertEqual(a.Snapshot(), b.Snapshot())
+        self.assertEqual(cells(a.space), cells(b.space))
+    def test_snapshot_round_trip(self):
+        log = self.make()
+        play(log, moves[:12])
+        snap = log.Snapshot()
+        space = cells(log.space)
+        play(log, moves[12:])
+        after = log.Snapshot()
+        log.Restore(snap)
+        self.assertEqual(log.Snapshot(), snap)
+        self.assertEqual(cells(log.space), space)
+        self.assertConsistent(log)
+        # the restored game goes on as the original did, the random generator included
+        play(log, moves[12:])
+        self.assertEqual(log.Snapshot(), after)
+    def test_restore_into_other_game(self):
+        a, b = self.make(), self.make(seed=6)
+        play(a, moves)
+        b.Restore(a.Snapshot())
+        self.assertEqual(b.Snapshot(), a.Snapshot())
+        self.assertEqual(cells(b.space), cells(a.space))
+        self.assertEqual(cells(b.cur_block), cells(a.cur_block))
+    def test_snapshot_is_immutable(self):
+        log = self.make()
+        snap = log.Snapshot()
+        play(log, moves)
+        self.assertEqual(hash(snap), hash(self.make().Snapshot()))
+    def test_garbage(self):
+        log = self.make()
+        play(log, moves[:6])
+        dropped = sum(log.layer_counts)
+        block = cells(log.cur_block)
+        log.AddGarbage(2)
+        n = log.w*log.d*log.wd
+        self.assertEqual(log.layer_counts[:2], [n-1, n-1])
+        self.assertEqual(sum(log.layer_counts), dropped+2*(n-1))
+        self.assertEqual(str(log.board[:n]).index("\0"), str(log.board[n:2*n]).index("\0"))
+        self.assertConsistent(log)
+        self.assertTrue(log.cur_block)
+        for i in log.cur_block:
+            self.assertFalse(log.board[log.Index(i.x, i.y, i.z, i.w)])
+        # only pushed up
+        self.assertEqual(sorted([i[:1]+i[2:] for i in cells(log.cur_block)]), sorted([i[:1]+i[2:] for i in block]))
+    def test_garbage_overflow_ends_game(self):
+        log = self.make()
+        over = []
+        log.SetGameOverCallback(lambda: over.append(True))
+        play(log, moves[:3])
+        log.AddGarbage(log.h)
+        self.assertEqual(over, [True])
+        self.assertFalse(log.cur_block)
+        log.AddGarbage(1) # does nothing once the game is over
+        self.assertConsistent(log)
+
+class ChangesTest(unittest.TestCase):
+    def setUp(self):
+        # single cells falling into a 2x4x1x1 domain, one cell left of a full layer
+        self.log = logic.logic(2, 4, 1, 1, blocks=[[logic.p4d(0, 0, 0, 0)]], num_colors=3, seed=1)
+        self.assertEqual(self.log.TakeChanges(), logic.CHANGE_ALL)
+    def assertChanges(self, flags):
+        self.assertEqual(self.log.TakeChanges(), flags)
+        self.assertEqual(self.log.TakeChanges(), 0)
+    def test_move(self):
+        self.log.Translate([1, 0, 0])
+        self.assertChanges(logic.CHANGE_POSE)
+        self.log.Translate([1, 0, 0]) # into the wall
+        self.assertChanges(0)
+    def test_rotate(self):
+        self.log.Rotate(logic.XY, logic.CW)
+        self.assertChanges(logic.CHANGE_SHAPE)
+    def test_fall(self):
+        self.assertTrue(self.log.AdvanceFall())
+        self.assertChanges(logic.CHANGE_POSE)
+    def test_drop(self):
+        self.log.ForceDrop()
+        self.assertChanges(logic.CHANGE_POSE)
+        self.assertFalse(self.log.AdvanceFall())
+        self.assertChanges(logic.CHANGE_CELLS | logic.CHANGE_SCORE | logic.CHANGE_POSE | logic.CHANGE_SHAPE | logic.CHANGE_NEXT)
+    def test_drop_clearing_layer(self):
+        self.log.ForceDrop()
+        self.log.AdvanceFall()
+        self.log.Translate([1, 0, 0])
+        self.log.ForceDrop()
+        self.log.TakeChanges()
+        self.log.AdvanceFall()
+        self.assertEqual(self.log.layers_cleared, 1)
+        self.assertChanges(logic.CHANGE_ALL)
+    def test_garbage(self):
+        self.log.AddGarbage(1)
+        self.assertChanges(logic.CHANGE_CELLS | logic.CHANGE_LAYERS)
+        # the block sits on the garbage, the next layer pushes it up
+        self.log.ForceDrop()
+        self.log.TakeChanges()
+        self.log.AddGarbage(1)
+        self.assertChanges(logic.CHANGE_CELLS | logic.CHANGE_LAYERS | logic.CHANGE_POSE)
+    def test_restore(self):
+        snap = self.log.Snapshot()
+        self.log.Restore(snap)
+        self.assertChanges(logic.CHANGE_ALL)
+    def test_mark_changed(self):
+        self.log.MarkChanged(logic.CHANGE_NEXT)
+        self.log.MarkChanged(logic.CHANGE_SCORE)
+        self.assertChanges(logic.CHANGE_NEXT | logic.CHANGE_SCORE)
+
+class ViewsTest(unittest.TestCase):
+    def setUp(self):
+        self.log = logic.logic(*logic.difficulty2dim[1], num_colors=6, seed=5)
+    def versions(self):
+        return (self.log.board_version, self.log.block_version, self.log.next_version)
+    def test_board_follows_cells(self):
+        log = self.log
+        board, buf = log.BoardView(), log.BoardBuffer()
+        self.assertEqual(board.shape, (log.h, log.wd, log.d, log.w))
+        log.SetCell(logic.p4d(1, 0, 2, 1, 4))
+        log.SetCell(logic.p4d(0, 1, 0, 0, 2))
+        self.assertEqual(board[0, 1, 2, 1], 5)
+        self.assertEqual(buf[log.Index(1, 0, 2, 1)], chr(5))
+        self.assertEqual(board[1, 0, 0, 0], 3)
+        log.RemoveLayer(0)
+        self.assertEqual(board[0, 0, 0, 0], 3)
+        self.assertEqual(int(board[1:].sum()), 0)
+        self.assertEqual(buf.tobytes(), str(log.board))
+    def test_block_views_follow_moves(self):
+        log = self.log
+        cur, next = log.CurrentBlockView(), log.NextBlockView()
+        self.assertEqual(sorted(map(tuple, cur.tolist())), cells(log.cur_block))
+        self.assertEqual(sorted(map(tuple, next.tolist())), cells(log.next_block))
+        log.Translate([1, 0, 0])
+        self.assertEqual(sorted(map(tuple, cur.tolist())), cells(log.cur_block))
+        log.AdvanceFall()
+        self.assertEqual(sorted(map(tuple, cur.tolist())), cells(log.cur_block))
+    def test_versions_bump_on_change(self):
+        log = self.log
+        v = self.versions()
+        log.Translate([1, 0, 0])
+        self.assertEqual(self.versions(), (v[0], v[1]+1, v[2]))
+        log.Translate([-1, 0, 0])
+        v = self.versions()
+        log.Translate([-1, 0, 0]) # into the wall
+        log.TakeChanges()
+        self.assertEqual(self.versions(), v)
+        log.Rotate(logic.XY, logic.CW)
+        self.assertEqual(self.versions(), (v[0], v[1]+1, v[2]))
+        v = self.versions()
+        log.ForceDrop()
+        self.assertEqual(self.versions()[::2], v[::2])
+        log.AdvanceFall()
+        self.assertEqual(self.versions()[0], v[0]+1)
+        self.assertEqual(self.versions()[2], v[2]+1)
+        v = self.versions()
+        log.AddGarbage(1)
+        self.assertEqual(self.versions()[0], v[0]+1)
+        self.assertEqual(self.versions()[2], v[2])
+    def test_views_are_read_only(self):
+        log = self.log
+        self.assertRaises(ValueError, log.BoardView().__setitem__, (0, 0, 0, 0), 1)
+        self.assertRaises(ValueError, log.CurrentBlockView().__setitem__, (0, 0), 1)
+        self.assertRaises(ValueError, log.NextBlockView().__setitem__, (0, 0), 1)
+        self.assertRaises(TypeError, log.BoardBuffer().__setitem__, 0, chr(1))
+        self.assertEqual(sum(log.board), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`polycubes`, without the disk cache."""
+
+import unittest
+import numpy
+import logic, polycubes
+
+class PolycubesTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = polycubes.cache_dir
+        polycubes.cache_dir = None
+    def tearDown(self):
+        polycubes.cache_dir = self.cache_dir
+    def test_rotation_group(self):
+        group = polycubes.rotation_group()
+        self.assertEqual(len(group), 192)
+        self.assertEqual(group[0].tolist(), numpy.identity(4, dtype=int).tolist())
+        self.assertEqual(set([int(round(numpy.linalg.det(m))) for m in group]), set([1]))
+        self.assertEqual(len(polycubes.rotation_group(True)), 384)
+    def test_canonical_is_invariant(self):
+        group = polycubes.rotation_group()
+        shape = [(0, 0, 0, 0), (1, 0, 0, 0), (1, 1, 0, 0), (1, 1, 0, 1)]
+        c = polycubes.canonical(shape, group)
+        for m in group[::7]:
+            moved = (numpy.array(shape).dot(m.T)+[3, -2, 5, 1]).tolist()
+            self.assertEqual(polycubes.canonical(moved[::-1], group), c)
+        self.assertEqual(min(c), (0, 0, 0, 0))
+        self.assertEqual(list(c), sorted(c))
+    def test_counts(self):
+        self.assertEqual([len(polycubes.enumerate_shapes(n, processes=1)) for n in xrange(1, 5)], [1, 1, 2, 7])
+    def test_processes_agree(self):
+        self.assertEqual(polycubes.enumerate_shapes(5, processes=2, chunk=2), polycubes.enumerate_shapes(5, processes=1))
+    def test_reflections(self):
+        self.assertEqual(len(polycubes.enumerate_shapes(5, processes=1)), 27)
+        self.assertEqual(len(polycubes.enumerate_shapes(5, reflections=True, processes=1)), 26)
+    def test_blocks_fit(self):
+        dims = logic.difficulty2dim[0]
+        blocks = polycubes.blocks(4, dims, processes=1)
+        self.assertEqual(len(blocks), 7)
+        for b in blocks:
+            self.assertTrue(logic.p4d(0, 0, 0, 0) in b)
+        # the domain accepts them
+        logic.logic(*dims, blocks=blocks)
+        # only the straight one fits a column, turned upright
+        line = polycubes.blocks(4, (1, 4, 1, 1), processes=1)
+        self.assertEqual(len(line), 1)
+        ys = sorted([i.y for i in line[0]])
+        self.assertEqual(ys, range(ys[0], ys[0]+4))
+        self.assertTrue(0 in ys[1:3])
+        self.assertEqual(set([(i.x, i.z, i.w) for i in line[0]]), set([(0, 0, 0)]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`spectator`: the state a :py:class:`spectator.Viewer` decodes from the stream is the game's."""
+
+import time, random, socket, unittest
+import logic, key_num, spectator
+
+#: function numbers played by the tests, each followed by a fall step
+moves = [key_num.KEY_MOV_LEFT, key_num.KEY_ROT_XY_CW, key_num.KEY_MOV_RIGHT, key_num.KEY_FORCE_DROP, key_num.KEY_MOV_RIGHT_W, key_num.KEY_MOV_UP,
+         key_num.KEY_FORCE_DROP, key_num.KEY_ROT_ZW_CCW, key_num.KEY_MOV_DOWN, key_num.KEY_MOV_RIGHT, key_num.KEY_FORCE_DROP]*8
+
+class EncodingTest(unittest.TestCase):
+    def test_cells(self):
+        cells = [(0, 1, 2, 3, 4), (-1, 9, 0, 2, 5)]
+        data = "xx"+spectator.pack_cells(cells)+"yy"
+        self.assertEqual(spectator.unpack_cells(data, 2), ([cells[0], cells[1]], len(data)-2))
+        self.assertEqual(spectator.unpack_cells(spectator.pack_cells([]), 0), ([], 2))
+    def test_shorts(self):
+        self.assertEqual(spectator.unpack_shorts(spectator.pack_shorts([3, 0, 7]), 0), ([3, 0, 7], 8))
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.server = spectator.SpectatorServer(("127.0.0.1", 0))
+        self.client = socket.create_connection(self.server.address)
+        self.client.setblocking(0)
+        self.viewer = spectator.Viewer()
+        deadline = time.time()+5
+        while not self.server.channels and time.time() < deadline:
+            self.server.poll(0.01)
+        random.seed(4) # the blocks sequence
+        self.log = logic.logic(*logic.difficulty2dim[0], num_colors=6)
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+    def read(self):
+        """Give the viewer what the client received."""
+        while True:
+            try:
+                data = self.client.recv(65536)
+            except socket.error:
+                return
+            if not data:
+                return
+            self.viewer.feed(data)
+    def flush(self):
+        """Send everything queued and let the viewer read it."""
+        deadline = time.time()+5
+        while self.server.pending() and time.time() < deadline:
+            self.server.poll(0.01)
+            self.read()
+        self.read()
+    def assertSame(self):
+        self.assertEqual(self.viewer.board, self.log.board)
+        self.assertEqual(self.viewer.pose, list(spectator.block_pose(self.log)))
+        self.assertEqual(self.viewer.score, self.log.score)
+        self.assertEqual(self.viewer.tick, self.server.tick)
+    def play(self, check):
+        for a in moves:
+            if not self.log.cur_block:
+                break
+            spectator.execute(self.log, a)
+            if self.log.cur_block:
+                self.log.AdvanceFall()
+            self.server.publish(self.log)
+            if check:
+                self.flush()
+                self.assertSame()
+    def test_deltas_follow_the_game(self):
+        self.play(True)
+        self.assertTrue(self.log.layers_cleared or self.log.blocks_dropped > 5)
+        self.assertEqual(self.viewer.keyframes, 1)
+        self.assertEqual(self.viewer.skipped, 0)
+        self.assertTrue(self.viewer.deltas > 10)
+    def test_slow_client_gets_keyframe(self):
+        self.server.max_buffer = 1000
+        self.server.publish(self.log)
+        self.flush()
+        # then the client stops reading
+        self.play(False)
+        self.assertTrue(self.server.stats["drops"] > 0)
+        # once it has caught up the client gets the keyframe of the current state
+        self.flush()
+        self.server.publish(self.log)
+        self.flush()
+        self.assertSame()
+        self.assertTrue(self.viewer.keyframes >= 2)
+    def test_new_game_is_a_keyframe(self):
+        self.play(False)
+        self.flush()
+        self.log = logic.logic(*logic.difficulty2dim[1], num_colors=6)
+        self.server.publish(self.log)
+        self.flush()
+        self.assertSame()
+        self.assertEqual(self.viewer.dims, logic.difficulty2dim[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`text_cache` which need no OpenGL context."""
+
+import unittest
+import text_cache
+
+class BBoxFont:
+    """Fake FTGL font without **Advance** (as in some PyFTGL builds), 7 pixels a character, 5 of them ink; blank strings have no ink, so they're cached without textures (and GL calls)."""
+    def __init__(self):
+        self.size = 0
+        self.boxes = 0 #: number of calls to BBox
+    def FaceSize(self, size):
+        self.size = size
+    def BBox(self, s):
+        self.boxes += 1
+        if not s.strip():
+            return (0, 0, 0, 0, 0, 0)
+        return (0, -2, 0, len(s)*7-2, 10, 0)
+
+class Font(BBoxFont):
+    """Fake FTGL font with **Advance**, digits one pixel narrower."""
+    def Advance(self, s):
+        return sum([6 if i.isdigit() else 7 for i in s])
+
+class TextCacheTest(unittest.TestCase):
+    def test_width_is_cached(self):
+        font = Font()
+        cache = text_cache.TextCache(font)
+        self.assertEqual(cache.width("abc"), 19)
+        self.assertEqual(cache.width("abc"), 19)
+        self.assertEqual(font.boxes, 1)
+    def test_face_size_change_drops_cache(self):
+        font = Font()
+        cache = text_cache.TextCache(font)
+        cache.set_face_size(12)
+        cache.width("abc")
+        cache.rasterize(" ")
+        cache.set_face_size(12)
+        self.assertEqual((font.boxes, len(cache.entries)), (2, 1))
+        cache.set_face_size(14)
+        self.assertEqual((font.size, cache.entries, cache.widths), (14, {}, {}))
+        cache.width("abc")
+        self.assertEqual(font.boxes, 3)
+    def test_oldest_entries_dropped(self):
+        cache = text_cache.TextCache(Font(), max_entries=3)
+        for i in xrange(1, 6):
+            cache.rasterize(" "*i)
+        self.assertEqual(sorted(cache.entries.keys()), [(0, " "*i) for i in (3, 4, 5)])
+        self.assertEqual(cache.order, [(0, " "*i) for i in (3, 4, 5)])
+        self.assertEqual(cache.rasterized, 5)
+    def test_split(self):
+        cache = text_cache.TextCache(Font())
+        self.assertEqual(cache.split("Score: 120"), ["Score: ", "1", "2", "0"])
+        self.assertEqual(cache.split("FPS: 60 x"), ["FPS: ", "6", "0", " x"])
+        self.assertEqual(cache.split(""), [])
+    def test_compose_uses_advance(self):
+        cache = text_cache.TextCache(Font())
+        self.assertEqual(cache.compose([("ab 12", 10, 5, "c")]), [("ab ", 10, 5, "c"), ("1", 31, 5, "c"), ("2", 37, 5, "c")])
+    def test_compose_without_advance(self):
+        cache = text_cache.TextCache(BBoxFont())
+        self.assertEqual([i[1] for i in cache.compose([("ab 12", 0, 0, None)])], [0, 19, 24])
+    def test_numbers_share_pieces(self):
+        cache = text_cache.TextCache(Font())
+        pieces = set()
+        for n in xrange(2000):
+            for s in ["FPS: %d" % (n % 97), "Score: %d" % (n*13), "Layers cleared: %d" % n]:
+                pieces.update(cache.split(s))
+        self.assertEqual(len(pieces), 13)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8-*-
+"""Tests of :py:mod:`versus`: matches played with prediction and rollback over a lossy link end in the state of a lockstep replay of their inputs."""
+
+import time, argparse, unittest
+import logic, versus
+
+class RollbackTest(unittest.TestCase):
+    def settings(self, **kw):
+        """Return the arguments of a short match, see :py:func:`versus.main`."""
+        args = argparse.Namespace(difficulty=0, seed=3, ticks=300, rate=600.0, latency=30.0, jitter=20.0, loss=0.1, max_rollback=15, timeout=10.0, linger=0.2, port=7560)
+        for k, v in kw.items():
+            setattr(args, k, v)
+        return args
+    def test_snapshot_restore(self):
+        a, b = [versus.Match(logic.difficulty2dim[0], 3) for i in xrange(2)]
+        bots = [versus.Bot(1), versus.Bot(2)]
+        for t in xrange(600):
+            a.step([bots[n].actions(a.players[n]) for n in xrange(2)])
+        b.restore(a.snapshot())
+        self.assertEqual(b.checksum(), a.checksum())
+        b.step([(), ()])
+        self.assertNotEqual(b.snapshot(), a.snapshot())
+    def test_rollback_in_process(self):
+        """Two sessions in this process, driven in turns until both have all inputs."""
+        args = self.settings()
+        links = [versus.LagLink(args.port+n, args.port+1-n, args.latency/1000.0, args.jitter/1000.0, args.loss, n) for n in xrange(2)]
+        sessions = [versus.RollbackSession(versus.Match(logic.difficulty2dim[args.difficulty], args.seed), n, links[n], args.max_rollback) for n in xrange(2)]
+        bots = [versus.Bot(n) for n in xrange(2)]
+        deadline = time.time()+args.timeout
+        try:
+            while [s for s in sessions if s.confirmed() < args.ticks or s.peer_ack < args.ticks-1]:
+                self.assertTrue(time.time() < deadline, "the sessions stalled")
+                for n, s in enumerate(sessions):
+                    s.receive()
+                    if s.match.tick < args.ticks and s.can_advance():
+                        s.advance(bots[n].actions(s.match.players[n]))
+                    elif time.time()-s.last_send >= 0.005:
+                        s.send()
+                    links[n].flush()
+                time.sleep(0.001)
+        finally:
+            for i in links:
+                i.close()
+        self.assertEqual(sessions[0].inputs, sessions[1].inputs)
+        self.assertTrue(sessions[0].rollbacks+sessions[1].rollbacks > 0)
+        reference = versus.lockstep(args, sessions[0].inputs)
+        for s in sessions:
+            self.assertEqual(s.match.tick, args.ticks)
+            self.assertEqual(s.match.checksum(), reference)
+    def test_two_processes(self):
+        """The check run by ``versus.py test``."""
+        self.assertEqual(versus.test(self.settings(port=7562)), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8-*-
+"""This module contains a cache of rendered text, so strings drawn each frame are rasterized by FTGL only once."""
+
+import math, re
+from OpenGL.GL import *
+
+pieces_re = re.compile(r"\d|\D+") #: splits text into the pieces cached by :py:meth:`TextCache.compose`, see :py:meth:`TextCache.split`
+
+class TextCache:
+    """This class holds a texture for each distinct string drawn with a FTGL pixmap font, along with the string's width."""
+    def __init__(self, font, max_entries=256):
+        """*font* - FTGL font object used to rasterize text; *max_entries* - int - optional - maximum number of cached strings, when it's exceeded the oldest ones are dropped."""
+        self.font = font
+        self.max_entries = max_entries
+        self.face_size = 0
+        self.entries = {} #: cached strings, (face size, string) -> (texture, x offset, y offset, width, height)
+        self.order = [] #: keys of :py:attr:`entries` in order of creation
+        self.widths = {} #: cached string widths, (face size, string) -> width
+        self.advances = {} #: cached string advances, (face size, string) -> advance
+        self.rasterized = 0 #: number of strings rasterized so far
+    def set_face_size(self, size):
+        """Set the face size of the font to *size* (int), drop cached strings if it changed."""
+        if size != self.face_size:
+            self.font.FaceSize(size)
+            self.face_size = size
+            self.invalidate()
+    def invalidate(self):
+        """Drop all cached strings."""
+        for i in self.entries.itervalues():
+            if i[0]: glDeleteTextures([i[0]])
+        self.entries = {}
+        self.order = []
+        self.widths = {}
+        self.advances = {}
+    def width(self, s):
+        """Return width of string *s* in pixels."""
+        key = (self.face_size, s)
+        if key not in self.widths:
+            bb = self.font.BBox(s)
+            self.widths[key] = bb[3]-bb[0]
+        return self.widths[key]
+    def advance(self, s):
+        """Return the distance in pixels from the start of string *s* to the start of a string following it (the width, if the font can't tell)."""
+        key = (self.face_size, s)
+        if key not in self.advances:
+            if hasattr(self.font, "Advance"):
+                self.advances[key] = self.font.Advance(s)
+            else:
+                self.advances[key] = self.width(s)
+        return self.advances[key]
+    def split(self, s):
+        """Return the list of pieces string *s* is drawn from by :py:meth:`compose`: each digit alone and the runs of other characters whole, so a changing number (e.g. the score or the frame rate) doesn't make a new cache entry each time."""
+        return pieces_re.findall(s)
+    def compose(self, items):
+        """Return *items* (see :py:meth:`draw`) with each string replaced by its pieces (see :py:meth:`split`) placed one after another."""
+        out = []
+        for s, x, y, col in items:
+            for p in self.split(s):
+                out.append((p, x, y, col))
+                x += self.advance(p)
+        return out
+    def prepare(self, strings):
+        """Rasterize those of *strings* which aren't cached yet. This draws to the lower left corner of the color buffer, so it has to be called before the buffer is cleared for the frame."""
+        missing = [s for s in strings if (self.face_size, s) not in self.entries]
+        if not missing:
+            return
+        glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT | GL_SCISSOR_BIT | GL_CURRENT_BIT | GL_PIXEL_MODE_BIT | GL_TEXTURE_BIT)
+        glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_POLYGON_STIPPLE)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_SCISSOR_TEST)
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        for s in missing:
+            self.rasterize(s)
+        glPopClientAttrib()
+        glPopAttrib()
+    def rasterize(self, s):
+        """Render string *s* in white on black, read it back and store it as an alpha texture. Called by :py:meth:`prepare`."""
+        bb = self.font.BBox(s)
+        x0, y0 = int(math.floor(bb[0])), int(math.floor(bb[1]))
+        w, h = int(math.ceil(bb[3]))-x0, int(math.ceil(bb[4]))-y0
+        tex = None
+        if w > 0 and h > 0:
+            glScissor(0, 0, w, h)
+            glClear(GL_COLOR_BUFFER_BIT)
+            glColor4f(1.0, 1.0, 1.0, 1.0)
+            glWindowPos2f(-x0, -y0)
+            self.font.Render(s)
+            data = glReadPixels(0, 0, w, h, GL_RED, GL_UNSIGNED_BYTE)
+            tex = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, tex)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_ALPHA, w, h, 0, GL_ALPHA, GL_UNSIGNED_BYTE, data)
+        key = (self.face_size, s)
+        self.entries[key] = (tex, x0, y0, w, h)
+        self.order.append(key)
+        self.rasterized += 1
+        if len(self.order) > self.max_entries:
+            old = self.entries.pop(self.order.pop(0))
+            if old[0]: glDeleteTextures([old[0]])
+    def draw(self, items):
+        """Draw cached strings. *items* is a list of tuples *(string, x, y, color)*, where *x*, *y* is the window position of the start of the string's baseline (like for **glWindowPos**), and *color* is a tuple *(r, g, b, a)*. Strings which weren't prepared are rendered directly by the font."""
+        vp = glGetIntegerv(GL_VIEWPORT)
+        glPushAttrib(GL_ENABLE_BIT | GL_TEXTURE_BIT | GL_POLYGON_BIT | GL_CURRENT_BIT | GL_TRANSFORM_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_CULL_FACE)
+        glDisable(GL_POLYGON_STIPPLE)
+        glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+        glEnable(GL_TEXTURE_2D)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(vp[0], vp[0]+vp[2], vp[1], vp[1]+vp[3], -1.0, 1.0)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        for s, x, y, col in items:
+            glColor4f(*col)
+            e = self.entries.get((self.face_size, s))
+            if e is None:
+                glWindowPos2f(x, y)
+                self.font.Render(s)
+                continue
+            tex, x0, y0, w, h = e
+            if not tex:
+                continue
+            x, y = int(x)+x0, int(y)+y0
+            glBindTexture(GL_TEXTURE_2D, tex)
+            glBegin(GL_QUADS)
+            glTexCoord2f(0.0, 0.0)
+            glVertex2f(x, y)
+            glTexCoord2f(1.0, 0.0)
+            glVertex2f(x+w, y)
+            glTexCoord2f(1.0, 1.0)
+            glVertex2f(x+w, y+h)
+            glTexCoord2f(0.0, 1.0)
+            glVertex2f(x, y+h)
+            glEnd()
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glPopAttrib()
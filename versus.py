@@ -0,0 +1,451 @@
+# -*- coding: utf-8-*-
+"""This module plays two-player versus games: two :py:class:`logic.logic` instances side by side, in which the layers one player clears send garbage layers (see :py:meth:`logic.logic.AddGarbage`) to the other. A :py:class:`Match` is deterministic, it advances by ticks given the actions of both players, so two processes exchanging only their inputs play the same game.
+
+Inputs travel over UDP (:py:class:`LagLink`, which can add latency, jitter and loss on localhost). A :py:class:`RollbackSession` doesn't wait for them: it predicts that the remote player did nothing, and when an input arrives for a tick already simulated, it restores the snapshot of the state before that tick and simulates again up to the present, within the same frame. It stalls only if the remote player is more than :py:attr:`RollbackSession.max_rollback` ticks behind. Run as a script it plays a game between two bots (:py:class:`Bot`) in two processes, and checks that both ended in the same state as a lockstep replay of all inputs, or lets a human play with the keyboard or a joypad (bound as in the game's settings) in a window drawing the boards from the side (see :py:func:`human`, also run by ``main.py --versus``) against a bot or another human, e.g.::
+
+    python2 versus.py test --ticks 1800 --latency 60 --jitter 30 --loss 0.05
+    python2 versus.py play --player 0 --port 7460 --peer 7461 --ticks 36000 &
+    python2 versus.py human --player 1 --port 7461 --peer 7460"""
+
+import sys, time, heapq, random, select, socket, struct, zlib, argparse
+import numpy
+import logic, key_num, hint
+from spectator import execute
+
+#: garbage layers sent for the number of layers cleared at once (the last for more)
+garbage_table           =   (0, 1, 1, 2, 4)
+fall_ticks              =   30              #: ticks between steps of the fall
+tick_rate               =   60.0            #: ticks per second
+#: packet header: last tick of the receiver's inputs the sender has (-1 for none), first tick of the inputs carried, their number; then for each tick the number of actions and the actions, a byte each
+packet_head             =   struct.Struct(">iiB")
+#: colors of the blocks in the window of :py:func:`human` (the game's ones), the last one is the garbage's
+colors                  =   [(255,0,0), (0,255,0), (255,255,0), (0,0,255), (255,0,255), (0,255,255)]
+
+class Match:
+    """This class is the state of a versus game, changed only by :py:meth:`step`."""
+    def __init__(self, dims, seed):
+        """*dims* - tuple of width, height, depth, w_depth - sizes of both domains; *seed* - seed of the games, both get the same blocks sequence until garbage makes them draw differently"""
+        self.players = [logic.logic(*dims, num_colors=6, seed=seed) for i in xrange(2)] #: games of the players
+        self.tick = 0 #: number of ticks simulated
+        self.incoming = [0, 0] #: garbage layers coming to each player on the next tick
+    def step(self, inputs):
+        """Simulate a tick: add the incoming garbage, apply the actions *inputs[n]* (sequence of function numbers, see :py:mod:`key_num`) of player *n*, advance the fall every :py:data:`fall_ticks` ticks. Garbage sent in the tick is added on the next one, so the order of the players doesn't matter."""
+        sent = [0, 0]
+        for n, log in enumerate(self.players):
+            if not log.cur_block:
+                continue
+            log.AddGarbage(self.incoming[n])
+            cleared = log.layers_cleared
+            for a in inputs[n]:
+                if log.cur_block:
+                    execute(log, a)
+            if log.cur_block and (self.tick+1) % fall_ticks == 0:
+                log.AdvanceFall()
+            cleared = log.layers_cleared-cleared
+            if cleared:
+                sent[1-n] += garbage_table[min(cleared, len(garbage_table)-1)]
+        self.incoming = sent
+        self.tick += 1
+    def snapshot(self):
+        """Return the state as a tuple of immutable values, to be given to :py:meth:`restore`."""
+        return (self.tick, tuple(self.incoming), self.players[0].Snapshot(), self.players[1].Snapshot())
+    def restore(self, snap):
+        """Set the state to *snap* made by :py:meth:`snapshot`."""
+        self.tick, incoming, s0, s1 = snap
+        self.incoming = list(incoming)
+        self.players[0].Restore(s0)
+        self.players[1].Restore(s1)
+    def checksum(self):
+        """Return a CRC of the state."""
+        return zlib.crc32(repr(self.snapshot())) & 0xffffffff
+
+class LagLink:
+    """This class is a non-blocking UDP socket on localhost talking to one peer, which holds back the datagrams it sends by a latency with random jitter (so they can come out of order) and drops some."""
+    def __init__(self, port, peer, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        """*port*, *peer* - int - local port and the peer's port; *latency*, *jitter* - float - delay of datagrams and the most it varies by (sec); *loss* - float - fraction of datagrams dropped; *seed* - seed of the delays and losses"""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.setblocking(0)
+        self.peer = ("127.0.0.1", peer)
+        self.latency, self.jitter, self.loss = latency, jitter, loss
+        self.rng = random.Random(seed)
+        self.queue = [] #: heap of datagrams held back, tuples *(time due, number, data)*
+        self.count = 0 #: number of datagrams given to :py:meth:`send`
+    def send(self, data):
+        """Send the string *data* after the simulated delay."""
+        self.count += 1
+        if self.rng.random() < self.loss:
+            return
+        due = time.time()+max(0.0, self.latency+self.rng.uniform(-self.jitter, self.jitter))
+        heapq.heappush(self.queue, (due, self.count, data))
+        self.flush()
+    def flush(self):
+        """Send the datagrams which are due."""
+        now = time.time()
+        while self.queue and self.queue[0][0] <= now:
+            data = heapq.heappop(self.queue)[2]
+            try:
+                self.sock.sendto(data, self.peer)
+            except socket.error:
+                pass # the peer isn't there (yet), it's like a loss
+    def receive(self):
+        """Return the list of datagrams received."""
+        out = []
+        while True:
+            try:
+                out.append(self.sock.recv(65536))
+            except socket.error:
+                return out
+    def wait(self, timeout):
+        """Wait until a datagram comes, one held back is due, or *timeout* (sec) passes."""
+        if self.queue:
+            timeout = min(timeout, self.queue[0][0]-time.time())
+        if timeout > 0:
+            select.select([self.sock], [], [], timeout)
+        self.flush()
+    def close(self):
+        self.sock.close()
+
+class RollbackSession:
+    """This class runs a :py:class:`Match` for the local player, exchanging inputs with the remote one through a :py:class:`LagLink`, with prediction and rollback. Each packet carries all local inputs the remote player hasn't acknowledged, so lost and reordered packets are harmless."""
+    prediction = () #: predicted actions of the remote player for a tick
+    def __init__(self, match, local, link, max_rollback=15):
+        """*match* - :py:class:`Match` at its start; *local* - int - index of the local player; *link* - :py:class:`LagLink` to the remote player; *max_rollback* - int - most ticks simulated ahead of the remote inputs"""
+        self.match = match
+        self.local = local
+        self.link = link
+        self.max_rollback = max_rollback
+        self.inputs = [[], []] #: actions of each player for each tick, the remote ones as far as they're all known
+        self.early = {} #: remote actions received beyond a missing tick, by tick
+        self.snaps = {} #: snapshots of the state before each tick not yet confirmed by the remote inputs, by tick
+        self.peer_ack = -1 #: last tick of the local inputs the remote player has
+        self.last_send = 0.0
+        self.rollbacks = 0 #: number of rollbacks
+        self.resimulated = 0 #: number of ticks simulated again
+        self.deepest = 0 #: most ticks simulated again in a rollback
+        self.stalls = 0 #: number of times :py:meth:`can_advance` returned False
+    def confirmed(self):
+        """Return the number of ticks of which both players' inputs are known."""
+        return min(len(self.inputs[0]), len(self.inputs[1]))
+    def can_advance(self):
+        """Return True if a tick can be simulated without going too far ahead of the remote player."""
+        if self.match.tick-len(self.inputs[1-self.local]) < self.max_rollback:
+            return True
+        self.stalls += 1
+        return False
+    def remote_actions(self, tick):
+        """Return the remote actions of *tick*, predicted if they aren't known."""
+        remote = self.inputs[1-self.local]
+        if tick < len(remote):
+            return remote[tick]
+        return self.early.get(tick, self.prediction)
+    def simulate(self):
+        """Simulate the next tick with the inputs known or predicted."""
+        tick = self.match.tick
+        inputs = [None, None]
+        inputs[self.local] = self.inputs[self.local][tick]
+        inputs[1-self.local] = self.remote_actions(tick)
+        self.match.step(inputs)
+    def advance(self, actions):
+        """Simulate the next tick with the local *actions* (sequence of function numbers, see :py:mod:`key_num`) and send them."""
+        self.inputs[self.local].append(tuple(actions))
+        if self.match.tick >= len(self.inputs[1-self.local]):
+            self.snaps[self.match.tick] = self.match.snapshot()
+        self.simulate()
+        self.send()
+    def send(self):
+        """Send the local inputs the remote player hasn't acknowledged (the last 255 at most) with the acknowledgement of the remote ones."""
+        local = self.inputs[self.local]
+        first = min(max(self.peer_ack+1, len(local)-255), len(local)) # a stale peer may acknowledge more
+        data = [packet_head.pack(len(self.inputs[1-self.local])-1, first, len(local)-first)]
+        for a in local[first:]:
+            data.append(chr(len(a))+"".join(map(chr, a)))
+        self.link.send("".join(data))
+        self.last_send = time.time()
+    def receive(self):
+        """Take the remote inputs received, roll back and simulate again from the earliest tick predicted wrong, if any. Returns True if anything was received."""
+        packets = self.link.receive()
+        remote = self.inputs[1-self.local]
+        wrong = None
+        for data in packets:
+            try:
+                ack, first, num = packet_head.unpack_from(data)
+            except struct.error:
+                continue
+            self.peer_ack = max(self.peer_ack, ack)
+            pos = packet_head.size
+            for tick in xrange(first, first+num):
+                n = ord(data[pos])
+                a = tuple(map(ord, data[pos+1:pos+1+n]))
+                pos += n+1
+                if tick < len(remote) or tick in self.early:
+                    continue
+                self.early[tick] = a
+                if tick < self.match.tick and a != self.prediction and (wrong is None or tick < wrong):
+                    wrong = tick
+        if wrong is not None:
+            self.rollback(wrong)
+        while len(remote) in self.early:
+            self.snaps.pop(len(remote), None)
+            remote.append(self.early.pop(len(remote)))
+        return bool(packets)
+    def rollback(self, tick):
+        """Restore the state before *tick* and simulate again up to the present."""
+        end = self.match.tick
+        self.match.restore(self.snaps[tick])
+        while self.match.tick < end:
+            if self.match.tick > tick:
+                self.snaps[self.match.tick] = self.match.snapshot()
+            self.simulate()
+        self.rollbacks += 1
+        self.resimulated += end-tick
+        self.deepest = max(self.deepest, end-tick)
+    def report(self):
+        """Return a line with statistics of the session."""
+        return "rollbacks %d, ticks simulated again %d (at most %d at once), stalls %d" % (self.rollbacks, self.resimulated, self.deepest, self.stalls)
+
+def rotation_paths(cells):
+    """Return a dict giving for each orientation of the block *cells* (list of (x, y, z, w) tuples), as a key made by :py:func:`orientation_key`, the rotation (function number, see :py:mod:`key_num`) taking it closest to the orientation of *cells*, -1 for that one."""
+    mats = [numpy.array(m.dat, dtype=numpy.int64) for m in logic.rot_mat]
+    start = numpy.array(cells, dtype=numpy.int64)
+    out = {orientation_key(start): -1}
+    frontier = [start]
+    while frontier:
+        nxt = []
+        for c in frontier:
+            for i, m in enumerate(mats):
+                # rotation i^1 is the inverse of i (the other direction in the same plane)
+                t = c.dot(mats[i^1].T)
+                key = orientation_key(t)
+                if key not in out:
+                    out[key] = key_num.KEY_ROT_XY_CW+i
+                    nxt.append(t)
+        frontier = nxt
+    return out
+
+def orientation_key(cells):
+    """Return the orientation of *cells* (array of shape (n, 4)) as a tuple, independent of the position."""
+    t = cells-cells.min(axis=0)
+    return tuple(sorted(map(tuple, t.tolist())))
+
+class Bot:
+    """This class is a player driven by :py:func:`hint.best_placement`: it turns the block to the orientation of the best landing pose, moves it above it and drops it, one action every few ticks, with some random mistakes."""
+    def __init__(self, seed, period=4, error=0.05, patience=40):
+        """*seed* - seed of the timing and mistakes; *period* - int - mean ticks between actions; *error* - float - fraction of random actions; *patience* - int - actions taken for a block before dropping it anyway"""
+        self.rng = random.Random(seed)
+        self.period, self.error, self.patience = period, error, patience
+        self.key = None
+        self.wait = 0
+    def actions(self, log):
+        """Return the actions (tuple of function numbers) for the next tick of the game *log*."""
+        if not log.cur_block:
+            return ()
+        self.wait -= 1
+        if self.wait > 0:
+            return ()
+        self.wait = self.rng.randint(1, 2*self.period-1)
+        cells = [(i.x, i.y, i.z, i.w) for i in log.cur_block]
+        key = (log.blocks_dropped, log.board_version)
+        if key != self.key:
+            self.key = key
+            self.target = hint.best_placement(log.BoardView(), cells)
+            self.paths = rotation_paths(self.target) if self.target else {}
+            self.left = self.patience
+        self.left -= 1
+        if self.rng.random() < self.error:
+            return (self.rng.randint(key_num.KEY_MOV_UP, key_num.KEY_ROT_ZW_CCW),)
+        rot = self.paths.get(orientation_key(numpy.array(cells)))
+        if rot is None or self.left <= 0:
+            return (key_num.KEY_FORCE_DROP,)
+        if rot >= 0:
+            return (rot,)
+        low, target = numpy.min(cells, axis=0), numpy.min(self.target, axis=0)
+        for axis, neg, pos in ((0, key_num.KEY_MOV_LEFT, key_num.KEY_MOV_RIGHT), (2, key_num.KEY_MOV_UP, key_num.KEY_MOV_DOWN), (3, key_num.KEY_MOV_LEFT_W, key_num.KEY_MOV_RIGHT_W)):
+            if target[axis] != low[axis]:
+                return (pos if target[axis] > low[axis] else neg,)
+        return (key_num.KEY_FORCE_DROP,)
+
+def play(args, results=None):
+    """Play *args.ticks* ticks of a match as player *args.player* with a :py:class:`Bot`, then go on exchanging inputs until both players have all of them. Prints (or puts to the queue *results*, if given) the checksum of the final state, the inputs of both players and statistics."""
+    match = Match(logic.difficulty2dim[args.difficulty], args.seed)
+    link = LagLink(args.port, args.peer, args.latency/1000.0, args.jitter/1000.0, args.loss, args.seed*2+args.player)
+    session = RollbackSession(match, args.player, link, args.max_rollback)
+    bot = Bot(args.seed*2+args.player)
+    dt = 1.0/args.rate
+    # say hello until the peer answers
+    t = time.time()
+    while not session.receive():
+        if time.time()-t > args.timeout:
+            print "Player %d: no peer." % args.player
+            return 1
+        if time.time()-session.last_send >= 0.05:
+            session.send()
+        link.wait(0.01)
+    next_tick = time.time()
+    done = None
+    while True:
+        session.receive()
+        now = time.time()
+        if match.tick < args.ticks and now >= next_tick:
+            if session.can_advance():
+                session.advance(bot.actions(match.players[args.player]))
+            next_tick = max(next_tick+dt, now-dt)
+        elif now-session.last_send >= dt:
+            session.send()
+        if done is None and session.confirmed() >= args.ticks and session.peer_ack >= args.ticks-1:
+            done = now
+        if done is not None and now-done > args.linger:
+            break
+        if now-next_tick > args.timeout:
+            print "Player %d: the peer is gone." % args.player
+            return 1
+        link.wait(next_tick-time.time() if match.tick < args.ticks else dt)
+    link.close()
+    out = (args.player, match.checksum(), session.inputs, session.report(), [(i.score, i.layers_cleared, bool(i.cur_block)) for i in match.players])
+    if results is not None:
+        results.put(out)
+    else:
+        print "Player %d: %s" % (args.player, session.report())
+        print "Player %d: final tick %d, checksum %08x" % (args.player, match.tick, out[1])
+    return 0
+
+def draw_game(surf, log, rect, cell, title):
+    """Draw the game *log* into the rectangle *rect* of the surface *surf* with cells of *cell* pixels: for each w coordinate, the space seen along z and along x (the nearest cells cover the farther ones), with the current block outlined, and *title* with the score above."""
+    import pygame
+    font = pygame.font.Font(None, max(cell, 16))
+    surf.blit(font.render("%s: %d (%d layers)" % (title, log.score, log.layers_cleared), True, (255,255,255)), rect.topleft)
+    top = rect.top+font.get_linesize()
+    board = log.BoardView()
+    cur = [(i.x, i.y, i.z, i.w) for i in log.cur_block]
+    x0 = rect.left
+    for w in xrange(log.wd):
+        for across, size in ((0, log.w), (1, log.d)):
+            pygame.draw.rect(surf, (80,80,80), (x0-1, top-1, size*cell+2, log.h*cell+2), 1)
+            for y in xrange(log.h):
+                row = board[y, w] if across else board[y, w].T # indexed [z, x] seen along x, [x, z] along z
+                for i in xrange(size):
+                    line = row[i]
+                    filled = numpy.flatnonzero(line)
+                    if len(filled):
+                        pygame.draw.rect(surf, colors[(line[filled[0]]-1) % len(colors)], (x0+i*cell, top+(log.h-1-y)*cell, cell-1, cell-1))
+            for c in cur:
+                if c[3] == w:
+                    pygame.draw.rect(surf, colors[log.cur_col % len(colors)], (x0+c[2 if across else 0]*cell, top+(log.h-1-c[1])*cell, cell-1, cell-1), 2)
+            x0 += (size+1)*cell
+        x0 += cell
+
+def human(args):
+    """Play a match as player *args.player* with the keyboard or joypads, bound and auto-repeated as in the game (see :py:mod:`settings`), in a window showing both games, until the window is closed or the **menu** function is pressed. The peer is another :py:func:`human` or a :py:func:`play` bot."""
+    import pygame, settings, input_dev
+    conf = settings.Settings()
+    if not conf.load():
+        print "Couldn't load settings, using defaults instead."
+    match = Match(logic.difficulty2dim[args.difficulty], args.seed)
+    link = LagLink(args.port, args.peer, args.latency/1000.0, args.jitter/1000.0, args.loss, args.seed*2+args.player)
+    session = RollbackSession(match, args.player, link, args.max_rollback)
+    pygame.init()
+    bindings = conf.get("key_bindings")
+    bindings.input_state.reset()
+    bindings.input_state.setup_joys()
+    repeat = input_dev.RepeatScheduler(conf.get("repeat_delay"), conf.get("repeat_interval"), norepeat=[key_num.KEY_MENU])
+    log = match.players[0]
+    cell = 12
+    surf = pygame.display.set_mode(((2*log.wd*(log.w+log.d+3)+2)*cell, (log.h+6)*cell))
+    pygame.display.set_caption("4DeBlock versus - player %d" % args.player)
+    dt = 1.0/args.rate
+    pressed = [] # functions pressed since the last tick, executed on the next one
+    next_tick = time.time()
+    drawn = None
+    running = True
+    while running:
+        for ev in pygame.event.get():
+            if ev.type == pygame.QUIT:
+                running = False
+            elif bindings.input_state.process_event(ev):
+                pressed += repeat.update(bindings.get_triggered())
+        if key_num.KEY_MENU in pressed:
+            break
+        session.receive()
+        now = time.time()
+        if now >= next_tick:
+            if session.can_advance():
+                session.advance(pressed+repeat.due())
+                pressed = []
+            next_tick = max(next_tick+dt, now-dt)
+        elif now-session.last_send >= dt:
+            session.send()
+        state = (match.tick, session.rollbacks)
+        if state != drawn:
+            drawn = state
+            surf.fill((0,0,0))
+            half = surf.get_width()/2
+            for n in xrange(2):
+                draw_game(surf, match.players[n], pygame.Rect(n*half+cell, cell, half-cell, surf.get_height()-cell), cell, "You" if n == args.player else "Peer")
+            over = [not i.cur_block for i in match.players]
+            if any(over):
+                text = "Draw" if all(over) else ("You lose" if over[args.player] else "You win")
+                surf.blit(pygame.font.Font(None, 3*cell).render(text, True, (255,255,255)), (cell, surf.get_height()-3*cell))
+            pygame.display.flip()
+        link.wait(max(0.0, min(next_tick-time.time(), 0.005)))
+    link.close()
+    bindings.input_state.uninit_joys()
+    pygame.quit()
+    print "Player %d: %s" % (args.player, session.report())
+    return 0
+
+def lockstep(args, inputs):
+    """Return the checksum of a match replayed with the inputs *inputs[n]* (list of tuples of actions for each tick) of player *n*, without prediction."""
+    match = Match(logic.difficulty2dim[args.difficulty], args.seed)
+    for tick in xrange(args.ticks):
+        match.step([inputs[0][tick], inputs[1][tick]])
+    return match.checksum()
+
+def test(args):
+    """Play a match between two processes on localhost and check that both ended in the state of a lockstep replay of their inputs."""
+    import copy, multiprocessing
+    results = multiprocessing.Queue()
+    procs = []
+    for n in xrange(2):
+        a = copy.copy(args)
+        a.player, a.port, a.peer = n, args.port+n, args.port+1-n
+        procs.append(multiprocessing.Process(target=play, args=(a, results)))
+        procs[-1].start()
+    out = sorted([results.get(timeout=args.ticks/args.rate*4+args.timeout*2) for i in procs])
+    for p in procs:
+        p.join()
+    inputs = [out[0][2][0], out[1][2][1]]
+    reference = lockstep(args, inputs)
+    ok = True
+    for player, checksum, got, report, games in out:
+        print "Player %d: %s" % (player, report)
+        print "Player %d: checksum %08x, scores %s" % (player, checksum, ", ".join(["%d (%d layers%s)" % (s, l, "" if alive else ", over") for s, l, alive in games]))
+        ok = ok and checksum == reference and got == inputs
+    print "Lockstep replay: checksum %08x, %d actions - %s" % (reference, sum([len(a) for i in inputs for a in i]), "same" if ok else "DIFFERENT")
+    return 0 if ok else 1
+
+def main(argv):
+    """Command line entry point, *argv* is the list of arguments (without the program name)."""
+    p = argparse.ArgumentParser(description="Play 4D Blocks versus games over UDP.")
+    p.add_argument("mode", choices=("play", "test", "human"))
+    p.add_argument("--player", type=int, default=0, choices=(0, 1), help="index of the local player (play, human)")
+    p.add_argument("--port", type=int, default=7460, help="local port (play, human), first of two ports (test)")
+    p.add_argument("--peer", type=int, default=7461, help="port of the other player (play, human)")
+    p.add_argument("--difficulty", type=int, default=0, help="difficulty level")
+    p.add_argument("--seed", type=int, default=0, help="random seed of the games and the bots")
+    p.add_argument("--ticks", type=int, default=1800, help="length of the match (play, test)")
+    p.add_argument("--rate", type=float, default=tick_rate, help="ticks per second")
+    p.add_argument("--latency", type=float, default=0.0, help="simulated one-way latency (msec)")
+    p.add_argument("--jitter", type=float, default=0.0, help="simulated jitter of the latency (msec)")
+    p.add_argument("--loss", type=float, default=0.0, help="fraction of packets lost")
+    p.add_argument("--max-rollback", type=int, default=15, help="most ticks simulated ahead of the peer's inputs")
+    p.add_argument("--timeout", type=float, default=10.0, help="time to wait for the peer (sec)")
+    p.add_argument("--linger", type=float, default=0.5, help="time to keep answering the peer at the end (sec)")
+    args = p.parse_args(argv)
+    if args.mode == "test":
+        return test(args)
+    if args.mode == "human":
+        return human(args)
+    return play(args)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))